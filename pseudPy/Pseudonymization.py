@@ -1,11 +1,17 @@
 import base64
+import copy
+import functools
 import hashlib
+from contextlib import contextmanager
 from typing import List
 import math
 import random
 import sys
 import uuid
 import polars as pl
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet as pq
 import os
 import re
 import pandas as pd
@@ -13,10 +19,27 @@ import polars.exceptions
 import spacy
 from cryptography.hazmat.primitives.padding import PKCS7
 from spacy.matcher import Matcher
+from spacy.util import filter_spans
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESSIV
 from cryptography.hazmat.backends import default_backend
 from faker import Faker
 
+# the output sinks, execution strategies, ciphers and term matching live in their own modules;
+# their classes are re-exported here so that Pseudonymization.<class> keeps working
+if __package__:
+    from .stats import PipelineStats
+    from .sinks import OutputSink, LocalSink, MemorySink, ArchiveSink, StdoutSink, KeepOpen, OutputWriter
+    from .matching import EntityCache, TermMatcher
+    from .crypto import FF3Cipher, MappingContainer, Keyring
+    from .execution import CounterAllocator, Pipeline, ShardRunner, BatchRunner, MicroBatcher, AsyncPseudonymization
+else:
+    from stats import PipelineStats
+    from sinks import OutputSink, LocalSink, MemorySink, ArchiveSink, StdoutSink, KeepOpen, OutputWriter
+    from matching import EntityCache, TermMatcher
+    from crypto import FF3Cipher, MappingContainer, Keyring
+    from execution import CounterAllocator, Pipeline, ShardRunner, BatchRunner, MicroBatcher, AsyncPseudonymization
+
 
 class Pseudonymization:
     """Main class for data pseudonymization.
@@ -25,7 +48,7 @@ class Pseudonymization:
     ----------
     map_method : str
         Pseudonymization method. Select one of the following: *'counter', 'random1', 'random4', 'hash', 'hash-salt',
-        'merkle-tree', 'encrypt', 'decrypt', 'faker'*.
+        'merkle-tree', 'encrypt', 'aes-siv', 'fpe', 'decrypt', 'faker'*.
 
         Or specify the faker method: *'faker-name', 'faker-loc','faker-email', 'faker-phone', 'faker-org'*.
     map_columns : str or list
@@ -38,8 +61,9 @@ class Pseudonymization:
         Input CSV, read as Polars DataFrame. Use if data is structured and the input_file is not specified.
     mapping : bool
         Enable or disable mapping output. Required for reversibility of pseudonyms.
-    encrypt_map : bool
+    encrypt_map : bool or str
         Enable or disable encryption of the mapping table. Output includes additionally secret key file for decryption.
+        *True* encrypts with AES-ECB, *'aes-siv'* with the deterministic authenticated AES-SIV.
     text : str
         Input text. Use if data is unstructured and the input_file is not specified.
     all_ne : bool
@@ -50,14 +74,62 @@ class Pseudonymization:
     pos_type : str or list
         Type(s) of entities in data to be pseudonymized such as 'Names', 'Locations',
         'Organizations', 'Emails', and 'Phone-Numbers'. Use if data is unstructured.
-    patterns : str or spaCy Matcher
-        If data is structured, use *"column,operation,value"*,
+    patterns : list, dict or spaCy Matcher
+        If data is structured, use a condition *[column, operation, value]* or combine conditions with 'and', 'or'
+        and 'not', e.g. *{'and': [['salary', '>', 100000], {'or': [['country', 'in', ['China', 'Peru']],
+        ['name', 'starts_with', 'M']]}]}*. See Helpers.filter_expression for all operations.
 
         else *patterns = [[{"LOWER": "abc"}, {"LOWER": "corporation"}]...]*.
+    terms : str or list
+        Custom terms of free text to be pseudonymized as 'Others', e.g. customer or product names: path to a file with
+        one term per line or a list of terms. The terms are compiled once into a spaCy PhraseMatcher, which is reused
+        for the following documents. Scales to hundreds of thousands of terms.
+    entity_cache : EntityCache
+        Cache of the entities of free text, spaCy runs only on paragraphs, which are not in the cache. Optional.
+    stats : PipelineStats
+        Collector for per-stage wall time, row counts and bytes written. Optional.
+    chunk_size : int
+        Number of rows read and pseudonymized at once. Use for large input files, requires input_file and output.
+    progress : callable
+        Function called as *progress(done, total)* after every chunk of rows or every entity type. Optional.
+    cancel : threading.Event
+        Stop the job between two chunks, if the event is set. Raises JobCancelled. Optional.
+    keyring : str
+        Path to a keyring file, which holds the versioned secret keys of all columns instead of one key file per
+        column. Optional.
+    mapping_format : str
+        Format of the mapping files: *'csv'* or *'arrow'*, an encrypted container of zstd compressed Arrow IPC
+        batches *mapping_output_<column>.arrow*. Read it with *read_mapping*.
+    workers : int
+        Number of threads, which pseudonymize the chunks in parallel. A reader thread and a writer thread overlap
+        reading and writing with the pseudonymization, the output keeps the order of the input. Requires chunk_size.
+        Optional, the chunks are processed one after the other by default.
+    compression : str
+        Compression of the output files: *'gzip'*, *'zstd'* or *'parquet'*. The files are compressed and written by a
+        background thread while the next chunk is pseudonymized. Optional, the output is plain CSV by default.
+        Compressed input files (*.csv.gz*, *.csv.zst*, *.parquet*) are read transparently.
+    sink : OutputSink or str
+        Destination of the output and mapping files: an OutputSink, *'memory'*, *'stdout'*, the path of a zip or tar
+        archive or of a folder. Every file is written once through a buffered writer and committed at the end of the
+        job. Optional, the files are written to the output folder by default. The secret keys stay in the output
+        folder or the working directory.
+    counter_mode : str
+        Numbering of the counter method in the chunked processing: *'serial'* numbers like the processing without
+        chunks, every column gets a block of the mapped rows of the job. *'fast'* gives every column a block of all
+        rows of the file and does not evaluate the patterns before the chunks are read, the numbering may then have
+        gaps. Default: *'serial'*.
+    processes : int
+        Number of worker processes, which pseudonymize the byte ranges of a large csv input file, see ShardRunner.
+        The output and mapping files keep the order of the input. Requires input_file and output or sink. Optional.
     """
 
     def __init__(self, map_method='counter', map_columns=None, input_file=None, output=None, df=None, mapping=True,
-                 encrypt_map=False, text=None, all_ne=False, seed=None, pos_type=None, patterns=None):
+                 encrypt_map=False, text=None, all_ne=False, seed=None, pos_type=None, patterns=None, stats=None,
+                 chunk_size=None, progress=None, cancel=None, keyring=None, mapping_format='csv',
+                 compression=None, workers=None, terms=None, entity_cache=None, sink=None, counter_mode='serial',
+                 processes=None):
+        if counter_mode not in CounterAllocator.modes:
+            raise ValueError(f"Invalid counter mode, use one of {', '.join(CounterAllocator.modes)}")
         self.map_columns = map_columns
         self.map_method = map_method
         self.input_file = input_file
@@ -70,11 +142,33 @@ class Pseudonymization:
         self.seed = seed
         self.pos_type = pos_type
         self.patterns = patterns
-
-    def pseudonym(self):
-        # TOD
+        self.stats = stats
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.cancel = cancel
+        self.keyring = keyring
+        self.mapping_format = mapping_format
+        self.compression = compression
+        self.workers = workers
+        self.terms = terms
+        self.entity_cache = entity_cache
+        self.sink = OutputSink.load(sink) if sink is not None else None
+        self.writer = None
+        self.job_sink = None
+        self.counter_mode = counter_mode
+        self.processes = processes
+
+    def pseudonym(self, df=None, input_file=None):
         """
-        Main function for pseudonymization of csv data.
+        Main function for pseudonymization of csv data. Every call works on its own copy of the configuration, see
+        job, so one instance can be shared by threads.
+
+        Parameters
+        ----------
+        df : Polars DataFrame
+            Input of this call instead of the input of the instance. Optional.
+        input_file : str
+            Input file of this call instead of the input of the instance. Optional.
 
         Returns
         -------
@@ -96,60 +190,374 @@ class Pseudonymization:
             >>>
             >>> pseudo.pseudonym()
         """
-        # read data as Polars DataFrame
-        if self.input_file is not None:
-            self.df = pl.DataFrame()
-            self.df = pl.read_csv(self.input_file)
-        # remove columns and rows with all null values
-        self.df = self.df.filter(~pl.all_horizontal(pl.all().is_null()))
-        self.df = self.df[[s.name for s in self.df if not (s.null_count() == self.df.height)]]
-        if self.df.select(pl.len()).item() == 0:
-            print("Error: the number of rows must be at least 1.")
-            sys.exit()
+        return self.job(df=df, input_file=input_file).run_pseudonym()
+
+    def job(self, df=None, text=None, input_file=None):
+        """Return a copy of the instance for a single call. The given input replaces the input of the instance. The
+        data, the writer and the sink of the call are set on the copy only, the configuration of the instance is never
+        changed."""
+        job = copy.copy(self)
+        if df is not None or text is not None or input_file is not None:
+            job.df, job.text, job.input_file = df, text, input_file
+        job.map_columns = list(self.map_columns) if isinstance(self.map_columns, list) else self.map_columns
+        job.pos_type = list(self.pos_type) if isinstance(self.pos_type, list) else self.pos_type
+        job.writer = None
+        job.job_sink = None
+        return job
+
+    def run_pseudonym(self):
+        """Pseudonymize the structured input of the job, see pseudonym."""
         if isinstance(self.map_columns, str):
             self.map_columns = [self.map_columns]
-        # initialize helper functions
-        helpers = Helpers(df=self.df, output=self.output, map_columns=self.map_columns, map_method=self.map_method,
-                          mapping=self.mapping, encrypt_map=self.encrypt_map, seed=self.seed, patterns=self.patterns)
-        if self.map_method in map_method_handlers and self.map_method != 'decrypt':
-            if self.output is not None:
-                helpers.handle_map_tiers(output_files=True)
+        # process large files chunk by chunk
+        with self.writing():
+            if self.processes and self.input_file is not None and self.map_method != 'decrypt':
+                return self.pseudonym_sharded()
+            if self.chunk_size is not None and self.input_file is not None and self.map_method != 'decrypt':
+                return self.pseudonym_chunked()
+            # read data as Polars DataFrame. The decrypt method outputs only the filtered rows, so the filter is pushed
+            # into the scan of the input file. The other methods keep the rows that do not match unchanged.
+            condition = None
+            if self.patterns is not None and self.map_method == 'decrypt':
+                condition = Helpers.filter_expression(self.patterns)
+            if self.input_file is not None:
+                with PipelineStats.track(self.stats, 'read_csv') as record:
+                    self.df = pl.DataFrame()
+                    lazy_df = self.scan_input()
+                    if condition is not None:
+                        lazy_df = lazy_df.filter(condition)
+                    self.df = lazy_df.collect()
+                    record['rows'] = self.df.height
+            elif condition is not None:
+                with PipelineStats.track(self.stats, 'filter_patterns') as record:
+                    self.df = self.df.filter(condition)
+                    record['rows'] = self.df.height
+            # remove columns and rows with all null values
+            with PipelineStats.track(self.stats, 'filter_nulls') as record:
+                self.df = self.df.filter(~pl.all_horizontal(pl.all().is_null()))
+                self.df = self.df[[s.name for s in self.df if not (s.null_count() == self.df.height)]]
+                record['rows'] = self.df.height
+            if self.df.select(pl.len()).item() == 0:
+                print("Error: the number of rows must be at least 1.")
+                sys.exit()
+            # initialize helper functions
+            helpers = Helpers(df=self.df, output=self.output, map_columns=self.map_columns, map_method=self.map_method,
+                              mapping=self.mapping, encrypt_map=self.encrypt_map, seed=self.seed, stats=self.stats,
+                              patterns=self.patterns if condition is None else None, keyring=self.keyring,
+                              mapping_format=self.mapping_format, writer=self.writer, sink=self.job_sink)
+            if self.map_method in map_method_handlers and self.map_method != 'decrypt':
+                if self.has_output():
+                    helpers.handle_map_tiers(output_files=True)
+                    self.report_progress(self.df.height, self.df.height)
+                else:
+                    output = helpers.handle_map_tiers(output_files=False)
+                    self.report_progress(self.df.height, self.df.height)
+                    return output
+            elif self.map_method == 'decrypt':
+                # all columns are decrypted in place and written once, decrypted_output_<column>.csv for one column
+                decrypted = []
+                for column in self.map_columns:
+                    mapping_instance = Mapping(df=self.df, first_tier=column, output=self.output, stats=self.stats,
+                                               keyring=self.keyring)
+                    with PipelineStats.track(self.stats, 'decrypt', column=column, rows=self.df.height):
+                        decrypted.append(map_method_handlers[self.map_method](mapping_instance).alias(column))
+                self.df = self.df.with_columns(decrypted)
+                if not self.has_output():
+                    return self.df
+                name = f'_{self.map_columns[0]}' if len(self.map_columns) == 1 else ''
+                helpers.write_csv(self.df, f"decrypted_output{name}.csv")
+
+    def pseudonym_chunked(self):
+        """Pseudonymize the input file in chunks of *chunk_size* rows. Output and mapping files are appended chunk by
+        chunk, the counter continues over all chunks and the secret keys are generated once. Every column gets a block
+        of counter values of the size of the job, so the numbering does not depend on the chunk size.
+
+        Returns
+        -------
+        Pseudonymized Dataframe, if no output parameter is passed. Otherwise, writes pseudonymized and mapping files.
+        """
+        total, columns = self.scan_columns()
+        if total == 0 or not columns:
+            print("Error: the number of rows must be at least 1.")
+            sys.exit()
+
+        counter_stride = self.counter_stride(columns, total) if self.map_method == 'counter' else None
+        if self.workers:
+            outputs = Pipeline(self, columns, total, self.workers, counter_stride).run()
+        else:
+            outputs = self.pseudonym_serial(columns, total, counter_stride)
+        if not self.has_output():
+            if not self.mapping:
+                return pl.concat(outputs)
+            return [pl.concat([output[0] for output in outputs]),
+                    [pl.concat([output[1][i] for output in outputs]) for i in range(len(self.map_columns))]]
+
+    def scan_columns(self):
+        """Return the number of rows of the input file and the columns with at least one value, without loading the
+        file."""
+        with PipelineStats.track(self.stats, 'scan_csv') as record:
+            if self.input_file.endswith('.csv'):
+                total = pl.scan_csv(self.input_file).select(pl.len()).collect().item()
+                null_counts = pl.scan_csv(self.input_file).select(pl.all().null_count()).collect()
             else:
-                return helpers.handle_map_tiers(output_files=False)
-        elif self.map_method == 'decrypt':
-            if self.patterns is not None:
-                column, op, value = (self.patterns[0], self.patterns[1].strip(), self.patterns[2])
-                if op == '>':
-                    condition = pl.col(column) > value
-                    filtered_df = self.df.filter(~condition)
-                elif op == '<':
-                    condition = pl.col(column) < value
-                    filtered_df = self.df.filter(~condition)
-                elif op == '==':
-                    condition = pl.col(column) == value
-                    filtered_df = self.df.filter(~condition)
-                elif op == '!=':
-                    condition = pl.col(column) != value
-                    filtered_df = self.df.filter(~condition)
+                # compressed files cannot be scanned lazily, so the counts are summed over the batches
+                total = 0
+                null_counts = None
+                for batch in self.read_batches():
+                    total = total + batch.height
+                    counts = batch.select(pl.all().null_count())
+                    null_counts = counts if null_counts is None else null_counts + counts
+            columns = [col for col in null_counts.columns if null_counts[col][0] != total] if total else []
+            record['rows'] = total
+        return total, columns
+
+    def pseudonym_sharded(self):
+        """Pseudonymize the input file on *processes* worker processes, see ShardRunner. Writes the output and
+        mapping files in the order of the input."""
+        total, columns = self.scan_columns()
+        if total == 0 or not columns:
+            print("Error: the number of rows must be at least 1.")
+            sys.exit()
+        ShardRunner(self, self.processes).run(columns, total)
+        self.report_progress(total, total)
+
+    def counter_stride(self, columns, total):
+        """Return the size of the block of counter values of every column: the mapped rows of the job, like in the
+        processing without chunks, or all rows in the fast counter mode, which does not evaluate the patterns."""
+        if self.counter_mode == 'fast':
+            return total
+        condition = Helpers.filter_expression(self.patterns) if self.patterns is not None else pl.lit(True)
+
+        def count(df):
+            return df.select(columns).filter(~pl.all_horizontal(pl.all().is_null())).filter(condition).select(pl.len())
+
+        with PipelineStats.track(self.stats, 'count_rows') as record:
+            if self.input_file.endswith(('.csv', '.parquet')):
+                rows = count(self.scan_input()).collect().item()
+            else:
+                # compressed files cannot be scanned lazily, so the counts are summed over the batches
+                rows = sum(count(batch).item() for batch in self.read_batches())
+            record['rows'] = rows
+        return rows
+
+    def chunk_helpers(self, df=None, count_start=0, append=False, counter_stride=None):
+        """Return the Helpers for the chunks of the input file."""
+        return Helpers(df=df, output=self.output, map_columns=self.map_columns, map_method=self.map_method,
+                       mapping=self.mapping, encrypt_map=self.encrypt_map, seed=self.seed, patterns=self.patterns,
+                       stats=self.stats, count_start=count_start, append=append, keyring=self.keyring,
+                       mapping_format=self.mapping_format, writer=self.writer, sink=self.job_sink,
+                       counter_stride=counter_stride)
+
+    def pseudonym_serial(self, columns, total, counter_stride=None):
+        """Read, pseudonymize and write the chunks one after the other. Return the outputs of the chunks, if no
+        output parameter is passed."""
+        helpers = self.chunk_helpers(counter_stride=counter_stride)
+        reader = self.read_batches()
+        outputs = []
+        done = 0
+        while True:
+            self.check_cancel()
+            with PipelineStats.track(self.stats, 'read_csv') as record:
+                batch = next(reader, None)
+                record['rows'] = batch.height if batch is not None else 0
+            if batch is None:
+                break
+            done = done + batch.height
+            with PipelineStats.track(self.stats, 'filter_nulls') as record:
+                helpers.df = batch.select(columns).filter(~pl.all_horizontal(pl.all().is_null()))
+                record['rows'] = helpers.df.height
+            if helpers.df.height > 0:
+                if self.has_output():
+                    helpers.handle_map_tiers(output_files=True)
                 else:
-                    raise ValueError("Invalid operation")
+                    outputs.append(helpers.handle_map_tiers(output_files=False))
+                # the following chunks are appended to the files and reuse the secret keys
+                helpers.append = True
+            self.report_progress(done, total)
+        return outputs
+
+    def preview(self, n_rows=100, sample=False):
+        """Pseudonymize only the first rows or a random sample of the structured input without writing any files.
+        The input file is scanned lazily, so the preview stays fast for very large files.
+
+        Parameters
+        ----------
+        n_rows : int
+            Number of rows in the preview.
+        sample : bool
+            Use a uniform random sample of the rows instead of the first rows. The file is then read once in chunks.
+
+        Returns
+        -------
+        Tuple of the pseudonymized Dataframe and the list of mapping Dataframes.
+
+        Example
+        -------
+        Preview the hash method on the first 20 rows.
+        ::
+            >>> import pseudPy.Pseudonymization as pseudPy
+            >>> pseudo = pseudPy.Pseudonymization(
+            >>>        map_method='hash',
+            >>>        map_columns='name',
+            >>>        input_file='/path/to/data.csv')
+            >>>
+            >>> df, mappings = pseudo.preview(20)
+        """
+        if self.map_method == 'decrypt':
+            raise ValueError("Preview is not available for the decrypt method.")
+        map_columns = [self.map_columns] if isinstance(self.map_columns, str) else self.map_columns
+        with PipelineStats.track(self.stats, 'read_csv') as record:
+            if self.input_file is not None and sample:
+                df = self.sample_rows(n_rows)
+            elif self.input_file is not None:
+                df = self.scan_input().head(n_rows).collect()
+            elif sample:
+                df = self.df.sample(min(n_rows, self.df.height), seed=self.seed)
+            else:
+                df = self.df.head(n_rows)
+            record['rows'] = df.height
+        df = df.filter(~pl.all_horizontal(pl.all().is_null()))
+        helpers = Helpers(df=df, map_columns=map_columns, map_method=self.map_method, mapping=True,
+                          encrypt_map=self.encrypt_map, seed=self.seed, patterns=self.patterns, stats=self.stats,
+                          write_keys=False)
+        df_map_all, mappings = helpers.handle_map_tiers(output_files=False)
+        return df_map_all, mappings
+
+    def scan_input(self):
+        """Return the input file as Polars LazyFrame. Parquet files are scanned with scan_parquet, else scan_csv."""
+        if self.input_file.endswith('.parquet'):
+            return pl.scan_parquet(self.input_file)
+        if not self.input_file.endswith('.csv'):
+            return pl.concat(list(self.read_batches())).lazy()
+        return pl.scan_csv(self.input_file, dtypes=self.str_dtypes())
+
+    def read_batches(self, batch_size=None):
+        """Read the input file in batches of *batch_size* rows, the chunk size by default. Parquet files are read by
+        row groups and gzip or zstd compressed CSV files (*.csv.gz*, *.csv.zst*) are decompressed while streaming."""
+        batch_size = batch_size or self.chunk_size or 50000
+        if self.input_file.endswith('.parquet'):
+            for batch in pq.ParquetFile(self.input_file).iter_batches(batch_size=batch_size):
+                yield pl.from_arrow(batch)
+            return
+        if self.input_file.endswith('.csv'):
+            # the batched reader needs the data types of all columns, if any data type is given
+            dtypes = self.str_dtypes()
+            if dtypes is not None:
+                dtypes = dict(pl.scan_csv(self.input_file, dtypes=dtypes).schema)
+            reader = pl.read_csv_batched(self.input_file, batch_size=batch_size, dtypes=dtypes)
+            while True:
+                batches = reader.next_batches(1)
+                if not batches:
+                    return
+                yield batches[0]
+        # like read_csv, only numbers are inferred and the mapped columns of fpe and decrypt are kept as String
+        block_size = 1 << 20
+        with pa.input_stream(self.input_file, compression='detect') as stream:
+            names = pyarrow.csv.open_csv(stream, read_options=pyarrow.csv.ReadOptions(block_size=block_size)).schema
+        column_types = {field.name: pa.string() for field in names
+                        if pa.types.is_temporal(field.type) or field.name in (self.str_dtypes() or {})}
+        with pa.input_stream(self.input_file, compression='detect') as stream:
+            reader = pyarrow.csv.open_csv(stream, read_options=pyarrow.csv.ReadOptions(block_size=block_size),
+                                          convert_options=pyarrow.csv.ConvertOptions(column_types=column_types))
+            buffer = None
+            for record_batch in reader:
+                batch = pl.from_arrow(pa.Table.from_batches([record_batch]))
+                buffer = batch if buffer is None else pl.concat([buffer, batch], how='vertical_relaxed')
+                while buffer.height >= batch_size:
+                    yield buffer.head(batch_size)
+                    buffer = buffer.slice(batch_size)
+            if buffer is not None and buffer.height > 0:
+                yield buffer
+
+    def has_output(self):
+        """Return True, if the job writes its results to the output folder or to the output sink."""
+        return self.output is not None or self.sink is not None
+
+    @contextmanager
+    def writing(self):
+        """Open the output sink and the background writer of the compressed output files for the job. At the end of
+        the job, the writer is waited for and the files are committed to the sink."""
+        if self.job_sink is not None or not self.has_output():
+            yield self.writer
+            return
+        self.job_sink = self.sink if self.sink is not None else LocalSink(self.output)
+        if self.compression is not None:
+            self.writer = OutputWriter(self.compression, stats=self.stats, sink=self.job_sink)
+        try:
+            yield self.writer
+        finally:
+            writer, self.writer = self.writer, None
+            sink, self.job_sink = self.job_sink, None
+            try:
+                if writer is not None:
+                    writer.close()
+            finally:
+                sink.close()
+
+    def write_output(self, df, name):
+        """Write the Dataframe to the file of the output sink, compressed by the background writer if any."""
+        if self.writer is not None:
+            self.writer.write(df, name)
+        else:
+            df.write_csv(self.job_sink.open(name))
+
+    def str_dtypes(self):
+        """Read the mapped columns as String for the format-preserving encryption and decryption, so that leading
+        zeros of numeric values are kept."""
+        if self.map_method not in ['fpe', 'decrypt']:
+            return None
+        map_columns = [self.map_columns] if isinstance(self.map_columns, str) else self.map_columns
+        return {col: pl.Utf8 for col in map_columns}
+
+    def sample_rows(self, n_rows):
+        """Draw a uniform random sample of n_rows rows from the input file. Every chunk gets random sort keys and
+        only the rows with the n_rows smallest keys are kept, so the memory use is bounded by n_rows and the chunk size."""
+        rng = random.Random(self.seed)
+        reservoir = None
+        offset = 0
+        for chunk in self.read_batches():
+            batch = chunk.with_columns(
+                pl.Series('__sample_key', [rng.random() for _ in range(chunk.height)]),
+                pl.int_range(offset, offset + chunk.height).alias('__row'))
+            offset = offset + chunk.height
+            reservoir = batch if reservoir is None else pl.concat([reservoir, batch], how='vertical_relaxed')
+            reservoir = reservoir.top_k(n_rows, by='__sample_key', descending=True)
+        return reservoir.sort('__row').drop('__sample_key', '__row')
+
+    def report_progress(self, done, total):
+        """Pass the progress of the job to the progress callback, if any."""
+        if self.progress is not None:
+            self.progress(done, total)
+
+    def check_cancel(self):
+        """Stop the job, if the cancel event is set."""
+        if self.cancel is not None and self.cancel.is_set():
+            raise JobCancelled("The job was cancelled.")
+
+    def read_mapping(self, path=None):
+        """Decrypt the mapping container of the column batch by batch.
+
+        Parameters
+        ----------
+        path : str
+            Path to the mapping container. Default: *mapping_output_<column>.arrow* in the output folder.
 
-                self.df = self.df.filter(condition)
-            for i in range(len(self.map_columns)):
-                mapping_instance = Mapping(df=self.df, first_tier=self.map_columns[i], output=self.output)
-                decrypt = map_method_handlers[self.map_method](mapping_instance)
-                decrypt = decrypt.rename(f"{self.map_columns[i]}")
-                self.df = self.df.drop(self.map_columns[i])
-                self.df = self.df.insert_column(1, decrypt)
-                self.df.write_csv(f"{self.output}/decrypted_output_{self.map_columns[i]}.csv")
+        Returns
+        -------
+        A generator of Polars DataFrames, which can be passed to revert_pseudonym and revert_nlp_pseudonym.
+        """
+        if path is None:
+            path = f'{self.output}/mapping_output_{self.map_columns}.arrow'
+        mapping = Mapping(None, first_tier=self.map_columns, output=self.output, keyring=self.keyring)
+        return MappingContainer.read(path, mapping.read_key(), self.map_columns)
 
     def revert_pseudonym(self, revert_df=None, pseudonyms=None):
         """Revert structured data to original in form of Dataframe.
 
         Parameters
         ----------
-        revert_df : Polars DataFrame
-            The mapping table in form of Polars Dataframe.
+        revert_df : Polars DataFrame or iterable
+            The mapping table in form of Polars Dataframe, or its batches, e.g. from read_mapping.
         pseudonyms : list
             Filter for exact pseudonyms to revert. Optional.
 
@@ -172,24 +580,63 @@ class Pseudonymization:
             >>>
             >>> pseudo.revert_pseudonym(df_revert)
         """
+        index_column = f'Index_{self.map_columns}'
+        if not isinstance(revert_df, pl.DataFrame):
+            return self.revert_pseudonym_batches(revert_df, pseudonyms)
+        df = self.df
         if pseudonyms is not None:
             try:
                 revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
             except polars.exceptions.InvalidOperationError:
                 pseudonyms = [int(i) for i in pseudonyms]
                 revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
-            self.df = self.df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
+            df = df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
 
-        self.df.insert_column(self.df.get_column_index(f'Index_{self.map_columns}'), revert_df[self.map_columns])
-        self.df = self.df.drop(f'Index_{self.map_columns}')
-        if self.output is None:
-            return self.df
+        if revert_df.height == df.height:
+            df = df.with_columns(revert_df[self.map_columns].alias(index_column)).rename({index_column: self.map_columns})
         else:
-            self.df.write_csv(f'{self.output}/reverted_output.csv')
-            return self.df
+            # the mapping contains only the filtered rows, the other rows keep their original values
+            df = df.with_columns(
+                pl.col(index_column).cast(pl.Utf8).replace(revert_df[index_column].cast(pl.Utf8),
+                                                           revert_df[self.map_columns].cast(pl.Utf8))
+            ).rename({index_column: self.map_columns})
+        if not self.has_output():
+            return df
+        job = self.job()
+        with job.writing():
+            job.write_output(df, 'reverted_output.csv')
+        return df
 
-    def nlp_pseudonym(self):
-        """Main function for pseudonymization of free text.
+    def revert_pseudonym_batches(self, batches, pseudonyms=None):
+        """Revert structured data with a mapping table, which is streamed in batches. Every pseudonym is replaced
+        once by the batch, which contains it, the rows without a pseudonym keep their values."""
+        index_column = f'Index_{self.map_columns}'
+        df = self.df
+        if pseudonyms is not None:
+            df = df.filter(pl.col(index_column).cast(pl.Utf8).is_in([str(i) for i in pseudonyms]))
+        pseudonym_values = df[index_column].cast(pl.Utf8)
+        reverted = pl.Series(self.map_columns, [None] * df.height, dtype=pl.Utf8)
+        for batch in batches:
+            reverted = reverted.fill_null(pseudonym_values.replace(
+                batch[index_column].cast(pl.Utf8), batch[self.map_columns].cast(pl.Utf8), default=None))
+        df = df.with_columns(reverted.fill_null(pseudonym_values).alias(index_column)).rename(
+            {index_column: self.map_columns})
+        if self.has_output():
+            job = self.job()
+            with job.writing():
+                job.write_output(df, 'reverted_output.csv')
+        return df
+
+    def nlp_pseudonym(self, text=None, input_file=None):
+        """Main function for pseudonymization of free text. Every call works on its own copy of the configuration, see
+        job, so one instance can be shared by threads.
+
+        Parameters
+        ----------
+        text : str
+            Input text of this call instead of the input of the instance. Optional.
+        input_file : str
+            Input file of this call instead of the input of the instance. Optional.
 
         Returns
         -------
@@ -211,78 +658,104 @@ class Pseudonymization:
             >>>
             >>> pseudo.nlp_pseudonym()
         """
-        # definitions
-        counter = 0
-        list_with_all_df = []
-
-        nlp = spacy.load("en_core_web_sm")
-
-        if self.input_file is not None:
-            file = open(self.input_file, "r")
-            self.text = file.read()
-            file.close()
-
-        if isinstance(self.pos_type, str) and self.patterns is None:
-            self.pos_type = [self.pos_type]
-        helpers = Helpers(text=self.text, nlp=nlp, all_ne=self.all_ne, pos_type=self.pos_type, patterns=self.patterns)
-        map_dict = helpers.entity_mapping()
-
-        # create pseudonyms and replace entities with pseudonyms in text
-        for key in map_dict:
-            df_pos = pl.DataFrame()
-            if self.map_method == 'encrypt':
-                mapping = Mapping(df_pos, output=self.output, first_tier=key)
-                mapping.generate_keys()
-            if self.map_method == 'decrypt':
-                for pos in self.pos_type:
-                    map_df = pl.read_csv(f'{self.output}/mapping_output_{pos}.csv')
-                    mapping = Mapping(map_df, first_tier=pos, output=self.output)
-                    self.text = mapping.decrypt_nlp_tier(self.text)
-                with open(f'{self.output}/decrypted_text.txt', 'w') as file:
-                    print(self.text, file=file)
-            else:
-                helpers = Helpers(list_=map_dict[key], map_method=self.map_method, df=df_pos, counter=counter,
-                                  field=key, output=self.output)
-                df_pos = helpers.pseudo_nlp_mapper()
-                if not df_pos.is_empty():
-                    if self.map_method == 'counter':
-                        try:
-                            counter = int((df_pos.select(pl.last(f'Index_{key}')).to_series())[0]) + 1
-                        except TypeError:
-                            counter = (df_pos.select(pl.last(f'Index_{key}')).to_series())[0] + 1
-                    for subst in df_pos.to_dicts():
-                        self.text = self.text.replace(str(subst[key]), str(subst[f'Index_{key}']))
-                    # encrypt mapping data if requested
-                    if self.encrypt_map and self.map_method != 'encrypt':
-                        mapping = Mapping(df_pos, output=self.output, first_tier=key)
-                        mapping.generate_keys()
-                        df_pos = df_pos.with_columns(df_pos[key].map_elements(lambda x: Mapping.encrypt_data(mapping, x),
-                                                                              return_dtype=pl.Utf8).alias(key))
-                if self.map_method == 'encrypt':
-                    df_pos = df_pos.drop(key)
-                    df_pos = df_pos.rename({f"Index_{key}": f"{key}"})
-
-                list_with_all_df.append(df_pos)
-            # output options
-            if self.output:
-                for index in range(len(list_with_all_df)):
-                    if not list_with_all_df[index].is_empty():
-                        list_with_all_df[index].write_csv(f'{self.output}/mapping_output_{list_with_all_df[index].columns[0].
-                                                          split('_', 1)[-1]}.csv')
-
-                    with open(f"{self.output}/text.txt", "w") as text_file:
-                        print(self.text, file=text_file)
-            else:
+        return self.job(text=text, input_file=input_file).run_nlp_pseudonym()
+
+    def run_nlp_pseudonym(self):
+        """Pseudonymize the free text of the job, see nlp_pseudonym."""
+        with self.writing():
+            # definitions
+            counter = 0
+            list_with_all_df = []
+
+            if isinstance(self.pos_type, str) and self.patterns is None:
+                self.pos_type = [self.pos_type]
+            # emails and phone numbers are found by regex, the spaCy model is only loaded for the other entities
+            nlp = None
+            if not Helpers.is_regex_only(self.pos_type, self.patterns, self.all_ne, self.terms):
+                with PipelineStats.track(self.stats, 'load_model'):
+                    nlp = Helpers.load_nlp()
+
+            if self.input_file is not None:
+                with PipelineStats.track(self.stats, 'read_text') as record:
+                    file = open(self.input_file, "r")
+                    self.text = file.read()
+                    file.close()
+                    record['bytes'] = len(self.text)
+
+            helpers = Helpers(text=self.text, nlp=nlp, all_ne=self.all_ne, pos_type=self.pos_type, patterns=self.patterns,
+                              stats=self.stats, terms=self.terms, entity_cache=self.entity_cache)
+            with PipelineStats.track(self.stats, 'entity_mapping') as record:
+                map_dict = helpers.entity_mapping()
+                record['rows'] = sum(len(map_dict[key]) for key in map_dict)
+            entity_types = helpers.entity_types()
+
+            # create pseudonyms and replace entities with pseudonyms in text
+            for done, key in enumerate(map_dict):
+                self.check_cancel()
+                self.report_progress(done, len(map_dict))
+                df_pos = pl.DataFrame()
+                if self.map_method in key_map_methods:
+                    mapping = Mapping(df_pos, output=self.output, first_tier=key, stats=self.stats, keyring=self.keyring)
+                    mapping.generate_keys(scheme=key_map_methods[self.map_method])
+                if self.map_method == 'decrypt':
+                    for pos in entity_types:
+                        map_df = pl.read_csv(f'{self.output}/mapping_output_{pos}.csv')
+                        mapping = Mapping(map_df, first_tier=pos, output=self.output, stats=self.stats,
+                                          keyring=self.keyring)
+                        self.text = mapping.decrypt_nlp_tier(self.text)
+                else:
+                    helpers = Helpers(list_=map_dict[key], map_method=self.map_method, df=df_pos, counter=counter,
+                                      field=key, output=self.output, stats=self.stats, keyring=self.keyring,
+                                      mapping_format=self.mapping_format, writer=self.writer)
+                    with PipelineStats.track(self.stats, f'map:{self.map_method}', column=key) as record:
+                        df_pos = helpers.pseudo_nlp_mapper()
+                        record['rows'] = df_pos.height
+                    if not df_pos.is_empty():
+                        if self.map_method == 'counter':
+                            counter = counter + df_pos.height
+                        for subst in df_pos.to_dicts():
+                            self.text = self.text.replace(str(subst[key]), str(subst[f'Index_{key}']))
+                        # encrypt mapping data if requested, the mapping container is encrypted as a whole
+                        if (self.encrypt_map or self.mapping_format == 'arrow') and self.map_method not in key_map_methods:
+                            mapping = Mapping(df_pos, output=self.output, first_tier=key, stats=self.stats,
+                                              keyring=self.keyring)
+                            mapping.generate_keys(scheme=Mapping.key_scheme(self.map_method, self.encrypt_map,
+                                                                            self.mapping_format))
+                            if self.mapping_format != 'arrow':
+                                with PipelineStats.track(self.stats, 'encrypt_map', column=key, rows=df_pos.height):
+                                    df_pos = df_pos.with_columns(mapping.encrypt_column(df_pos[key]).alias(key))
+                    if self.map_method in key_map_methods:
+                        df_pos = df_pos.drop(key)
+                        df_pos = df_pos.rename({f"Index_{key}": f"{key}"})
+
+                    list_with_all_df.append(df_pos)
+            self.report_progress(len(map_dict), len(map_dict))
+            # output options, every mapping and the text are written once at the end of the job
+            if not self.has_output():
                 list_with_all_df.append(self.text)
                 return list_with_all_df
+            helpers = Helpers(output=self.output, stats=self.stats, keyring=self.keyring,
+                              mapping_format=self.mapping_format, writer=self.writer, sink=self.job_sink)
+            for df_pos in list_with_all_df:
+                if not df_pos.is_empty():
+                    column = df_pos.columns[0].split('_', 1)[-1]
+                    if self.map_method in key_map_methods:
+                        helpers.write_csv(df_pos, f'mapping_output_{column}.csv')
+                    else:
+                        helpers.write_mapping(df_pos, Mapping(None, first_tier=column, output=self.output,
+                                                              keyring=self.keyring))
+            with PipelineStats.track(self.stats, 'write_text') as record:
+                record['bytes'] = self.job_sink.write('text.txt', f'{self.text}\n')
+            if self.map_method == 'decrypt':
+                self.job_sink.write('decrypted_text.txt', f'{self.text}\n')
 
     def revert_nlp_pseudonym(self, revert_df, pseudonyms=None):
         """Revert free text to original.
 
         Parameters
         ----------
-        revert_df : Polars DataFrame
-            The mapping table.
+        revert_df : Polars DataFrame or iterable
+            The mapping table, or its batches, e.g. from read_mapping.
         pseudonyms : list
             Filter for exact pseudonyms to revert. Optional.
 
@@ -306,37 +779,55 @@ class Pseudonymization:
             >>>
             >>> pseudo.revert_nlp_pseudonym(df_revert)
         """
-        if pseudonyms is not None:
-            try:
-                revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
-            except polars.exceptions.InvalidOperationError:
-                pseudonyms = [int(i) for i in pseudonyms]
-                revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
-        for subst in revert_df.to_dicts():
-            self.text = self.text.replace(str(subst[f'Index_{self.map_columns}']), str(subst[self.map_columns]))
-        if self.output is None:
-            return self.text
-        else:
-            with open(f"{self.output}/reverted_text.txt", "w") as text_file:
-                print(self.text, file=text_file)
-            return self.text
+        text = self.text
+        for revert_df in ([revert_df] if isinstance(revert_df, pl.DataFrame) else revert_df):
+            if pseudonyms is not None:
+                try:
+                    revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
+                except polars.exceptions.InvalidOperationError:
+                    pseudonyms = [int(i) for i in pseudonyms]
+                    revert_df = revert_df.filter(pl.col(f"Index_{self.map_columns}").is_in(pseudonyms))
+            for subst in revert_df.to_dicts():
+                text = text.replace(str(subst[f'Index_{self.map_columns}']), str(subst[self.map_columns]))
+        if not self.has_output():
+            return text
+        job = self.job()
+        with job.writing():
+            job.job_sink.write('reverted_text.txt', f'{text}\n')
+        return text
 
 
 class Mapping:
     """Helper class for pseudonym creation, defines all pseudonymization methods and additional processing functions."""
-    def __init__(self, df, first_tier=None, count_start=0, seed=None, output=None):
+    def __init__(self, df, first_tier=None, count_start=0, seed=None, output=None, stats=None, keyring=None,
+                 key_version=None):
         self.df = df
         self.first_tier = first_tier
         self.count_start = count_start
         self.seed = seed
         self.output = output
-        self.fake = Faker()
+        self.stats = stats
+        self.keyring = keyring
+        self.key_version = key_version
+        self.key = None
+        self.scheme = None
+        self._fake = None
+
+    @property
+    def fake(self):
+        """Faker instance, created on first use, since the creation is slow and only the faker methods need it."""
+        if self._fake is None:
+            self._fake = Faker()
+            if self.seed is not None:
+                # the seed of the instance, the global Faker generator is not reseeded
+                self._fake.seed_instance(self.seed)
+        return self._fake
 
     def counter_tier(self):
         """Counter method: return Series of ascending numbers as pseudonyms"""
         df_height = len(self.df)
-        return pl.Series(f'Index_{self.first_tier}',
-                         [*range(self.count_start, self.count_start + df_height)])
+        return pl.int_range(self.count_start, self.count_start + df_height, dtype=pl.Int64,
+                            eager=True).alias(f'Index_{self.first_tier}')
 
     @staticmethod
     def random_uuid_1():
@@ -352,9 +843,10 @@ class Mapping:
         """Random1 method: return a Series of pseudonyms as a UUID from a host ID,
         sequence number, and the current time. Seed is possible."""
         if self.seed is not None:
-            random.seed(self.seed)
+            # a generator per call, the global random module is not reseeded
+            rng = random.Random(self.seed)
             return pl.Series(f'Index_{self.first_tier}', self.df[self.first_tier].map_elements(
-                lambda x: str(uuid.UUID(int=random.getrandbits(128), version=1)), return_dtype=pl.Utf8))
+                lambda x: str(uuid.UUID(int=rng.getrandbits(128), version=1)), return_dtype=pl.Utf8))
         else:
             return pl.Series(f'Index_{self.first_tier}', self.df[self.first_tier].map_elements(
                 lambda x: Mapping.random_uuid_1(), return_dtype=pl.Utf8))
@@ -362,9 +854,10 @@ class Mapping:
     def random4_tier(self):
         """Random4 method: return a Series of pseudonyms as a random UUID. Seed is possible."""
         if self.seed is not None:
-            random.seed(self.seed)
+            # a generator per call, the global random module is not reseeded
+            rng = random.Random(self.seed)
             return pl.Series(f'Index_{self.first_tier}', self.df[self.first_tier].map_elements(
-                lambda x: str(uuid.UUID(int=random.getrandbits(128), version=4)), return_dtype=pl.Utf8))
+                lambda x: str(uuid.UUID(int=rng.getrandbits(128), version=4)), return_dtype=pl.Utf8))
         else:
             return pl.Series(f'Index_{self.first_tier}', self.df[self.first_tier].map_elements(
                 lambda x: Mapping.random_uuid_4(), return_dtype=pl.Utf8))
@@ -385,34 +878,77 @@ class Mapping:
             mtree = MerkleTree(elem)
             return mtree.getRootHash()
 
-        list_of_rows = self.df.rows()
+        list_of_rows = self.df.select(pl.all().cast(pl.Utf8)).rows()
         output = []
         for user in list_of_rows:
             output.append(merkletree(list(filter(lambda item: item is not None, user))))
         return pl.Series(f'Index_{self.first_tier}', output)
 
-    def generate_keys(self):
-        """Generate secret keys for data encryption/decryption."""
-        key = os.urandom(32)
-        hex_key = key.hex()
-        if self.output is not None:
-            with open(f'{self.output}/secure_key_{self.first_tier}.txt', 'w') as file:
-                file.write(hex_key)
-        else:
-            with open(f'secure_key_{self.first_tier}.txt', 'w') as file:
-                file.write(hex_key)
+    @staticmethod
+    def key_scheme(map_method, encrypt_map, mapping_format='csv'):
+        """Return the encryption scheme of the secret key: the scheme of the map method, else of the mapping
+        container or of the mapping encryption. None stands for AES-ECB."""
+        if map_method in key_map_methods:
+            return key_map_methods[map_method]
+        if mapping_format == 'arrow':
+            return 'aes-gcm'
+        return encrypt_map if isinstance(encrypt_map, str) else None
+
+    def generate_keys(self, write=True, scheme=None):
+        """Generate secret keys for data encryption/decryption. Keep the key in memory only, if write is False.
+        The encryption scheme is stored in front of the key, e.g. *fpe:<key>*, no prefix stands for AES-ECB."""
+        with PipelineStats.track(self.stats, 'generate_keys', column=self.first_tier):
+            # AES-SIV uses two AES-256 keys
+            key = os.urandom(64 if scheme == 'aes-siv' else 32)
+            self.key = key
+            self.scheme = scheme
+            if not write:
+                return
+            if self.keyring is not None:
+                keyring = Keyring.load(self.keyring)
+                self.key_version = keyring.add_key(self.key_column(), key, scheme)
+                keyring.save()
+                return
+            hex_key = key.hex() if scheme is None else f'{scheme}:{key.hex()}'
+            if self.output is not None:
+                with open(f'{self.output}/secure_key_{self.first_tier}.txt', 'w') as file:
+                    file.write(hex_key)
+            else:
+                with open(f'secure_key_{self.first_tier}.txt', 'w') as file:
+                    file.write(hex_key)
+
+    def key_column(self):
+        """Return the name of the original column, which the secret key belongs to."""
+        if self.first_tier.startswith("Index_"):
+            return self.first_tier.replace("Index_", "")
+        return self.first_tier
+
+    def read_key(self):
+        """Return the secret key of the column. The key file is read only once per instance."""
+        if self.key is None and self.keyring is not None:
+            self.key, self.scheme = Keyring.load(self.keyring).get_key(self.key_column(), self.key_version)
+        if self.key is None:
+            first_tier = self.key_column()
+            if self.output is not None:
+                try:
+                    with open(f'{self.output}/secure_key_{first_tier}.txt', 'r') as file:
+                        hex_key = file.read()
+                except FileNotFoundError:
+                    with open(f'secure_key_{first_tier}.txt', 'r') as file:
+                        hex_key = file.read()
+            else:
+                with open(f'secure_key_{first_tier}.txt', 'r') as file:
+                    hex_key = file.read()
+            if ':' in hex_key:
+                self.scheme, hex_key = hex_key.split(':', 1)
+            self.key = bytes.fromhex(hex_key)
+        return self.key
 
     # Source: https://www.askpython.com/python/examples/implementing-aes-with-padding
     def encrypt_data(self, data):
         """Return encrypted data string."""
         data = data.encode('utf-8')
-        if self.output is not None:
-            with open(f'{self.output}/secure_key_{self.first_tier}.txt', 'r') as file:
-                hex_key = file.read()
-        else:
-            with open(f'secure_key_{self.first_tier}.txt', 'r') as file:
-                hex_key = file.read()
-        key = bytes.fromhex(hex_key)
+        key = self.read_key()
 
         cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
         encryptor = cipher.encryptor()
@@ -425,28 +961,17 @@ class Mapping:
     def encrypt_tier(self):
         """Encrypt the data in Dataframe. Return Series of encrypted data."""
         try:
-            return pl.Series(f'Index_{self.first_tier}', self.df[self.first_tier].map_elements(
-                lambda x: Mapping.encrypt_data(self, x), return_dtype=pl.Utf8))
+            return self.ecb_encrypt(self.df[self.first_tier]).alias(f'Index_{self.first_tier}')
         except polars.exceptions.ColumnNotFoundError:
             print("Error: check whether all elements in the selected column are not empty and not None.")
 
     # Source: https://www.askpython.com/python/examples/implementing-aes-with-padding
     def decrypt_data(self, data):
         """Return decrypted data string."""
+        key = self.read_key()
+        if self.scheme in decrypt_scheme_handlers:
+            return decrypt_scheme_handlers[self.scheme](self, pl.Series([data]))[0]
         data = data.encode('utf-8')
-        if self.first_tier.startswith("Index_"):
-            self.first_tier = self.first_tier.replace("Index_", "")
-        if self.output is not None:
-            try:
-                with open(f'{self.output}/secure_key_{self.first_tier}.txt', 'r') as file:
-                    hex_key = file.read()
-            except FileNotFoundError:
-                with open(f'secure_key_{self.first_tier}.txt', 'r') as file:
-                    hex_key = file.read()
-        else:
-            with open(f'secure_key_{self.first_tier}.txt', 'r') as file:
-                hex_key = file.read()
-        key = bytes.fromhex(hex_key)
 
         cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
         decryptor = cipher.decryptor()
@@ -459,14 +984,103 @@ class Mapping:
 
     def decrypt_tier(self):
         """Decrypt the data in Dataframe. Return Series of decrypted data."""
-        return pl.Series(f'Decrypted_{self.first_tier}', self.df[f'{self.first_tier}'].map_elements(
-            lambda x: Mapping.decrypt_data(self, x), return_dtype=pl.Utf8))
+        return self.decrypt_column(self.df[f'{self.first_tier}']).alias(f'Decrypted_{self.first_tier}')
+
+    def encrypt_column(self, series):
+        """Encrypt a Series with the scheme of the secret key. Return Series of encrypted data."""
+        self.read_key()
+        return encrypt_scheme_handlers.get(self.scheme, Mapping.ecb_encrypt)(self, series)
+
+    def decrypt_column(self, series):
+        """Decrypt a Series with the scheme of the secret key. Return Series of decrypted data."""
+        self.read_key()
+        return decrypt_scheme_handlers.get(self.scheme, Mapping.ecb_decrypt)(self, series)
+
+    def ecb_encrypt(self, series):
+        """Encrypt a Series with AES-ECB like encrypt_data. Every unique value is encrypted once and all values are
+        passed through one cipher context, since the ECB blocks are independent."""
+        series = series.cast(pl.Utf8)
+        unique = series.drop_nulls().unique()
+        padded = []
+        for value in unique.to_list():
+            padder = PKCS7(algorithms.AES.block_size).padder()
+            padded.append(padder.update(value.encode('utf-8')) + padder.finalize())
+        encryptor = Cipher(algorithms.AES(self.read_key()), modes.ECB(), backend=default_backend()).encryptor()
+        ciphertext = encryptor.update(b''.join(padded)) + encryptor.finalize()
+        encrypted = []
+        offset = 0
+        for block in padded:
+            encrypted.append(base64.b64encode(ciphertext[offset:offset + len(block)]).decode('utf-8'))
+            offset = offset + len(block)
+        return series.replace(unique, pl.Series(encrypted, dtype=pl.Utf8))
+
+    def ecb_decrypt(self, series):
+        """Decrypt a Series, which was encrypted with AES-ECB. Every unique value is decrypted once and all values
+        are passed through one cipher context."""
+        series = series.cast(pl.Utf8)
+        unique = series.drop_nulls().unique()
+        ciphertexts = [base64.b64decode(value) for value in unique.to_list()]
+        decryptor = Cipher(algorithms.AES(self.read_key()), modes.ECB(), backend=default_backend()).decryptor()
+        padded_data = decryptor.update(b''.join(ciphertexts)) + decryptor.finalize()
+        decrypted = []
+        offset = 0
+        for ciphertext in ciphertexts:
+            unpadder = PKCS7(algorithms.AES.block_size).unpadder()
+            block = padded_data[offset:offset + len(ciphertext)]
+            decrypted.append((unpadder.update(block) + unpadder.finalize()).decode('utf-8'))
+            offset = offset + len(ciphertext)
+        return series.replace(unique, pl.Series(decrypted, dtype=pl.Utf8))
+
+    def siv_encrypt(self, series):
+        """Deterministic authenticated encryption with AES-SIV, the column name is the associated data. One cipher
+        context is used for the whole column and every unique value is encrypted once."""
+        cipher = AESSIV(self.read_key())
+        associated_data = [self.key_column().encode('utf-8')]
+        series = series.cast(pl.Utf8)
+        unique = series.drop_nulls().unique()
+        encrypted = [base64.b64encode(cipher.encrypt(value.encode('utf-8'), associated_data)).decode('utf-8')
+                     for value in unique.to_list()]
+        return series.replace(unique, pl.Series(encrypted, dtype=pl.Utf8))
+
+    def siv_decrypt(self, series):
+        """Decrypt a Series, which was encrypted with AES-SIV. Every unique value is decrypted once."""
+        cipher = AESSIV(self.read_key())
+        associated_data = [self.key_column().encode('utf-8')]
+        series = series.cast(pl.Utf8)
+        unique = series.drop_nulls().unique()
+        decrypted = [cipher.decrypt(base64.b64decode(value), associated_data).decode('utf-8')
+                     for value in unique.to_list()]
+        return series.replace(unique, pl.Series(decrypted, dtype=pl.Utf8))
+
+    def siv_tier(self):
+        """Encrypt the data in Dataframe with the deterministic AES-SIV. Return Series of encrypted data."""
+        try:
+            return self.siv_encrypt(self.df[self.first_tier]).alias(f'Index_{self.first_tier}')
+        except polars.exceptions.ColumnNotFoundError:
+            print("Error: check whether all elements in the selected column are not empty and not None.")
+
+    def fpe_tier(self):
+        """Format-preserving encryption (FF3-1) of the data in Dataframe, length and alphabet of the values are
+        kept. Return Series of encrypted data."""
+        try:
+            return self.fpe_encrypt(self.df[self.first_tier]).alias(f'Index_{self.first_tier}')
+        except polars.exceptions.ColumnNotFoundError:
+            print("Error: check whether all elements in the selected column are not empty and not None.")
+
+    def fpe_encrypt(self, series):
+        """Encrypt a Series with the format-preserving encryption."""
+        return FF3Cipher.transform_series(series, self.read_key(), self.key_column())
+
+    def fpe_decrypt(self, series):
+        """Decrypt a Series, which was encrypted with the format-preserving encryption."""
+        return FF3Cipher.transform_series(series, self.read_key(), self.key_column(), decrypt=True)
 
     def decrypt_nlp_tier(self, text):
-        for subst in self.df.to_dicts():
-            index_value = str(subst[f'{self.first_tier}'])
-            decrypted_value = str(Mapping.decrypt_data(self, index_value))
-            text = text.replace(index_value, decrypted_value)
+        with PipelineStats.track(self.stats, 'decrypt', column=self.first_tier, rows=self.df.height):
+            for subst in self.df.to_dicts():
+                index_value = str(subst[f'{self.first_tier}'])
+                decrypted_value = str(Mapping.decrypt_data(self, index_value))
+                text = text.replace(index_value, decrypted_value)
         return text
 
     def generate_fake_names(self):
@@ -579,7 +1193,9 @@ class Helpers:
 
     def __init__(self, df=None, map_columns=None, map_method=None, mapping=None, encrypt_map=None, seed=None,
                  list_=None, counter=None, field=None, text=None, nlp=None, all_ne=None,
-                 pos_type=None, patterns=None, output=None):
+                 pos_type=None, patterns=None, output=None, stats=None, count_start=0, append=False, write_keys=True,
+                 keyring=None, mapping_format='csv', writer=None, terms=None, entity_cache=None, sink=None,
+                 counter_stride=None, keys=None):
         self.df = df
         self.map_columns = map_columns
         self.map_method = map_method
@@ -595,98 +1211,216 @@ class Helpers:
         self.pos_type = pos_type
         self.patterns = patterns
         self.output = output
+        self.stats = stats
+        self.count_start = count_start
+        self.append = append
+        self.write_keys = write_keys
+        self.keyring = keyring
+        self.mapping_format = mapping_format
+        self.writer = writer
+        self.terms = terms
+        self.entity_cache = entity_cache
+        self.sink = sink
+        self.counter_stride = counter_stride
+        self.keys = keys
+        self.terms_digest = None
+        self.term_matcher = None
+        self.pattern_matcher = None
+
+    def resolve_terms(self):
+        """Return the digest and the PhraseMatcher of the terms, which are resolved once per instance."""
+        if self.term_matcher is None:
+            self.terms_digest, self.term_matcher = TermMatcher.resolve(self.nlp, self.terms)
+        return self.terms_digest, self.term_matcher
+
+    def resolve_patterns(self):
+        """Return the Matcher of the token patterns, which is built once per instance."""
+        if self.pattern_matcher is None:
+            matcher = Matcher(self.nlp.vocab)
+            matcher.add('PATTERNS', self.patterns)
+            self.pattern_matcher = matcher
+        return self.pattern_matcher
 
     def handle_map_tiers(self, output_files):
         """General function for organizing pseudonymized data. Return dataframes with pseudonymized data and mappings,
-        write both to files."""
-        count_start = 0
+        write both to files. If append is set, the files are continued and the existing secret keys are reused.
+        The counter of every column starts at its own block of the chunk, or with counter_stride set, at its own block
+        of the job: the values of column i start at *i * counter_stride*."""
+        count_start = self.count_start
         return_map_output = []
-        # filter the data
+        # filter the data: only the matching rows are pseudonymized, the other rows are kept unchanged
+        mask = None
         if self.patterns is not None:
-            column, op, value = (self.patterns[0], self.patterns[1].strip(), self.patterns[2])
-            if op == '>':
-                condition = pl.col(column) > value
-                filtered_df = self.df.filter(~condition)
-            elif op == '<':
-                condition = pl.col(column) < value
-                filtered_df = self.df.filter(~condition)
-            elif op == '==':
-                condition = pl.col(column) == value
-                filtered_df = self.df.filter(~condition)
-            elif op == '!=':
-                condition = pl.col(column) != value
-                filtered_df = self.df.filter(~condition)
-            else:
-                raise ValueError("Invalid operation")
-
-            self.df = self.df.filter(condition)
-
-        self.df = Helpers.int_to_str(self.df)
+            with PipelineStats.track(self.stats, 'filter_patterns') as record:
+                mask = self.df.select(Helpers.filter_expression(self.patterns)).to_series().fill_null(False)
+                record['rows'] = mask.sum()
+
+        # only the mapped columns are cast to String and only if the method works on strings,
+        # other columns keep their native data types
+        str_columns = self.map_columns if self.map_method in str_map_methods or self.encrypt_map else []
+        with PipelineStats.track(self.stats, 'int_to_str', column=','.join(str_columns), rows=self.df.height):
+            self.df = Helpers.int_to_str(self.df, str_columns)
         df_map_all = self.df.clone()
+        # the pseudonyms are generated for the matching rows only, the Merkle Tree needs the complete rows
+        if mask is None:
+            df_source = self.df
+        elif self.map_method == 'merkle-tree':
+            df_source = self.df.filter(mask)
+        else:
+            df_source = self.df.select(self.map_columns).filter(mask)
         for i in range(0, len(self.map_columns)):
-            df_copy = self.df.clone()
-            columns_to_keep = []
+            df_copy = df_source.clone()
 
-            mapping_instance = Mapping(self.df, self.map_columns[i], count_start, self.seed, self.output)
+            # the counter of every column starts at its own block, the columns do not depend on each other
+            stride = df_source.height if self.counter_stride is None else self.counter_stride
+            mapping_instance = Mapping(df_source, self.map_columns[i], count_start + i * stride, self.seed,
+                                       self.output, self.stats, self.keyring)
+            self.cached_key(mapping_instance)
             # generate secret keys for encryption
-            if self.encrypt_map or (self.map_method == 'encrypt'):
-                Mapping.generate_keys(mapping_instance)
+            if (self.encrypt_map or self.map_method in key_map_methods or self.mapping_format == 'arrow') \
+                    and not self.append:
+                Mapping.generate_keys(mapping_instance, write=self.write_keys,
+                                      scheme=Mapping.key_scheme(self.map_method, self.encrypt_map,
+                                                                self.mapping_format))
             # call the pseudonymization methods
-            df_copy.insert_column(0, map_method_handlers[self.map_method](mapping_instance))
-            # update the counter with the correct start number
-            if self.map_method == 'counter':
-                last_index = (df_copy.select(pl.last(f'Index_{self.map_columns[i]}')).to_series())[0]
-                count_start = last_index + 1
+            with PipelineStats.track(self.stats, f'map:{self.map_method}', column=self.map_columns[i],
+                                     rows=df_source.height):
+                df_copy.insert_column(0, map_method_handlers[self.map_method](mapping_instance))
             # replace columns with pseudonyms
-            try:
-                df_map_all.insert_column(self.df.get_column_index(self.map_columns[i]),
-                                         df_copy[f'Index_{self.map_columns[i]}'])
-            except TypeError:
-                print('TypeError: Check whether the column names match the input column names.')
-            df_map_all = df_map_all.drop(self.map_columns[i])
-
-            columns_to_keep.append(self.map_columns[i])
-            columns_to_keep.append(f'Index_{self.map_columns[i]}')
-            df_copy = df_copy.drop([col for col in self.df.columns if col not in columns_to_keep])
-            # encrypt mappings if requested
-            if self.encrypt_map and (self.map_method != 'encrypt'):
-                df_copy = df_copy.with_columns(
-                    df_copy[self.map_columns[i]].map_elements(lambda x: Mapping.encrypt_data(mapping_instance, x),
-                                                              return_dtype=pl.Utf8).alias(self.map_columns[i])
-                )
+            if mask is None:
+                try:
+                    df_map_all.insert_column(self.df.get_column_index(self.map_columns[i]),
+                                             df_copy[f'Index_{self.map_columns[i]}'])
+                except TypeError:
+                    print('TypeError: Check whether the column names match the input column names.')
+                df_map_all = df_map_all.drop(self.map_columns[i])
+            else:
+                df_map_all = df_map_all.with_columns(
+                    Helpers.when_matched(mask, df_copy[f'Index_{self.map_columns[i]}'], self.map_columns[i],
+                                         df_map_all.schema[self.map_columns[i]])
+                ).rename({self.map_columns[i]: f'Index_{self.map_columns[i]}'})
+
+            # mapping contains only the pseudonymized rows
+            df_copy = df_copy.select(f'Index_{self.map_columns[i]}', self.map_columns[i])
+            # encrypt mappings if requested, the mapping container is encrypted as a whole
+            if self.encrypt_map and (self.map_method not in key_map_methods) and self.mapping_format != 'arrow':
+                with PipelineStats.track(self.stats, 'encrypt_map', column=self.map_columns[i], rows=df_copy.height):
+                    df_copy = df_copy.with_columns(
+                        mapping_instance.encrypt_column(df_copy[self.map_columns[i]]).alias(self.map_columns[i])
+                    )
             # outputs
-            if output_files and (self.map_method != 'encrypt') and (self.map_method != 'decrypt'):
+            if output_files and (self.map_method not in key_map_methods) and (self.map_method != 'decrypt'):
                 if self.mapping:
                     # mapping file contains only the pseudonyms and corresponding original row
-                    df_copy.write_csv(f'{self.output}/mapping_output_{self.map_columns[i]}.csv')
+                    self.write_mapping(df_copy, mapping_instance)
             return_map_output.append(df_copy)
-            # if self.patterns is not None:
-            #    filtered_df = filtered_df.rename({f"{self.map_columns[i]}": f"Index_{self.map_columns[i]}"})
-        # if the data is filtered, the filtered data is pseudonymized and the remaining data is output in its
-        # original state. Both are concatenated into one file.
-        # if self.patterns is not None:
-            # filtered_df = Helpers.int_to_str(filtered_df)
-            # df_map_all = Helpers.int_to_str(df_map_all)
-            # df_map_all = pl.concat([df_map_all, filtered_df])
         if output_files:
             # output file contains pseudonyms and other rows that were not modified
-            df_map_all.write_csv(f'{self.output}/output.csv')
+            self.write_csv(df_map_all, 'output.csv')
+        if self.map_method == 'counter':
+            columns = len(self.map_columns) if self.counter_stride is None else 1
+            self.count_start = count_start + columns * df_source.height
         if self.mapping:
             return [df_map_all, return_map_output]
         else:
             return df_map_all
 
     @staticmethod
-    def int_to_str(df):
-        """Convert all values to String."""
-        for col in df.columns:
-            df = df.with_columns(pl.col(col).cast(pl.Utf8))
-        return df
+    def when_matched(mask, pseudonyms, column, dtype):
+        """Return an expression, which replaces the values of the matching rows with the pseudonyms in a single pass.
+        The pseudonyms are ordered like the matching rows, the other rows keep their values."""
+        if pseudonyms.len() == 0:
+            return pl.col(column)
+        positions = (mask.cast(pl.Int64).cum_sum() - 1).clip(lower_bound=0)
+        original = pl.col(column)
+        # keep the data type if pseudonyms and original values share it, e.g. counter on an integer column
+        if pseudonyms.dtype != dtype:
+            pseudonyms = pseudonyms.cast(pl.Utf8)
+            original = original.cast(pl.Utf8)
+        return pl.when(pl.lit(mask)).then(pl.lit(pseudonyms).gather(positions)).otherwise(original).alias(column)
+
+    def cached_key(self, mapping_instance):
+        """Pass the secret key of the column from the keys of the Helpers to the mapping, if any, so that long-running
+        processes do not read the key file again."""
+        if self.keys is not None and mapping_instance.first_tier in self.keys:
+            mapping_instance.key, mapping_instance.scheme = self.keys[mapping_instance.first_tier]
+
+    def write_mapping(self, df, mapping_instance):
+        """Write the mapping table of a column as csv or as encrypted mapping container."""
+        column = mapping_instance.key_column()
+        if self.mapping_format != 'arrow':
+            self.write_csv(df, f'mapping_output_{column}.csv')
+            return
+        # the container is continued in place, so it is written to the output folder directly
+        if self.sink is not None and not isinstance(self.sink, LocalSink):
+            raise ValueError("The arrow mapping format requires a local output folder.")
+        folder = self.sink.path if self.sink is not None else self.output
+        with PipelineStats.track(self.stats, 'write_mapping', column=column, rows=df.height) as record:
+            record['bytes'] = MappingContainer.write(f'{folder}/mapping_output_{column}.arrow', df,
+                                                     mapping_instance.read_key(), column, append=self.append)
+
+    def write_csv(self, df, name):
+        """Write a Dataframe as csv file of the output sink, or append it without header, and record the number of
+        rows and bytes written. Compressed files are passed to the background writer. Without a sink, the file is
+        written to the output folder."""
+        if self.writer is not None:
+            self.writer.write(df, name, append=self.append)
+            return
+        sink = self.sink if self.sink is not None else LocalSink(self.output)
+        with PipelineStats.track(self.stats, 'write_csv', rows=df.height) as record:
+            file = sink.open(name, append=self.append)
+            start = file.tell()
+            df.write_csv(file, include_header=not self.append)
+            record['bytes'] = file.tell() - start
+        if sink is not self.sink:
+            sink.close()
+
+    @staticmethod
+    def filter_expression(patterns):
+        """Compile the filter for structured data to a single Polars expression.
+
+        A condition is a list *[column, operation, value]*. Available operations are *'==', '!=', '>', '>=', '<',
+        '<=', 'in', 'not_in'* (value is a list), *'between'* (value is [lower, upper], both included),
+        *'is_null', 'is_not_null'* (without value) and the string operations *'contains', 'starts_with', 'ends_with'*
+        and *'matches'* (regular expression).
+
+        Conditions are combined with dictionaries *{'and': [...]}, {'or': [...]}* or *{'not': condition}*, which
+        can be nested. A list of conditions is combined with 'and'.
+        """
+        if isinstance(patterns, dict):
+            if len(patterns) != 1:
+                raise ValueError("Invalid filter: use exactly one of 'and', 'or', 'not' per dictionary.")
+            operator, operands = next(iter(patterns.items()))
+            if operator == 'not':
+                return ~Helpers.filter_expression(operands)
+            if operator not in ('and', 'or'):
+                raise ValueError(f"Invalid filter operator: {operator}")
+            expressions = [Helpers.filter_expression(operand) for operand in operands]
+            return pl.all_horizontal(expressions) if operator == 'and' else pl.any_horizontal(expressions)
+        if len(patterns) > 0 and isinstance(patterns[0], (list, tuple, dict)):
+            return pl.all_horizontal([Helpers.filter_expression(operand) for operand in patterns])
+        column, op = patterns[0], patterns[1].strip()
+        if op not in filter_handlers:
+            raise ValueError("Invalid operation")
+        value = patterns[2] if len(patterns) > 2 else None
+        return filter_handlers[op](pl.col(column), value)
+
+    @staticmethod
+    def int_to_str(df, columns=None):
+        """Convert the values of the given columns to String, all columns if *columns* is None."""
+        if columns is None:
+            columns = df.columns
+        columns = [col for col in columns if col in df.columns and df.schema[col] != pl.Utf8]
+        if not columns:
+            return df
+        return df.with_columns(pl.col(columns).cast(pl.Utf8))
 
     def pseudo_nlp_mapper(self):
         """Pseudonym mapper for free text. Return df with pseudonyms."""
         self.df = self.df.with_columns(pl.Series(self.field, self.list_))
-        mapping_instance = Mapping(self.df, self.field, count_start=self.counter, output=self.output)
+        mapping_instance = Mapping(self.df, self.field, count_start=self.counter, output=self.output,
+                                   keyring=self.keyring)
+        self.cached_key(mapping_instance)
         if self.map_method == 'faker':
             if self.field in faker_pos_handlers:
                 self.df.insert_column(0, faker_pos_handlers[self.field](mapping_instance))
@@ -694,76 +1428,140 @@ class Helpers:
             if self.map_method in map_method_handlers:
                 # call the pseudonymization methods
                 self.df.insert_column(0, map_method_handlers[self.map_method](mapping_instance))
-        self.df = Helpers.int_to_str(self.df)
         return self.df
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def load_nlp(model="en_core_web_sm"):
+        """Load the spaCy model once per process, the following jobs reuse it."""
+        return spacy.load(model)
+
+    @staticmethod
+    def is_regex_only(pos_type, patterns, all_ne, terms=None):
+        """Return True, if only emails and/or phone numbers are requested, which are found without spaCy."""
+        return patterns is None and terms is None and not all_ne and bool(pos_type) \
+            and set(pos_type) <= set(regex_pos_types.values())
+
+    def regex_mapping(self):
+        """Find emails and phone numbers in a single scan of the combined regex. Digits inside an email address are
+        not taken as phone number. Return organized data as dictionary."""
+        map_dict = {pos: [] for pos in self.pos_type}
+        for match in regex_entity_pattern.finditer(self.text):
+            pos = regex_pos_types[match.lastgroup]
+            if pos in map_dict:
+                map_dict[pos].append(match.group())
+        return map_dict
+
     def entity_mapping(self):
         """Use spaCy and regex for entity categorization. Return organized data as dictionary."""
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        phone_number_pattern = "\\+?[1-9][0-9]{7,14}"
-        doc = self.nlp(self.text)
-        map_dict = dict()
-
-        if self.patterns is not None:
-            if "Others" not in self.pos_type:
-                self.pos_type.append("Others")
-            for pos in self.pos_type:
-                if pos == "Others":
-                    map_dict[pos] = []
-                    matcher = Matcher(self.nlp.vocab)
-                    matcher.add(f"pattern_{uuid.uuid4()}", self.patterns)
-                    matches = matcher(doc)
-
-                    # filter for exact entities in the text and append to the dictionary under "Others"
-                    for match_id, start, end in matches:
-                        span = doc[start:end]
-                        if span.text not in map_dict[pos]:
-                            map_dict[pos].append(span.text)
-                else:
-                    map_dict[f'{pos}'] = []
+        if Helpers.is_regex_only(self.pos_type, self.patterns, self.all_ne, self.terms):
+            return self.regex_mapping()
+        if self.entity_cache is None:
+            spans = self.entity_spans(self.text)
         else:
-            # append other entities specified in pos_type
-            if self.pos_type is not None:
-                for pos in self.pos_type:
-                    map_dict[f'{pos}'] = []
-            # append only named entities if all_ne is True
-            if self.all_ne:
-                map_dict = {'Names': [], 'Locations': [], 'Organizations': []}
-            else:
-                # find all phone numbers and e-mails on request
-                if self.pos_type is not None:
-                    if 'Phone-Numbers' in self.pos_type:
-                        map_dict['Phone-Numbers'].extend(re.findall(phone_number_pattern, self.text, flags=re.IGNORECASE))
-                    if 'Emails' in self.pos_type:
-                        map_dict['Emails'].extend(re.findall(email_pattern, self.text, flags=re.IGNORECASE))
-        # find and append named entities
-        for ent in doc.ents:
-            # if only named entities are requested
-            if self.all_ne and (self.pos_type is None) and (self.patterns is None):
-                if ent.label_ == 'PERSON' and ent.text not in map_dict['Names']:
-                    map_dict['Names'].append(ent.text)
-                elif ent.label_ == 'GPE' and ent.text not in map_dict['Locations']:
-                    map_dict['Locations'].append(ent.text)
-                elif ent.label_ == 'ORG' and ent.text not in map_dict['Organizations']:
-                    map_dict['Organizations'].append(ent.text)
-            # if certain of the named entities are requested
-            if self.pos_type is not None:
-                if 'Names' in self.pos_type and ent.label_ == 'PERSON' and ent.text not in map_dict['Names']:
-                    map_dict['Names'].append(ent.text)
-                elif 'Locations' in self.pos_type and ent.label_ == 'GPE' and ent.text not in map_dict['Locations']:
-                    map_dict['Locations'].append(ent.text)
-                elif 'Organizations' in self.pos_type and ent.label_ == 'ORG' and ent.text not in map_dict['Organizations']:
-                    map_dict['Organizations'].append(ent.text)
-        """
-        count_ent = 0
-        for i in map_dict:
-            count_ent = count_ent + len(map_dict[i])
-        print(f"Count results: {count_ent}")
-        token_count = len(doc)
-        print(f"The number of tokens in the text is: {token_count}")
-        """
+            spans = self.cached_entity_spans()
+        return self.spans_mapping(spans)
+
+    def spans_mapping(self, spans):
+        """Organize the entity spans of a text as dictionary of the entity types and the found entities."""
+        map_dict = {pos: [] for pos in self.entity_types()}
+        # every entity is listed once, found emails and phone numbers are listed as often as they occur
+        found = {pos: set() for pos in map_dict}
+        for pos, text, start, end in spans:
+            if pos in regex_pos_types.values() or text not in found[pos]:
+                map_dict[pos].append(text)
+                found[pos].add(text)
         return map_dict
 
+    def entity_types(self):
+        """Return the entity types of the dictionary of entity_mapping. Custom patterns and terms are 'Others'."""
+        if self.patterns is not None or self.terms is not None:
+            # a new list, the pos_type of the caller is not changed
+            return list(self.pos_type or []) + ([] if "Others" in (self.pos_type or []) else ["Others"])
+        # only named entities if all_ne is True
+        if self.all_ne:
+            return ['Names', 'Locations', 'Organizations']
+        return list(self.pos_type or [])
+
+    def needs_pipeline(self):
+        """Return True, if the statistical pipeline of spaCy has to run. The term list needs the tokens only, the
+        pipeline runs for token patterns and named entities."""
+        named_entities = self.all_ne or any(pos in ner_pos_types.values() for pos in self.pos_type or [])
+        return self.patterns is not None or named_entities
+
+    def entity_spans(self, text, doc=None):
+        """Find the entities of the text with spaCy and regex. Return a list of *[entity type, text, start, end]* in
+        the order they are found, start and end are the character offsets in the text. Pass the doc, if the text is
+        already parsed."""
+        if doc is None:
+            doc = self.nlp(text) if self.needs_pipeline() else self.nlp.make_doc(text)
+        spans = []
+
+        if self.patterns is not None or self.terms is not None:
+            if self.patterns is not None:
+                for match_id, start, end in self.resolve_patterns()(doc):
+                    span = doc[start:end]
+                    spans.append(['Others', span.text, span.start_char, span.end_char])
+            if self.terms is not None:
+                # the longest term wins, if terms overlap
+                for span in filter_spans(self.resolve_terms()[1](doc, as_spans=True)):
+                    spans.append(['Others', span.text, span.start_char, span.end_char])
+        elif not self.all_ne and self.pos_type is not None:
+            # find all phone numbers and e-mails on request with the combined regex, like without spaCy: digits
+            # inside an email address are not taken as phone number
+            for match in regex_entity_pattern.finditer(text):
+                pos = regex_pos_types[match.lastgroup]
+                if pos in self.pos_type:
+                    spans.append([pos, match.group(), match.start(), match.end()])
+        # find named entities, all of them if only named entities are requested, else the requested types
+        for ent in doc.ents:
+            pos = ner_pos_types.get(ent.label_)
+            if pos is None:
+                continue
+            if (self.all_ne and self.pos_type is None and self.patterns is None) or \
+                    (self.pos_type is not None and pos in self.pos_type):
+                spans.append([pos, ent.text, ent.start_char, ent.end_char])
+        return spans
+
+    def pipe_entity_spans(self, texts, batch_size=64):
+        """Find the entities of many texts, which are parsed together with nlp.pipe. Return the entity spans of every
+        text."""
+        if Helpers.is_regex_only(self.pos_type, self.patterns, self.all_ne, self.terms):
+            return [[[regex_pos_types[match.lastgroup], match.group(), match.start(), match.end()]
+                     for match in regex_entity_pattern.finditer(text)
+                     if regex_pos_types[match.lastgroup] in self.pos_type] for text in texts]
+        if self.needs_pipeline():
+            docs = self.nlp.pipe(texts, batch_size=batch_size)
+        else:
+            docs = self.nlp.tokenizer.pipe(texts, batch_size=batch_size)
+        return [self.entity_spans(text, doc) for text, doc in zip(texts, docs)]
+
+    def cached_entity_spans(self):
+        """Find the entities paragraph by paragraph and reuse the entities of known paragraphs from the entity cache,
+        so that spaCy runs only on new paragraphs. Return the entity spans with the offsets in the whole text."""
+        terms_digest = self.resolve_terms()[0] if self.terms is not None else None
+        config = self.entity_cache.config_key(self.nlp, self.entity_types(), self.all_ne, self.patterns, terms_digest)
+        spans = []
+        start = 0
+        for separator in list(re.finditer(r'\n[ \t]*\n', self.text)) + [None]:
+            end = separator.start() if separator is not None else len(self.text)
+            paragraph = self.text[start:end]
+            if paragraph.strip():
+                key = self.entity_cache.key(config, paragraph)
+                paragraph_spans = self.entity_cache.get(key)
+                if paragraph_spans is None:
+                    paragraph_spans = self.entity_spans(paragraph)
+                    self.entity_cache.put(key, paragraph_spans)
+                spans.extend([pos, text, start + span_start, start + span_end]
+                             for pos, text, span_start, span_end in paragraph_spans)
+            if separator is not None:
+                start = separator.end()
+        return spans
+
+
+class JobCancelled(Exception):
+    """Raised when a job is stopped through the cancel event."""
+
 
 class Aggregation:
     """Class for data aggregation.
@@ -867,7 +1665,7 @@ class KAnonymity:
     Parameters
     ----------
     df : Pandas Dataframe
-        Input data.
+        Input data. Polars Dataframes are supported by mondrian.
     k : int
         The level of anonymity. Each row in the data must be matched to at least k other rows.
     depths : dict
@@ -877,21 +1675,26 @@ class KAnonymity:
         string data must be masked in most cases, unless it has also been k-anonymized externally beforehand.
     output : str
         Path to output folder.
+    quasi_identifiers : list
+        Columns, which are generalized by mondrian. Optional, all numeric columns by default.
     """
 
-    def __init__(self, df, k, depths=None, mask_others=False, output=None):
+    def __init__(self, df, k, depths=None, mask_others=False, output=None, quasi_identifiers=None):
         self.df = df
         self.depths = depths
         self.k = k
         self.mask_others = mask_others
         self.output = output
+        self.quasi_identifiers = quasi_identifiers
+        self.metrics = None
 
     def k_anonymity(self):
         """k-anonymize the data by providing the dataframe, k, depths of anonymization.
 
         Returns
         -------
-        k-anonymized Dataframe or output to file, if the output path is passed.
+        k-anonymized Dataframe or output to file, if the output path is passed. The number of suppressed rows is stored
+        in *metrics*.
 
         Example
         -------
@@ -933,12 +1736,140 @@ class KAnonymity:
                 num_columns.append(key)
         # filter data with at least k records
         grouped = self.df.groupby(num_columns).filter(lambda x: len(x) >= self.k)
+        self.metrics = {'rows': len(self.df), 'suppressed': len(self.df) - len(grouped)}
         if self.output is None:
             return grouped
         else:
             grouped.to_csv(f'{self.output}/k_anonym_output.csv', index=False)
             return grouped
 
+    def mondrian(self):
+        """k-anonymize the data with greedy Mondrian partitioning. Every partition of at least 2k rows is split at the
+        median of the quasi-identifier with the widest normalized range, until no partition can be split. The values
+        of the quasi-identifiers are generalized to the range *min..max* (numbers), the ISO 8601 interval *min/max*
+        (dates, datetimes and times) or to the sorted distinct values (other columns) of their partition, so only the
+        rows with empty quasi-identifiers are suppressed. All
+        partitions of a level are split at once with vectorized group aggregations, the rows are ranked once and the
+        number of levels grows with log(n / k).
+
+        Returns
+        -------
+        k-anonymized Polars Dataframe or output to file, if the output path is passed. The information loss is stored
+        in *metrics*: the suppressed rows, the number and minimum size of the equivalence classes, the discernibility
+        metric, the normalized average class size and the normalized certainty penalty *ncp* (0: no loss, 1: every
+        value generalized to its whole column).
+
+        Example
+        -------
+        k-anonymize age and salary data with k of 5.
+        ::
+            >>> import pseudPy.Pseudonymization as pseudPy
+            >>> df = pl.read_csv('/path/to/input.csv')
+            >>> k_anonymity = pseudPy.KAnonymity(
+            >>>             df=df,
+            >>>             k=5,
+            >>>             quasi_identifiers=['age', 'salary', 'zip'])
+            >>>
+            >>> grouped = k_anonymity.mondrian()
+            >>> print(k_anonymity.metrics)
+        """
+        df = self.df if isinstance(self.df, pl.DataFrame) else pl.from_pandas(self.df)
+        numeric = [col for col, dtype in df.schema.items() if dtype.is_numeric()]
+        temporal = [col for col, dtype in df.schema.items() if dtype.is_temporal() and dtype != pl.Duration]
+        quasi_identifiers = list(self.quasi_identifiers) if self.quasi_identifiers is not None else numeric
+        if self.mask_others:
+            df = df.drop([col for col in df.columns if col not in numeric and col not in quasi_identifiers])
+        columns = df.columns
+        rows = df.height
+        valid = df.with_row_index('__row').filter(pl.all_horizontal(pl.col(quasi_identifiers).is_not_null()))
+
+        # the width of a partition is the value range of numbers and temporal values and the range of the dense rank
+        # of other values, the split uses the ordinal rank, which orders equal values by position and cuts at the exact
+        # median
+        widths, ranks = [], []
+        for i, col in enumerate(quasi_identifiers):
+            if col in numeric or col in temporal:
+                value = pl.col(col).to_physical().cast(pl.Float64)
+            else:
+                value = pl.col(col).rank('dense').cast(pl.Float64)
+            widths.append(value.alias(f'__w{i}'))
+            ranks.append(pl.col(col).rank('ordinal').cast(pl.Int64).alias(f'__o{i}'))
+        valid = valid.with_columns(widths + ranks).with_columns(pl.lit(0, pl.Int64).alias('__part'))
+        total_widths = valid.select([(pl.col(f'__w{i}').max() - pl.col(f'__w{i}').min()).alias(f'__w{i}')
+                                     for i in range(len(quasi_identifiers))]).row(0) if valid.height else []
+
+        # the partition of a row is numbered within its level, part * 2 and part * 2 + 1 are its halves
+        done = []
+        level = 0
+        while valid.height > 0:
+            stats = valid.group_by('__part').agg(
+                [pl.len().alias('__len')]
+                + [((pl.col(f'__w{i}').max() - pl.col(f'__w{i}').min()) / width if width else pl.lit(0.0))
+                   .alias(f'__s{i}') for i, width in enumerate(total_widths)]
+                + [pl.col(f'__o{i}').quantile(0.5, 'lower').cast(pl.Int64).alias(f'__m{i}')
+                   for i in range(len(quasi_identifiers))])
+            spans = [f'__s{i}' for i in range(len(quasi_identifiers))]
+            stats = stats.with_columns(
+                pl.concat_list(spans).list.arg_max().alias('__dim'),
+                ((pl.col('__len') >= 2 * self.k) & (pl.max_horizontal(spans) > 0)).alias('__split'))
+            # the partitions, which cannot be split, are final
+            final = stats.filter(~pl.col('__split'))['__part']
+            done.append(valid.filter(pl.col('__part').is_in(final)).with_columns(pl.lit(level).alias('__level')))
+            stats = stats.filter(pl.col('__split'))
+            if stats.height == 0:
+                break
+            median = pl.when(pl.col('__dim') == 0).then(pl.col('__m0'))
+            key = pl.when(pl.col('__dim') == 0).then(pl.col('__o0'))
+            for i in range(1, len(quasi_identifiers)):
+                median = median.when(pl.col('__dim') == i).then(pl.col(f'__m{i}'))
+                key = key.when(pl.col('__dim') == i).then(pl.col(f'__o{i}'))
+            valid = valid.join(stats.select('__part', '__dim', median.alias('__median')), on='__part')
+            valid = valid.with_columns((pl.col('__part') * 2 + (key > pl.col('__median')).cast(pl.Int64))
+                                       .alias('__part')).drop('__dim', '__median')
+            level = level + 1
+
+        partitions = pl.concat(done) if done else valid.with_columns(pl.lit(level).alias('__level'))
+        generalized = []
+        penalties = []
+        for i, col in enumerate(quasi_identifiers):
+            low, high = pl.col(col).min(), pl.col(col).max()
+            if col in numeric:
+                generalized.append(pl.when(low == high).then(low.cast(pl.Utf8))
+                                   .otherwise(pl.concat_str([low.cast(pl.Utf8), high.cast(pl.Utf8)], separator='..'))
+                                   .alias(col))
+            elif col in temporal:
+                generalized.append(pl.when(low == high).then(low.cast(pl.Utf8))
+                                   .otherwise(pl.concat_str([low.cast(pl.Utf8), high.cast(pl.Utf8)], separator='/'))
+                                   .alias(col))
+            else:
+                generalized.append(pl.col(col).unique().sort().cast(pl.Utf8).str.concat(',').alias(col))
+            width = total_widths[i] if total_widths else 0
+            penalties.append(((pl.col(f'__w{i}').max() - pl.col(f'__w{i}').min()) / width if width else pl.lit(0.0))
+                             .alias(f'__p{i}'))
+        # only a partition of less than k rows, if all rows are less than k, is suppressed
+        classes = partitions.group_by('__level', '__part').agg([pl.len().alias('__len')] + generalized + penalties) \
+            .filter(pl.col('__len') >= self.k)
+        grouped = partitions.drop(quasi_identifiers).join(classes.select(['__level', '__part'] + quasi_identifiers),
+                                                          on=['__level', '__part']).sort('__row').select(columns)
+
+        # partitions with the same generalization form one equivalence class
+        sizes = grouped.group_by(quasi_identifiers).len()['len'] if grouped.height else pl.Series('len', [],
+                                                                                                   dtype=pl.UInt32)
+        penalty = classes.select((pl.mean_horizontal([f'__p{i}' for i in range(len(quasi_identifiers))])
+                                  * pl.col('__len')).sum()).item() if grouped.height and quasi_identifiers else 0.0
+        self.metrics = {
+            'rows': rows,
+            'suppressed': rows - grouped.height,
+            'classes': sizes.len(),
+            'min_class_size': sizes.min(),
+            'discernibility': int((sizes.cast(pl.Int64) ** 2).sum()) + (rows - grouped.height) * rows,
+            'avg_class_size': round(grouped.height / sizes.len() / self.k, 3) if sizes.len() else None,
+            'ncp': round(penalty / grouped.height, 4) if grouped.height else None,
+        }
+        if self.output is not None:
+            grouped.write_csv(f'{self.output}/k_anonym_output.csv')
+        return grouped
+
     def is_k_anonymized(self):
         """Check if the data is k-anonymous.
 
@@ -970,6 +1901,8 @@ class KAnonymity:
 map_method_handlers = {
     'counter': Mapping.counter_tier,
     'encrypt': Mapping.encrypt_tier,
+    'aes-siv': Mapping.siv_tier,
+    'fpe': Mapping.fpe_tier,
     'decrypt': Mapping.decrypt_tier,
     'random1': Mapping.random1_tier,
     'random4': Mapping.random4_tier,
@@ -983,6 +1916,47 @@ map_method_handlers = {
     'faker-org': Mapping.faker_org_tier
 }
 
+# entity types of the spaCy labels
+ner_pos_types = {
+    'PERSON': 'Names',
+    'GPE': 'Locations',
+    'ORG': 'Organizations'
+}
+
+# regex of the entities, which are found without spaCy
+email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+phone_number_pattern = "\\+?[1-9][0-9]{7,14}"
+
+# named groups of the combined regex and their entity types, emails are matched first
+regex_pos_types = {
+    'Emails': 'Emails',
+    'Phone_Numbers': 'Phone-Numbers'
+}
+
+regex_entity_pattern = re.compile(f'(?P<Emails>{email_pattern})|(?P<Phone_Numbers>{phone_number_pattern})',
+                                  flags=re.IGNORECASE)
+
+# methods, which need the mapped columns as String
+str_map_methods = ['encrypt', 'aes-siv', 'fpe', 'hash', 'hash-salt']
+
+# methods, which encrypt with a secret key, and the scheme stored in the key file
+key_map_methods = {
+    'encrypt': None,
+    'aes-siv': 'aes-siv',
+    'fpe': 'fpe'
+}
+
+# encryption and decryption of the schemes, which are stored in the key file
+encrypt_scheme_handlers = {
+    'aes-siv': Mapping.siv_encrypt,
+    'fpe': Mapping.fpe_encrypt
+}
+
+decrypt_scheme_handlers = {
+    'aes-siv': Mapping.siv_decrypt,
+    'fpe': Mapping.fpe_decrypt
+}
+
 faker_pos_handlers = {
     'Names': Mapping.faker_names_tier,
     'Locations': Mapping.faker_location_tier,
@@ -992,6 +1966,24 @@ faker_pos_handlers = {
     'Others': Mapping.faker_rand_word_tier
 }
 
+filter_handlers = {
+    '==': lambda col, value: col == value,
+    '!=': lambda col, value: col != value,
+    '>': lambda col, value: col > value,
+    '>=': lambda col, value: col >= value,
+    '<': lambda col, value: col < value,
+    '<=': lambda col, value: col <= value,
+    'in': lambda col, value: col.is_in(value),
+    'not_in': lambda col, value: ~col.is_in(value),
+    'between': lambda col, value: col.is_between(value[0], value[1]),
+    'is_null': lambda col, value: col.is_null(),
+    'is_not_null': lambda col, value: col.is_not_null(),
+    'contains': lambda col, value: col.str.contains(value, literal=True),
+    'starts_with': lambda col, value: col.str.starts_with(value),
+    'ends_with': lambda col, value: col.str.ends_with(value),
+    'matches': lambda col, value: col.str.contains(value)
+}
+
 group_handlers = {
     'number': Aggregation.group_num,
     'dates-to-years': Aggregation.group_dates_to_years
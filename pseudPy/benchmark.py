@@ -0,0 +1,85 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import polars as pl
+import Pseudonymization as pseudPy
+
+
+def benchmark(map_method, df, column):
+    """Encrypt and decrypt the column with the map method, return the values per second of both directions."""
+    mapping = pseudPy.Mapping(df, first_tier=column)
+    mapping.generate_keys(write=False, scheme=pseudPy.key_map_methods[map_method])
+
+    start = time.perf_counter()
+    encrypted = pseudPy.map_method_handlers[map_method](mapping)
+    encrypt_time = time.perf_counter() - start
+
+    mapping.df = pl.DataFrame(encrypted.alias(column))
+    start = time.perf_counter()
+    decrypted = pseudPy.Mapping.decrypt_tier(mapping)
+    decrypt_time = time.perf_counter() - start
+
+    if not (decrypted == df[column]).all():
+        print(f"Error: {map_method} did not decrypt to the original values.")
+    return df.height / encrypt_time, df.height / decrypt_time
+
+
+def benchmark_pipeline(map_method, input_file, chunk_size, workers, processes=None):
+    """Pseudonymize the input file chunk by chunk with the serial and the pipelined processing, and sharded on
+    processes if given. Return the rows per second of each."""
+    rates = []
+    options = [{'chunk_size': chunk_size}, {'chunk_size': chunk_size, 'workers': workers}]
+    if processes:
+        options.append({'processes': processes})
+    for option in options:
+        with tempfile.TemporaryDirectory() as output:
+            pseudo = pseudPy.Pseudonymization(map_method, 'id', input_file=input_file, output=output, **option)
+            start = time.perf_counter()
+            pseudo.pseudonym()
+            rates.append(pl.scan_csv(input_file).select(pl.len()).collect().item() / (time.perf_counter() - start))
+    return rates
+
+
+def main(rows, digits, methods, seed, pipeline=False, chunk_size=100000, workers=4, processes=None):
+    rng = random.Random(seed)
+    df = pl.DataFrame({'id': [str(rng.randrange(10 ** digits)).zfill(digits) for _ in range(rows)]})
+    print(f"{rows} values with {digits} digits")
+    if pipeline:
+        print(f"chunks of {chunk_size} rows, {workers} workers")
+        with tempfile.TemporaryDirectory() as folder:
+            input_file = os.path.join(folder, 'input.csv')
+            df.with_columns(pl.int_range(0, rows).alias('row'), pl.col('id').str.reverse().alias('other')) \
+                .write_csv(input_file)
+            for map_method in methods:
+                rates = benchmark_pipeline(map_method, input_file, chunk_size, workers, processes)
+                sharded = f", {processes} shards {rates[2]:>12,.0f} rows/s" if processes else ''
+                print(f"{map_method:>10}: serial {rates[0]:>12,.0f} rows/s, pipelined {rates[1]:>12,.0f} "
+                      f"rows/s{sharded}")
+        return
+    for map_method in methods:
+        encrypt_rate, decrypt_rate = benchmark(map_method, df, 'id')
+        print(f"{map_method:>10}: encrypt {encrypt_rate:>12,.0f} values/s, decrypt {decrypt_rate:>12,.0f} values/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pseudonymization methods on a column of numeric IDs.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--digits', type=int, default=10)
+    parser.add_argument('--methods', nargs='+', default=['fpe', 'aes-siv', 'encrypt'],
+                        choices=[method for method in pseudPy.map_method_handlers if method != 'decrypt'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pipeline', action='store_true',
+                        help='compare the serial and the pipelined chunk processing of a csv file instead')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='also pseudonymize the file sharded on this number of processes')
+    args = parser.parse_args()
+    if not args.pipeline and any(method not in pseudPy.key_map_methods for method in args.methods):
+        parser.error(f"only {', '.join(pseudPy.key_map_methods)} can be decrypted, use --pipeline for the other methods")
+
+    main(args.rows, args.digits, args.methods, args.seed, args.pipeline, args.chunk_size, args.workers,
+         args.processes)
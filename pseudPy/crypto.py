@@ -0,0 +1,371 @@
+import functools
+import hashlib
+import io
+import json
+import numpy as np
+import polars as pl
+import os
+import threading
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.backends import default_backend
+
+
+class FF3Cipher:
+    """Format-preserving encryption with FF3-1 (NIST SP 800-38G Rev. 1) over a fixed alphabet.
+
+    The ciphers of the last used keys and tweaks are kept, whole columns are encrypted with numpy in batches: all
+    blocks of a Feistel round go through a single AES call. Every thread uses its own AES encryptor, so a cipher can
+    be shared by the workers of a Pipeline. Numeral strings below the FF3-1 minimum domain size (e.g. less than 6
+    digits) are still permuted, but with weaker protection.
+    """
+    batch_size = 65536
+
+    def __init__(self, key, tweak, alphabet):
+        self.alphabet = alphabet
+        self.radix = len(alphabet)
+        # FF3-1 uses the byte-reversed key and splits the 56-bit tweak into two 32-bit halves
+        self.algorithm = algorithms.AES(key[::-1])
+        self.local = threading.local()
+        self.tweak_left = np.array([tweak[0], tweak[1], tweak[2], tweak[3] & 0xF0], dtype=np.uint8)
+        self.tweak_right = np.array([tweak[4], tweak[5], tweak[6], (tweak[3] & 0x0F) << 4], dtype=np.uint8)
+        self.numerals = np.zeros(256, dtype=np.uint8)
+        self.numerals[np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)] = np.arange(self.radix)
+        self.symbols = np.frombuffer(alphabet.encode('ascii'), dtype=np.uint8)
+
+    @property
+    def encryptor(self):
+        """Return the AES-ECB encryptor of the current thread, an encryptor context is not shared between threads."""
+        encryptor = getattr(self.local, 'encryptor', None)
+        if encryptor is None:
+            encryptor = Cipher(self.algorithm, modes.ECB(), backend=default_backend()).encryptor()
+            self.local.encryptor = encryptor
+        return encryptor
+
+    @staticmethod
+    def cached(key, column, alphabet):
+        """Return the cipher of the key, column and alphabet. The tweak is derived from the column name."""
+        tweak = hashlib.sha256(f'{column}:{alphabet}'.encode('utf-8')).digest()[:7]
+        return FF3Cipher.create(key, tweak, alphabet)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def create(key, tweak, alphabet):
+        """Return the cipher of the key and tweak, the 64 last used ciphers are kept in memory."""
+        return FF3Cipher(key, tweak, alphabet)
+
+    def round_value(self, tweak, i, numbers, modulus):
+        """Return y = NUM(REVB(AES(REVB(W xor i || NUM(REV(B)))))) mod radix^m for all rows."""
+        # the byte-reversed input block is the number in little-endian order followed by the reversed tweak half
+        blocks = np.empty((len(numbers), 2), dtype='<u8')
+        blocks[:, 0] = numbers
+        blocks[:, 1] = int.from_bytes(bytes([0, 0, 0, 0, tweak[3] ^ i, tweak[2], tweak[1], tweak[0]]), 'little')
+        encrypted = bytearray(blocks.nbytes + 15)
+        self.encryptor.update_into(blocks.reshape(-1).view(np.uint8), encrypted)
+        # the reversed output is a little-endian 128-bit number, reduce it limb by limb
+        limb_type = '<u4' if modulus < 2 ** 32 else 'u1'
+        limbs = np.frombuffer(encrypted, dtype=limb_type, count=blocks.nbytes // np.dtype(limb_type).itemsize)
+        limbs = limbs.reshape(len(numbers), -1)
+        base, modulus = np.uint64(2 ** (8 * limbs.itemsize)), np.uint64(modulus)
+        y = np.zeros(len(numbers), dtype=np.uint64)
+        for j in reversed(range(limbs.shape[1])):
+            y = (y * base + limbs[:, j]) % modulus
+        return y
+
+    def transform(self, numerals, decrypt=False):
+        """Encrypt or decrypt a 2D array of numerals, one row per value of the same length."""
+        if len(numerals) > self.batch_size:
+            # batches, which fit into the CPU cache, are faster than one pass over all rows
+            return np.vstack([self.transform(numerals[start:start + self.batch_size], decrypt)
+                              for start in range(0, len(numerals), self.batch_size)])
+        n = numerals.shape[1]
+        u, v = (n + 1) // 2, n // 2
+        if self.radix ** u >= 2 ** 56:
+            return np.array([self.transform_scalar(row, decrypt) for row in numerals.tolist()], dtype=np.uint8)
+        powers = self.radix ** np.arange(u, dtype=np.uint64)
+        # the halves are kept as numbers NUM(REV(X)), since NUM(REV(REV(STR(c)))) = c for every round
+        a = (numerals[:, :u].astype(np.uint64) * powers[:u]).sum(axis=1, dtype=np.uint64)
+        b = (numerals[:, u:].astype(np.uint64) * powers[:v]).sum(axis=1, dtype=np.uint64)
+        for i in (reversed(range(8)) if decrypt else range(8)):
+            m, tweak = (u, self.tweak_right) if i % 2 == 0 else (v, self.tweak_left)
+            modulus = np.uint64(self.radix ** m)
+            if decrypt:
+                c = b + modulus - self.round_value(tweak, i, a, self.radix ** m)
+                a, b = np.where(c >= modulus, c - modulus, c), a
+            else:
+                c = a + self.round_value(tweak, i, b, self.radix ** m)
+                a, b = b, np.where(c >= modulus, c - modulus, c)
+        # split the numbers into numerals, 32-bit division is faster if the numbers are small enough
+        number_type = np.uint32 if self.radix ** u < 2 ** 32 else np.uint64
+        powers, radix = powers.astype(number_type), number_type(self.radix)
+        return np.hstack([((a.astype(number_type)[:, None] // powers[:u]) % radix).astype(np.uint8),
+                          ((b.astype(number_type)[:, None] // powers[:v]) % radix).astype(np.uint8)])
+
+    def transform_scalar(self, numerals, decrypt=False):
+        """Encrypt or decrypt a single list of numerals with Python integers, used for very long values."""
+        n = len(numerals)
+        u, v = (n + 1) // 2, n // 2
+
+        def num(x):
+            return sum(d * self.radix ** j for j, d in enumerate(x))
+
+        def digits(c, m):
+            return [(c // self.radix ** j) % self.radix for j in range(m)]
+
+        def round_value(tweak, i, number, modulus):
+            block = bytes(tweak[:3]) + bytes([tweak[3] ^ i]) + number.to_bytes(12, 'big')
+            return int.from_bytes(self.encryptor.update(block[::-1])[::-1], 'big') % modulus
+
+        a, b = numerals[:u], numerals[u:]
+        for i in (reversed(range(8)) if decrypt else range(8)):
+            m, tweak = (u, self.tweak_right) if i % 2 == 0 else (v, self.tweak_left)
+            modulus = self.radix ** m
+            if decrypt:
+                c = (num(b) - round_value(tweak, i, num(a), modulus)) % modulus
+                a, b = digits(c, m), a
+            else:
+                c = (num(a) + round_value(tweak, i, num(b), modulus)) % modulus
+                a, b = b, digits(c, m)
+        return a + b
+
+    def transform_strings(self, series, decrypt=False):
+        """Encrypt or decrypt a Series of strings, which consist only of alphabet characters.
+        Values are grouped by length and each group is processed as one batch."""
+        result = series.clone()
+        lengths = series.str.len_chars()
+        for n in lengths.unique().drop_nulls().to_list():
+            if n == 0:
+                continue
+            indices = (lengths == n).arg_true()
+            values = series.gather(indices).str.concat(delimiter='').item().encode('ascii')
+            numerals = self.numerals[np.frombuffer(values, dtype=np.uint8)].reshape(-1, n)
+            encrypted = self.symbols[self.transform(numerals, decrypt)].tobytes()
+            result.scatter(indices, pl.Series(np.frombuffer(encrypted, dtype=f'S{n}')).cast(pl.Utf8))
+        return result
+
+    @staticmethod
+    def transform_series(series, key, column, decrypt=False):
+        """Encrypt or decrypt a Series of strings while keeping length and format: digits, lower case and upper case
+        letters are each encrypted within their own alphabet, other characters stay at their position."""
+        series = series.cast(pl.Utf8)
+        for alphabet in fpe_alphabets:
+            # fast path: all values consist of a single alphabet
+            if series.drop_nulls().str.contains(f'^[{alphabet}]*$').all():
+                return FF3Cipher.cached(key, column, alphabet).transform_strings(series, decrypt)
+        values = series.to_list()
+        chars = [list(value) if value is not None else None for value in values]
+        for alphabet in fpe_alphabets:
+            symbols = set(alphabet)
+            positions = [[j for j, char in enumerate(value) if char in symbols] if value is not None else []
+                         for value in values]
+            selected = pl.Series([''.join(value[j] for j in pos) for value, pos in zip(values, positions)
+                                  if value is not None], dtype=pl.Utf8)
+            encrypted = iter(FF3Cipher.cached(key, column, alphabet).transform_strings(selected, decrypt).to_list())
+            for char_list, pos in zip(chars, positions):
+                if char_list is not None:
+                    for j, char in zip(pos, next(encrypted)):
+                        char_list[j] = char
+        return pl.Series(series.name, [''.join(char_list) if char_list is not None else None
+                                       for char_list in chars], dtype=pl.Utf8)
+
+
+class MappingContainer:
+    """Encrypted binary container for mapping tables. The table is split into Arrow IPC streams of *batch_size* rows,
+    compressed with zstd and each encrypted with AES-GCM. The column name and the position of the batch are
+    authenticated, so swapped or modified batches are detected on reading.
+
+    Layout: the magic bytes, followed by frames of a 4-byte length, a 12-byte nonce and the ciphertext with tag.
+    """
+    magic = b'PSEUDPY\x01'
+    batch_size = 65536
+
+    @staticmethod
+    def associated_data(column, index):
+        return MappingContainer.magic + column.encode('utf-8') + index.to_bytes(8, 'big')
+
+    @staticmethod
+    def count_frames(file):
+        """Return the number of frames in an open container file and move to its end."""
+        file.seek(len(MappingContainer.magic))
+        count = 0
+        length = file.read(4)
+        while length:
+            file.seek(int.from_bytes(length, 'big'), os.SEEK_CUR)
+            count = count + 1
+            length = file.read(4)
+        return count
+
+    @staticmethod
+    def write(path, df, key, column, append=False):
+        """Write the mapping table to the container, append further batches if append is True.
+        Return the number of written bytes."""
+        cipher = AESGCM(key)
+        with open(path, 'r+b' if append and os.path.exists(path) else 'wb') as file:
+            if file.mode == 'wb':
+                file.write(MappingContainer.magic)
+                index = 0
+            else:
+                index = MappingContainer.count_frames(file)
+            start = file.tell()
+            for batch in df.iter_slices(MappingContainer.batch_size):
+                buffer = io.BytesIO()
+                batch.write_ipc_stream(buffer, compression='zstd')
+                nonce = os.urandom(12)
+                frame = nonce + cipher.encrypt(nonce, buffer.getvalue(),
+                                               MappingContainer.associated_data(column, index))
+                file.write(len(frame).to_bytes(4, 'big') + frame)
+                index = index + 1
+            return file.tell() - start
+
+    @staticmethod
+    def read(path, key, column):
+        """Decrypt the container batch by batch. Yield Polars DataFrames."""
+        cipher = AESGCM(key)
+        with open(path, 'rb') as file:
+            if file.read(len(MappingContainer.magic)) != MappingContainer.magic:
+                raise ValueError(f"{path} is not a mapping container.")
+            index = 0
+            length = file.read(4)
+            while length:
+                frame = file.read(int.from_bytes(length, 'big'))
+                data = cipher.decrypt(frame[:12], frame[12:], MappingContainer.associated_data(column, index))
+                yield pl.read_ipc_stream(io.BytesIO(data))
+                index = index + 1
+                length = file.read(4)
+
+
+class Keyring:
+    """Versioned secret keys of all columns in one JSON file. Every keyring file is loaded once per process.
+
+    Parameters
+    ----------
+    path : str
+        Path to the keyring file. Created on the first saved key.
+
+    The file has the form *{"columns": {column: {"current": version, "keys": {version: "scheme:hex_key"}}}}*, where
+    no scheme prefix stands for AES-ECB like in the single key files.
+    """
+    keyrings = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.columns = json.load(file)['columns']
+
+    @classmethod
+    def load(cls, path):
+        """Return the keyring of the file, read from disk only on the first call."""
+        path = os.path.abspath(path)
+        if path not in cls.keyrings:
+            cls.keyrings[path] = cls(path)
+        return cls.keyrings[path]
+
+    def add_key(self, column, key, scheme=None, current=True):
+        """Add a new key version for the column and return the version."""
+        entry = self.columns.setdefault(column, {'current': None, 'keys': {}})
+        version = str(max([int(v) for v in entry['keys']], default=0) + 1)
+        entry['keys'][version] = key.hex() if scheme is None else f'{scheme}:{key.hex()}'
+        if current:
+            entry['current'] = version
+        return version
+
+    def get_key(self, column, version=None):
+        """Return the key and the scheme of the column, the current version if no version is passed."""
+        entry = self.columns[column]
+        hex_key = entry['keys'][str(version or entry['current'])]
+        scheme = None
+        if ':' in hex_key:
+            scheme, hex_key = hex_key.split(':', 1)
+        return bytes.fromhex(hex_key), scheme
+
+    def save(self):
+        """Write the keyring atomically, readable only by the owner."""
+        temp_path = f'{self.path}.tmp'
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump({'columns': self.columns}, file, indent=2)
+        os.replace(temp_path, self.path)
+
+    def rotate(self, mapping_files, key_dir=None, scheme=False, chunk_size=100000):
+        """Re-encrypt the original values of mapping files from the current key of their column to a new key version.
+        The files are streamed chunk by chunk into a temporary file, which replaces the mapping file. The new version
+        becomes current after all files of the column are rewritten.
+
+        Parameters
+        ----------
+        mapping_files : list
+            Paths to the mapping files *mapping_output_<column>.csv*.
+        key_dir : str
+            Folder of the single key files *secure_key_<column>.txt*, used for columns without a keyring entry, e.g.
+            to move them into the keyring. Optional.
+        scheme : str
+            Encryption scheme of the new keys, e.g. *'aes-siv'*. None for AES-ECB, False keeps the scheme. Keys of the
+            *'fpe'* scheme encrypt the output instead of mapping files and cannot be rotated.
+        chunk_size : int
+            Number of rows read and re-encrypted at once.
+
+        Returns
+        -------
+        Dictionary with the new key version of every column.
+        """
+        columns = {}
+        for path in mapping_files:
+            column = os.path.basename(path)[len('mapping_output_'):-len('.csv')]
+            columns.setdefault(column, []).append(path)
+
+        # all keys are checked before the first column is rotated
+        old_mappings = {}
+        for column in columns:
+            old_mapping = core.Mapping(pl.DataFrame(), first_tier=column, output=key_dir,
+                                       keyring=self.path if column in self.columns else None)
+            old_mapping.read_key()
+            if 'fpe' in [old_mapping.scheme, scheme]:
+                raise ValueError(f"The key of column {column} cannot be rotated: the fpe scheme encrypts the output, "
+                                 f"not the mapping files.")
+            old_mappings[column] = old_mapping
+
+        versions = {}
+        for column, paths in columns.items():
+            old_mapping = old_mappings[column]
+            new_scheme = old_mapping.scheme if scheme is False else scheme
+            version = self.add_key(column, os.urandom(64 if new_scheme == 'aes-siv' else 32), new_scheme, current=False)
+            # the new version is saved before any mapping file is rewritten, so that every file on disk stays
+            # decryptable, even if the process stops during the rotation
+            self.save()
+            new_mapping = core.Mapping(pl.DataFrame(), first_tier=column, keyring=self.path, key_version=version)
+
+            try:
+                for path in paths:
+                    reader = pl.read_csv_batched(path, batch_size=chunk_size, infer_schema_length=0)
+                    with open(f'{path}.tmp', 'wb') as file:
+                        include_header = True
+                        batches = reader.next_batches(1)
+                        while batches:
+                            batch = batches[0]
+                            batch = batch.with_columns(
+                                new_mapping.encrypt_column(old_mapping.decrypt_column(batch[column])).alias(column))
+                            batch.write_csv(file, include_header=include_header)
+                            include_header = False
+                            batches = reader.next_batches(1)
+                for path in paths:
+                    os.replace(f'{path}.tmp', path)
+            finally:
+                for path in paths:
+                    if os.path.exists(f'{path}.tmp'):
+                        os.remove(f'{path}.tmp')
+            self.columns[column]['current'] = version
+            self.save()
+            versions[column] = version
+        return versions
+
+
+# alphabets of the format-preserving encryption, other characters are not encrypted
+fpe_alphabets = ['0123456789', 'abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ']
+
+
+# the core module imports the classes of this module, so it is imported after they are defined
+if __package__:
+    from . import Pseudonymization as core
+else:
+    import Pseudonymization as core
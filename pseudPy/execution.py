@@ -0,0 +1,802 @@
+import asyncio
+import functools
+import glob
+import hashlib
+import io
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import polars as pl
+import os
+import queue
+import threading
+import re
+import shutil
+import tempfile
+
+if __package__:
+    from .sinks import OutputSink, LocalSink
+    from .stats import PipelineStats
+else:
+    from sinks import OutputSink, LocalSink
+    from stats import PipelineStats
+
+
+class CounterAllocator:
+    """Hand out non-overlapping blocks of counter values, e.g. to the chunks of a pipeline or the shards of a file.
+    The blocks follow each other in the order of the calls, so the pseudonyms match the serial numbering, if every
+    block has the exact number of mapped values. Larger blocks leave gaps, but can be reserved without evaluating the
+    patterns. Thread-safe.
+
+    Parameters
+    ----------
+    start : int
+        First counter value.
+    """
+    modes = ['serial', 'fast']
+
+    def __init__(self, start=0):
+        self.next_start = start
+        self.lock = threading.Lock()
+
+    def allocate(self, count):
+        """Reserve a block of count values. Return the first value of the block."""
+        with self.lock:
+            start = self.next_start
+            self.next_start = start + count
+            return start
+
+    @staticmethod
+    def block_size(pseudo, df, condition=None):
+        """Return the number of counter values of a chunk in the block of every column: the mapped rows in the serial
+        mode, the rows in the fast mode."""
+        rows = df.height
+        if pseudo.counter_mode == 'serial' and condition is not None:
+            rows = df.select(condition).to_series().fill_null(False).sum()
+        return rows
+
+
+class Pipeline:
+    """Pipelined processing of the chunks of a job. A reader thread reads the batches of the input file, the workers
+    pseudonymize them and a writer thread writes the output and mapping files in the order of the input. The queues
+    are bounded and at most *2 * workers + 1* batches are in memory at once.
+
+    Parameters
+    ----------
+    pseudo : Pseudonymization
+        The job, which provides the input, the parameters, the progress callback and the cancel event.
+    columns : list
+        Columns with at least one value, the other columns are dropped.
+    total : int
+        Number of rows of the input file, for the progress.
+    workers : int
+        Number of worker threads.
+    counter_stride : int
+        Size of the block of counter values of every column, see Pseudonymization.counter_stride. Optional.
+    """
+
+    def __init__(self, pseudo, columns, total, workers, counter_stride=None):
+        self.pseudo = pseudo
+        self.columns = columns
+        self.total = total
+        self.workers = workers
+        self.counter_stride = counter_stride
+        self.read_queue = queue.Queue(maxsize=workers)
+        self.write_queue = queue.Queue(maxsize=workers)
+        self.in_flight = threading.Semaphore(2 * workers + 1)
+        self.first_done = threading.Event()
+        self.stop = threading.Event()
+        self.error = None
+        self.outputs = []
+
+    def run(self):
+        """Start the threads and wait for the end of the job. Return the outputs of the chunks, if no output
+        parameter is passed. Errors of the threads and cancellation are raised here."""
+        threads = [threading.Thread(target=self.read, daemon=True)]
+        threads += [threading.Thread(target=self.transform, daemon=True) for _ in range(self.workers)]
+        threads.append(threading.Thread(target=self.write, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.outputs
+
+    def fail(self, error):
+        """Keep the first error and stop all threads."""
+        if self.error is None:
+            self.error = error
+        self.stop.set()
+
+    def wait(self, function):
+        """Call the blocking function with a timeout until it succeeds or the pipeline is stopped."""
+        while not self.stop.is_set():
+            try:
+                result = function(timeout=0.1)
+            except (queue.Empty, queue.Full):
+                continue
+            if result is not False:
+                return True, result
+        return False, None
+
+    def read(self):
+        """Read the batches, drop the empty rows and allocate the start of the counter for every batch."""
+        pseudo = self.pseudo
+        try:
+            condition = core.Helpers.filter_expression(pseudo.patterns) if pseudo.patterns is not None else None
+            reader = pseudo.read_batches()
+            allocator = CounterAllocator()
+            first = True
+            index = 0
+            while True:
+                pseudo.check_cancel()
+                if not self.wait(self.in_flight.acquire)[0]:
+                    return
+                with PipelineStats.track(pseudo.stats, 'read_csv') as record:
+                    batch = next(reader, None)
+                    record['rows'] = batch.height if batch is not None else 0
+                if batch is None:
+                    return
+                with PipelineStats.track(pseudo.stats, 'filter_nulls') as record:
+                    df = batch.select(self.columns).filter(~pl.all_horizontal(pl.all().is_null()))
+                    record['rows'] = df.height
+                # the counter continues over the batches within the block of every column
+                count_start = 0
+                if pseudo.map_method == 'counter' and df.height > 0:
+                    count_start = allocator.allocate(CounterAllocator.block_size(pseudo, df, condition))
+                job = (index, df, batch.height, count_start, first and df.height > 0)
+                if not self.wait(lambda timeout: self.read_queue.put(job, timeout=timeout))[0]:
+                    return
+                index = index + 1
+                first = first and df.height == 0
+        except BaseException as error:
+            self.fail(error)
+        finally:
+            for _ in range(self.workers):
+                self.wait(lambda timeout: self.read_queue.put(None, timeout=timeout))
+
+    def transform(self):
+        """Pseudonymize the batches. The first batch generates the secret keys, the others wait for it."""
+        try:
+            while True:
+                ok, job = self.wait(self.read_queue.get)
+                if not ok or job is None:
+                    break
+                index, df, rows, count_start, first = job
+                result = None
+                if df.height > 0:
+                    if not first and not self.wait(self.first_done.wait)[0]:
+                        return
+                    helpers = self.pseudo.chunk_helpers(df, count_start, append=not first,
+                                                        counter_stride=self.counter_stride)
+                    result = helpers.handle_map_tiers(output_files=False)
+                    if first:
+                        self.first_done.set()
+                if not self.wait(lambda timeout: self.write_queue.put((index, rows, result), timeout=timeout))[0]:
+                    return
+        except BaseException as error:
+            self.fail(error)
+        finally:
+            self.wait(lambda timeout: self.write_queue.put(None, timeout=timeout))
+
+    def write(self):
+        """Write the pseudonymized batches in the order of the input and report the progress."""
+        pseudo = self.pseudo
+        try:
+            helpers = pseudo.chunk_helpers()
+            pending = {}
+            next_index = 0
+            done = 0
+            finished = 0
+            while finished < self.workers:
+                ok, item = self.wait(self.write_queue.get)
+                if not ok:
+                    return
+                if item is None:
+                    finished = finished + 1
+                    continue
+                pending[item[0]] = item
+                while next_index in pending:
+                    _, rows, result = pending.pop(next_index)
+                    next_index = next_index + 1
+                    if result is not None:
+                        self.write_result(helpers, result)
+                        helpers.append = True
+                    done = done + rows
+                    self.in_flight.release()
+                    pseudo.report_progress(done, self.total)
+        except BaseException as error:
+            self.fail(error)
+
+    def write_result(self, helpers, result):
+        """Write the mapping and output files of a batch, or keep it if no output parameter is passed."""
+        pseudo = self.pseudo
+        if not pseudo.has_output():
+            self.outputs.append(result)
+            return
+        df_map_all, mappings = result if pseudo.mapping else (result, [])
+        if pseudo.mapping and pseudo.map_method not in core.key_map_methods:
+            for df_mapping, column in zip(mappings, pseudo.map_columns):
+                helpers.write_mapping(df_mapping, core.Mapping(None, first_tier=column, output=pseudo.output,
+                                                               keyring=pseudo.keyring))
+        helpers.write_csv(df_map_all, 'output.csv')
+
+
+class ShardRunner:
+    """Pseudonymize a single large csv file on a process pool. The file is split into byte ranges at row boundaries,
+    every process pseudonymizes its range block by block into a temporary folder and the files of the shards are merged
+    into the output and mapping files in the order of the input.
+
+    The secret keys are generated once before the shards start, the counter numbers like the processing of the file at
+    once (with counter_mode *'fast'*, every shard reserves a block of its size in bytes and the numbering has gaps) and
+    a seed is derived for every block of every shard. The rows must not contain line breaks in quoted
+    values.
+
+    Parameters
+    ----------
+    pseudo : Pseudonymization
+        The job, which provides the input, the parameters, the output sink, the progress callback and the cancel event.
+    processes : int
+        Number of worker processes and shards.
+    block_size : int
+        Number of bytes, which a shard reads and pseudonymizes at once.
+    """
+
+    def __init__(self, pseudo, processes, block_size=64 << 20):
+        self.pseudo = pseudo
+        self.processes = processes
+        self.block_size = block_size
+
+    @staticmethod
+    def byte_ranges(path, shards):
+        """Return the header line and the byte ranges of the shards. Every range starts at the beginning of a row."""
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            header = file.readline()
+            start = file.tell()
+            bounds = [start]
+            for i in range(1, shards):
+                file.seek(max(start + (size - start) * i // shards, bounds[-1]))
+                file.readline()
+                bounds.append(max(file.tell(), bounds[-1]))
+        bounds.append(size)
+        return header, [(begin, end) for begin, end in zip(bounds, bounds[1:]) if end > begin]
+
+    @staticmethod
+    def read_range(path, begin, end, block_size):
+        """Yield the blocks of the byte range, every block ends at the end of a row."""
+        with open(path, 'rb') as file:
+            file.seek(begin)
+            while file.tell() < end:
+                data = file.read(min(block_size, end - file.tell()))
+                if file.tell() < end:
+                    data = data + file.readline()
+                yield data
+
+    @staticmethod
+    def read_blocks(shard):
+        """Yield the blocks of the shard as Polars DataFrames without the empty rows."""
+        for data in ShardRunner.read_range(shard['input_file'], shard['begin'], shard['end'], shard['block_size']):
+            df = pl.read_csv(io.BytesIO(shard['header'] + data), dtypes=shard['dtypes'])
+            yield df.select(shard['columns']).filter(~pl.all_horizontal(pl.all().is_null()))
+
+    @staticmethod
+    def block_seed(seed, shard, block):
+        """Return the seed of a block of a shard, derived from the seed of the job."""
+        if seed is None:
+            return None
+        return int(hashlib.sha256(f'{seed}:{shard}:{block}'.encode('utf-8')).hexdigest()[:8], 16)
+
+    @staticmethod
+    def count_shard(shard):
+        """Return the number of mapped rows of the shard."""
+        condition = core.Helpers.filter_expression(shard['patterns']) if shard['patterns'] is not None else None
+        count = 0
+        for df in ShardRunner.read_blocks(shard):
+            if condition is not None:
+                df = df.filter(condition)
+            count = count + df.height
+        return count
+
+    @staticmethod
+    def run_shard(shard):
+        """Pseudonymize the shard into its folder. The files are written without header, return the number of rows
+        and the header line of every file."""
+        sink = LocalSink(shard['folder'])
+        helpers = core.Helpers(map_columns=shard['map_columns'], map_method=shard['map_method'],
+                               mapping=shard['mapping'], encrypt_map=shard['encrypt_map'], patterns=shard['patterns'],
+                               output=shard['output'], count_start=shard['count_start'], append=True,
+                               keyring=shard['keyring'], sink=sink, counter_stride=shard['counter_stride'])
+        rows = 0
+        headers = {}
+        try:
+            for block, df in enumerate(ShardRunner.read_blocks(shard)):
+                rows = rows + df.height
+                if df.height == 0:
+                    continue
+                helpers.df = df
+                helpers.seed = ShardRunner.block_seed(shard['seed'], shard['index'], block)
+                result = helpers.handle_map_tiers(output_files=True)
+                if not headers:
+                    df_map_all, mappings = result if shard['mapping'] else (result, [])
+                    headers['output.csv'] = df_map_all.head(0).write_csv().encode('utf-8')
+                    if shard['map_method'] not in core.key_map_methods:
+                        for df_mapping, column in zip(mappings, shard['map_columns']):
+                            headers[f'mapping_output_{column}.csv'] = df_mapping.head(0).write_csv().encode('utf-8')
+        finally:
+            sink.close()
+        return {'index': shard['index'], 'rows': rows, 'headers': headers}
+
+    def shards(self, folder, columns):
+        """Return the configurations of the shards."""
+        pseudo = self.pseudo
+        header, ranges = ShardRunner.byte_ranges(pseudo.input_file, self.processes)
+        dtypes = dict(pl.scan_csv(pseudo.input_file, dtypes=pseudo.str_dtypes()).schema)
+        shards = []
+        for index, (begin, end) in enumerate(ranges):
+            shards.append({'index': index, 'input_file': pseudo.input_file, 'header': header, 'begin': begin,
+                           'end': end, 'block_size': self.block_size, 'dtypes': dtypes, 'columns': columns,
+                           'folder': os.path.join(folder, str(index)), 'output': pseudo.output,
+                           'map_columns': pseudo.map_columns, 'map_method': pseudo.map_method,
+                           'mapping': pseudo.mapping, 'encrypt_map': pseudo.encrypt_map, 'patterns': pseudo.patterns,
+                           'keyring': pseudo.keyring, 'seed': pseudo.seed, 'count_start': 0,
+                           'counter_stride': None})
+            os.makedirs(shards[-1]['folder'])
+        return shards
+
+    def generate_keys(self):
+        """Generate the secret keys of the job once, the shards read them from the output folder or the keyring."""
+        pseudo = self.pseudo
+        if not (pseudo.encrypt_map or pseudo.map_method in core.key_map_methods):
+            return
+        for column in pseudo.map_columns:
+            core.Mapping(None, first_tier=column, output=pseudo.output, stats=pseudo.stats, keyring=pseudo.keyring) \
+                .generate_keys(scheme=core.Mapping.key_scheme(pseudo.map_method, pseudo.encrypt_map))
+
+    def allocate_counters(self, pool, shards):
+        """Set the first counter value of every shard. Every column gets a block of the mapped rows of the job and
+        every shard a part of each block, the size in bytes bounds the number of rows in the fast mode."""
+        pseudo = self.pseudo
+        if pseudo.map_method != 'counter':
+            return
+        if pseudo.counter_mode == 'fast':
+            counts = [shard['end'] - shard['begin'] for shard in shards]
+        else:
+            with PipelineStats.track(pseudo.stats, 'count_shards'):
+                counts = list(pool.map(ShardRunner.count_shard, shards))
+        allocator = CounterAllocator()
+        for shard, count in zip(shards, counts):
+            shard['count_start'] = allocator.allocate(count)
+            shard['counter_stride'] = sum(counts)
+
+    def merge(self, shards, results):
+        """Concatenate the files of the shards in the order of the input into the files of the output sink."""
+        pseudo = self.pseudo
+        headers = {}
+        for result in results:
+            for name, header in result['headers'].items():
+                headers.setdefault(name, header)
+        for name, header in headers.items():
+            with PipelineStats.track(pseudo.stats, 'merge_shards') as record:
+                file = pseudo.job_sink.open(name)
+                start = file.tell()
+                file.write(header)
+                for shard in shards:
+                    path = os.path.join(shard['folder'], name)
+                    if os.path.exists(path):
+                        with open(path, 'rb') as shard_file:
+                            shutil.copyfileobj(shard_file, file, OutputSink.buffer_size)
+                record['bytes'] = file.tell() - start
+
+    def run(self, columns, total):
+        """Pseudonymize and merge the shards."""
+        pseudo = self.pseudo
+        if not pseudo.input_file.endswith('.csv'):
+            raise ValueError("The sharded processing requires an uncompressed csv file.")
+        if not pseudo.has_output():
+            raise ValueError("The sharded processing requires an output folder or an output sink.")
+        if pseudo.compression is not None or pseudo.mapping_format == 'arrow':
+            raise ValueError("The sharded processing writes csv files, compression and the arrow mapping format are "
+                             "not available.")
+        self.generate_keys()
+        folder = tempfile.mkdtemp(prefix='.shards_', dir=pseudo.output)
+        try:
+            shards = self.shards(folder, columns)
+            # spawn starts clean workers, forking a process with running Polars threads can deadlock
+            with ProcessPoolExecutor(max_workers=self.processes,
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                self.allocate_counters(pool, shards)
+                with PipelineStats.track(pseudo.stats, 'shards', rows=total):
+                    futures = [pool.submit(ShardRunner.run_shard, shard) for shard in shards]
+                    results = []
+                    done = 0
+                    for future in as_completed(futures):
+                        if pseudo.cancel is not None and pseudo.cancel.is_set():
+                            for pending in futures:
+                                pending.cancel()
+                        pseudo.check_cancel()
+                        results.append(future.result())
+                        done = done + results[-1]['rows']
+                        pseudo.report_progress(done, total)
+            self.merge(shards, sorted(results, key=lambda result: result['index']))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+class BatchRunner:
+    """Run a job for every file of a directory or glob pattern on a process pool. The workers are started once and
+    keep Polars and the spaCy model loaded for all files. The output folder mirrors the directory layout of the input:
+    the files of *input/a/b.csv* are written to *output/a/b/*. A manifest *manifest.csv* in the output folder lists the
+    rows, seconds and status of every file.
+
+    Parameters
+    ----------
+    job : callable
+        Function called as *job(config)* with the configuration of a single file, returns the number of rows or None.
+        Must be defined at module level, so that it can be passed to the workers.
+    config : dict
+        Configuration of the script, *input_file* is a directory or glob pattern and *output* the output folder.
+    processes : int
+        Number of worker processes. Optional, the number of CPUs by default.
+    initializer : callable
+        Function called once in every worker, e.g. Helpers.load_nlp to load the spaCy model. Optional.
+    """
+
+    def __init__(self, job, config, processes=None, initializer=None):
+        self.job = job
+        self.config = config
+        self.processes = processes
+        self.initializer = initializer
+
+    @staticmethod
+    def is_batch(input_file):
+        """Return True, if the input is a directory or a glob pattern."""
+        return os.path.isdir(input_file) or glob.has_magic(input_file)
+
+    @staticmethod
+    def input_files(input_file):
+        """Return the base folder and the sorted files of a directory (recursive) or a glob pattern."""
+        if os.path.isdir(input_file):
+            base = input_file
+            files = glob.glob(os.path.join(input_file, '**', '*'), recursive=True)
+        else:
+            base = os.path.dirname(re.split(r'[*?\[]', input_file, maxsplit=1)[0])
+            files = glob.glob(input_file, recursive=True)
+        return base, sorted(file for file in files if os.path.isfile(file))
+
+    def file_config(self, base, file):
+        """Return the configuration of a single file with the mirrored output folder, which is created when the job
+        runs, see run_file."""
+        relative = os.path.relpath(file, base)
+        output = os.path.join(self.config['output'], os.path.dirname(relative),
+                              os.path.basename(relative).split('.', 1)[0])
+        return {**self.config, 'input_file': file, 'output': output}
+
+    @staticmethod
+    def run_file(job, config):
+        """Run the job for a single file in a worker, return its manifest record. The output folder is created
+        first. Errors are recorded, not raised."""
+        start = time.perf_counter()
+        rows, status, error = None, 'ok', None
+        try:
+            if config.get('output') is not None:
+                os.makedirs(config['output'], exist_ok=True)
+            rows = job(config)
+        except BaseException as exception:
+            status, error = 'error', str(exception) or type(exception).__name__
+        return {'input_file': config['input_file'], 'output': config.get('output'), 'rows': rows,
+                'seconds': round(time.perf_counter() - start, 3), 'status': status, 'error': error}
+
+    def run(self):
+        """Run the job for all files and write the manifest. Return the manifest as Polars Dataframe."""
+        base, files = BatchRunner.input_files(self.config['input_file'])
+        if not files:
+            raise ValueError(f"No input files found for {self.config['input_file']}")
+        records = []
+        # spawn starts clean workers, forking a process with running Polars threads can deadlock
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=self.initializer) as pool:
+            futures = [pool.submit(BatchRunner.run_file, self.job, self.file_config(base, file)) for file in files]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                print(f"[{len(records)}/{len(files)}] {record['input_file']}: {record['status']}")
+        manifest = pl.DataFrame(records, schema={'input_file': pl.Utf8, 'output': pl.Utf8, 'rows': pl.Int64,
+                                                 'seconds': pl.Float64, 'status': pl.Utf8, 'error': pl.Utf8})
+        manifest = manifest.sort('input_file')
+        os.makedirs(self.config['output'], exist_ok=True)
+        manifest.write_csv(os.path.join(self.config['output'], 'manifest.csv'))
+        return manifest
+
+
+class MicroBatcher:
+    """Group the items of concurrent callers into batches, e.g. the requests of a service. A worker thread collects
+    the items until *max_batch* items are waiting or *max_delay* seconds passed since the first item, and processes
+    them with a single call of the function. The function runs in the worker thread only, so it can keep state like
+    the counter or loaded models without locks.
+
+    Parameters
+    ----------
+    function : callable
+        Function called as *function(items)*, returns one result per item in the same order.
+    max_batch : int
+        Maximum number of items per batch.
+    max_delay : float
+        Seconds, which the first item of a batch waits for further items.
+    """
+
+    def __init__(self, function, max_batch=256, max_delay=0.005):
+        self.function = function
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Add the item to the next batch. Return a concurrent.futures.Future of its result."""
+        if self.closed:
+            raise RuntimeError("The batcher is closed.")
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def collect(self):
+        """Wait for the first item and collect the batch. Return None, when the batcher is closed."""
+        job = self.queue.get()
+        if job is None:
+            return None
+        batch = [job]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                # process the collected items first, stop with the next call
+                self.queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            if batch is None:
+                return
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.batches = self.batches + 1
+            self.items = self.items + len(batch)
+            try:
+                results = self.function([item for item, _ in batch])
+            except BaseException as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        """Process the waiting items and stop the worker thread."""
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+
+
+class AsyncPseudonymization:
+    """asyncio entry points for services, which pseudonymize many small requests. The spaCy model, the secret keys and
+    the counter are loaded once. Concurrent calls are grouped into micro-batches by a MicroBatcher: the records of a
+    batch are pseudonymized as one Dataframe, the texts of a batch are parsed together with nlp.pipe. The batches run
+    in the worker threads of the batchers and the file jobs on the executor, so the event loop is not blocked.
+
+    Parameters
+    ----------
+    map_method : str
+        Pseudonymization method, see Pseudonymization.
+    map_columns : str or list
+        Column(s) of the records to be pseudonymized.
+    pos_type : str or list
+        Type(s) of entities in the texts to be pseudonymized, see Pseudonymization.
+    all_ne : bool
+        Enable or disable pseudonymization of all named entities of the texts.
+    patterns : list or dict
+        Filter condition of the records, see Pseudonymization.
+    text_patterns : list
+        spaCy token patterns of the texts, the matches are pseudonymized as 'Others'.
+    terms : str or list
+        Custom terms of the texts to be pseudonymized as 'Others', see Pseudonymization.
+    output : str
+        Path to the output folder, the mappings of every batch are appended to the mapping files. Optional.
+    mapping : bool
+        Enable or disable mapping output.
+    encrypt_map : bool or str
+        Enable or disable encryption of the mapping table, see Pseudonymization.
+    seed : int
+        Seed of the random pseudonymization methods.
+    keyring : str
+        Path to a keyring file. Optional.
+    max_batch : int
+        Maximum number of requests per batch.
+    max_delay : float
+        Seconds, which the first request of a batch waits for further requests.
+    executor : concurrent.futures.Executor
+        Executor of the file jobs. Optional, by default a thread pool of the instance, which is shut down by close.
+
+    Create the instance with *await AsyncPseudonymization.create(...)* to load the model and the keys on a thread, and
+    close it with *async with* or *await aclose()*.
+    """
+
+    def __init__(self, map_method='counter', map_columns=None, pos_type=None, all_ne=False, patterns=None,
+                 text_patterns=None, terms=None, output=None, mapping=True, encrypt_map=False, seed=None, keyring=None,
+                 max_batch=256, max_delay=0.005, executor=None):
+        self.map_method = map_method
+        self.map_columns = [map_columns] if isinstance(map_columns, str) else list(map_columns or [])
+        self.pos_type = [pos_type] if isinstance(pos_type, str) else pos_type
+        self.all_ne = all_ne
+        self.patterns = patterns
+        self.text_patterns = text_patterns
+        self.terms = terms
+        self.output = output
+        self.mapping = mapping
+        self.encrypt_map = encrypt_map
+        self.seed = seed
+        self.keyring = keyring
+
+        # the model is loaded once, and only if the texts need more than the regex
+        nlp = None
+        if (self.pos_type or all_ne or text_patterns or terms) and \
+                not core.Helpers.is_regex_only(self.pos_type, text_patterns, all_ne, terms):
+            nlp = core.Helpers.load_nlp()
+        self.text_helpers = core.Helpers(nlp=nlp, pos_type=self.pos_type, all_ne=all_ne, patterns=text_patterns,
+                                         terms=terms)
+        self.keys = {}
+        if encrypt_map or map_method in core.key_map_methods:
+            for column in self.map_columns + self.text_helpers.entity_types():
+                self.load_key(column)
+        self.record_helpers = core.Helpers(map_columns=self.map_columns, map_method=map_method, mapping=True,
+                                           encrypt_map=encrypt_map, seed=seed, patterns=patterns, output=output,
+                                           keyring=keyring, append=True, keys=self.keys)
+        self.counter = 0
+
+        self.records = MicroBatcher(self.records_batch, max_batch=max_batch, max_delay=max_delay)
+        self.texts = MicroBatcher(self.texts_batch, max_batch=max_batch, max_delay=max_delay)
+        self.own_executor = executor is None
+        self.executor = ThreadPoolExecutor() if executor is None else executor
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        """Create the instance on a thread, since loading the model and the keys blocks."""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(cls, *args, **kwargs))
+
+    def load_key(self, column):
+        """Read the secret key of the column once, or generate it, if there is none yet."""
+        mapping_instance = core.Mapping(None, first_tier=column, output=self.output, keyring=self.keyring)
+        try:
+            mapping_instance.read_key()
+        except (FileNotFoundError, KeyError):
+            mapping_instance.generate_keys(scheme=core.Mapping.key_scheme(self.map_method, self.encrypt_map))
+        self.keys[column] = (mapping_instance.key, mapping_instance.scheme)
+
+    async def pseudonymize_records(self, records):
+        """Pseudonymize the map_columns of the records, a list of dictionaries. Return the pseudonymized records."""
+        if not records:
+            return []
+        return await asyncio.wrap_future(self.records.submit(records))
+
+    async def pseudonymize_text(self, text):
+        """Pseudonymize the entities of the text. Return the pseudonymized text."""
+        return await asyncio.wrap_future(self.texts.submit(text))
+
+    async def pseudonymize_texts(self, texts):
+        """Pseudonymize the entities of every text, the texts join the same batches. Return the pseudonymized texts."""
+        return list(await asyncio.gather(*[self.pseudonymize_text(text) for text in texts]))
+
+    async def pseudonymize_file(self, input_file, output=None, **kwargs):
+        """Pseudonymize the input file as a job of Pseudonymization on the executor, with the configuration of the
+        instance. CSV and Parquet files are structured data, other files free text. Further keyword arguments are
+        passed to Pseudonymization, e.g. *chunk_size*. Return the result of the job."""
+        structured = input_file.endswith(('.csv', '.csv.gz', '.csv.zst', '.parquet'))
+        pseudo = core.Pseudonymization(self.map_method, self.map_columns or None, input_file=input_file, output=output,
+                                       mapping=self.mapping, encrypt_map=self.encrypt_map,
+                                       all_ne=self.all_ne, seed=self.seed, pos_type=self.pos_type,
+                                       patterns=self.patterns if structured else self.text_patterns, terms=self.terms,
+                                       keyring=self.keyring, **kwargs)
+        job = pseudo.pseudonym if structured else pseudo.nlp_pseudonym
+        return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+
+    def records_batch(self, requests):
+        """Pseudonymize the records of all requests of the batch as one Dataframe. Return the records per request."""
+        records = [record for request in requests for record in request]
+        self.record_helpers.df = pl.from_dicts(records, infer_schema_length=None)
+        df_map_all, mappings = self.record_helpers.handle_map_tiers(output_files=False)
+        df_map_all = df_map_all.rename({f'Index_{column}': column for column in self.map_columns})
+        if self.mapping and self.output is not None and self.map_method not in core.key_map_methods:
+            self.write_mappings({f'mapping_output_{column}.csv': df_mapping
+                                 for column, df_mapping in zip(self.map_columns, mappings)})
+        rows = df_map_all.to_dicts()
+        results = []
+        start = 0
+        for request in requests:
+            results.append([{key: row[key] for key in record}
+                            for record, row in zip(request, rows[start:start + len(request)])])
+            start = start + len(request)
+        return results
+
+    def texts_batch(self, texts):
+        """Find the entities of all texts of the batch with nlp.pipe and pseudonymize every entity type in one call.
+        Return the pseudonymized texts."""
+        helpers = self.text_helpers
+        map_dicts = [helpers.spans_mapping(spans) for spans in helpers.pipe_entity_spans(texts)]
+        texts = list(texts)
+        frames = {}
+        for key in helpers.entity_types():
+            values = [value for map_dict in map_dicts for value in map_dict.get(key, [])]
+            if not values:
+                continue
+            mapper = core.Helpers(list_=values, map_method=self.map_method, df=pl.DataFrame(), counter=self.counter,
+                                  field=key, output=self.output, keyring=self.keyring, keys=self.keys)
+            df_pos = mapper.pseudo_nlp_mapper()
+            if self.map_method == 'counter':
+                self.counter = self.counter + df_pos.height
+            pseudonyms = df_pos[f'Index_{key}'].cast(pl.Utf8).to_list()
+            start = 0
+            for index, map_dict in enumerate(map_dicts):
+                for value, pseudonym in zip(map_dict.get(key, []), pseudonyms[start:]):
+                    texts[index] = texts[index].replace(value, pseudonym)
+                start = start + len(map_dict.get(key, []))
+            if self.encrypt_map and self.map_method not in core.key_map_methods:
+                mapping_instance = core.Mapping(df_pos, first_tier=key, output=self.output, keyring=self.keyring)
+                mapper.cached_key(mapping_instance)
+                df_pos = df_pos.with_columns(mapping_instance.encrypt_column(df_pos[key]).alias(key))
+            frames[f'mapping_output_{key}.csv'] = df_pos.select(f'Index_{key}', key)
+        if self.mapping and self.output is not None and self.map_method not in core.key_map_methods:
+            self.write_mappings(frames)
+        return texts
+
+    def write_mappings(self, frames):
+        """Append the mappings of a batch to the mapping files."""
+        for name, df in frames.items():
+            append = os.path.exists(os.path.join(self.output, name))
+            core.Helpers(output=self.output, append=append).write_csv(df, name)
+
+    def summary(self):
+        """Return the number of batches and the mean batch size of the records and the texts."""
+        summary = {}
+        for name, batcher in [('records', self.records), ('text', self.texts)]:
+            summary[name] = {'batches': batcher.batches,
+                             'mean_batch_size': round(batcher.items / batcher.batches, 2) if batcher.batches else None}
+        return summary
+
+    def close(self):
+        """Process the waiting requests and stop the batchers and the executor of the instance."""
+        self.records.close()
+        self.texts.close()
+        if self.own_executor:
+            self.executor.shutdown()
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+
+# the core module imports the classes of this module, so it is imported after they are defined
+if __package__:
+    from . import Pseudonymization as core
+else:
+    import Pseudonymization as core
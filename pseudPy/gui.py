@@ -1,8 +1,11 @@
 import os
+import queue
 import re
+import threading
 import tkinter as tk
 import polars as pl
 from tkinter import messagebox
+from tkinter import ttk
 from tkinter import font as tkFont
 import pandas as pd
 
@@ -10,9 +13,103 @@ import Pseudonymization as pseudPy
 import polars.exceptions
 from tkinter import filedialog
 
+# number of rows pseudonymized between two progress updates
+CHUNK_SIZE = 50000
+
+job_queue = queue.Queue()
+cancel_event = threading.Event()
+job_running = False
+job_done = None
+progress_bar = None
+cancel_button = None
+
+
+def run_job(job, cancellable=True, on_done=None):
+    """Run a job in a worker thread, so the window stays responsive. The job returns the message shown on success,
+    or the result passed to on_done. The cancel button is disabled for jobs, which cannot be cancelled"""
+    global job_running, job_done
+    if job_running:
+        messagebox.showinfo("Failed", "Another job is still running!")
+        return
+    job_running = True
+    job_done = on_done
+    cancel_event.clear()
+    set_progress(0, 1)
+    set_cancellable(cancellable)
+
+    def worker():
+        try:
+            job_queue.put(("done", job()))
+        except pseudPy.JobCancelled:
+            job_queue.put(("cancelled", "The job was cancelled."))
+        except SystemExit:
+            job_queue.put(("failed", "The number of rows must be at least 1."))
+        except Exception as error:
+            job_queue.put(("failed", error.args[0] if error.args else type(error).__name__))
+
+    threading.Thread(target=worker, daemon=True).start()
+    root.after(100, poll_job_queue)
+
+
+def report_progress(done, total):
+    """Progress callback of the library, called from the worker thread"""
+    job_queue.put(("progress", (done, total)))
+
+
+def poll_job_queue():
+    """Handle the messages of the worker thread on the Tk main thread"""
+    global job_running
+    try:
+        while True:
+            status, value = job_queue.get_nowait()
+            if status == "progress":
+                set_progress(*value)
+            else:
+                job_running = False
+                set_progress(1, 1)
+                set_cancellable(True)
+                if status == "done" and job_done is not None:
+                    job_done(value)
+                else:
+                    messagebox.showinfo("Success" if status == "done" else "Failed", value)
+                return
+    except queue.Empty:
+        root.after(100, poll_job_queue)
+
+
+def set_progress(done, total):
+    """Update the progress bar, if it is shown in the current window"""
+    if progress_bar is not None and progress_bar.winfo_exists():
+        progress_bar["value"] = 100 * done / total if total else 100
+
+
+def set_cancellable(cancellable):
+    """Enable the cancel button for jobs, which stop after the current chunk, and disable it for the other jobs"""
+    if cancel_button is not None and cancel_button.winfo_exists():
+        cancel_button.config(state=tk.NORMAL if cancellable else tk.DISABLED)
+
 
-def initialize_pseudonym():
-    """Getting user input and completing pseudonymization"""
+def cancel_job():
+    """Stop the running job after the current chunk"""
+    if job_running:
+        cancel_event.set()
+
+
+def add_progress_widgets(row):
+    """Add the progress bar and the cancel button to the current window"""
+    global progress_bar, cancel_button
+    progress_bar = ttk.Progressbar(root_frame, orient=tk.HORIZONTAL, length=250, mode="determinate")
+    progress_bar.grid(row=row, column=1, pady=10)
+    cancel_button = tk.Button(root_frame, text="Cancel", command=cancel_job)
+    cancel_button.grid(row=row, column=2, pady=10)
+
+
+# number of rows shown in the preview window
+PREVIEW_ROWS = 20
+
+
+def initialize_pseudonym(preview=False):
+    """Getting user input and completing pseudonymization, or showing a preview of the first rows"""
     map_method = map_method_var.get()
     input_file = input_file_entry.get()
     if not os.path.exists(input_file):
@@ -24,11 +121,9 @@ def initialize_pseudonym():
         if structure_var.get() == "free text":
             patterns = modify_pattern(patterns)
         else:
-            patterns = patterns.split(",")
-            if patterns[3].strip() == "int":
-                patterns[2] = int(patterns[2].strip())
+            patterns = modify_filter(patterns)
     output = output_entry.get()
-    if not os.path.exists(output):
+    if not preview and not os.path.exists(output):
         messagebox.showinfo("Failed", "Output path does not exist!")
     mapping = mapping_var.get()
     encrypt_map = encrypt_map_var.get()
@@ -46,19 +141,31 @@ def initialize_pseudonym():
             map_columns = map_columns.split(",")
             map_columns = [i.strip() for i in map_columns]
 
-        pseudo = pseudPy.Pseudonymization(
-            map_columns=map_columns,
-            map_method=map_method,
-            input_file=input_file,
-            output=output,
-            mapping=mapping,
-            encrypt_map=encrypt_map,
-            seed=seed,
-            patterns=patterns
-        )
+        def pseudonymization(chunk_size=None):
+            return pseudPy.Pseudonymization(
+                map_columns=map_columns,
+                map_method=map_method,
+                input_file=input_file,
+                output=output,
+                mapping=mapping,
+                encrypt_map=encrypt_map,
+                seed=seed,
+                patterns=patterns,
+                chunk_size=chunk_size,
+                progress=report_progress,
+                cancel=cancel_event
+            )
 
-        pseudo.pseudonym()
-        messagebox.showinfo("Success", "Pseudonymization successful!")
+        if preview:
+            run_job(lambda: pseudonymization().preview(PREVIEW_ROWS), cancellable=False, on_done=show_preview)
+            return
+
+        def job():
+            # files of a single chunk are pseudonymized in one pass, like by the script
+            chunked = map_method != 'decrypt' and has_more_rows(input_file, CHUNK_SIZE)
+            pseudonymization(CHUNK_SIZE if chunked else None).pseudonym()
+            return "Pseudonymization successful!"
+        run_job(job, cancellable=map_method != 'decrypt')
     elif structure_var.get() == "free text":
         pos_type_selected = pos_type_list.curselection()
         pos_type = [pos_type_list.get(i) for i in pos_type_selected]
@@ -75,10 +182,37 @@ def initialize_pseudonym():
             seed=seed,
             pos_type=pos_type,
             patterns=patterns,
-            all_ne=all_ne
+            all_ne=all_ne,
+            progress=report_progress,
+            cancel=cancel_event
         )
-        pseudo.nlp_pseudonym()
-        messagebox.showinfo("Success", "Pseudonymization successful!")
+
+        def job():
+            pseudo.nlp_pseudonym()
+            return "Pseudonymization successful!"
+        run_job(job)
+
+
+def has_more_rows(input_file, n):
+    """Return True, if the csv file has more than n rows, only the first n + 1 rows are read"""
+    try:
+        return pl.read_csv(input_file, n_rows=n + 1, infer_schema_length=0).height > n
+    except polars.exceptions.ComputeError:
+        return False
+
+
+def show_preview(result):
+    """Show the pseudonymized first rows and their mappings of the preview job in a new window"""
+    df, mappings = result
+    preview_window = tk.Toplevel(root)
+    preview_window.title("Pseudonymization Tool - Preview")
+    preview_text = tk.Text(preview_window, width=120, height=40, wrap=tk.NONE)
+    preview_text.pack(fill=tk.BOTH, expand=True)
+    with pl.Config(tbl_rows=PREVIEW_ROWS, tbl_cols=-1, fmt_str_lengths=40):
+        preview_text.insert(tk.END, f"{df}\n")
+        for df_map in mappings:
+            preview_text.insert(tk.END, f"\n{df_map}\n")
+    preview_text.config(state=tk.DISABLED)
 
 
 def revert_data():
@@ -93,64 +227,64 @@ def revert_data():
     if not os.path.exists(output_revert):
         messagebox.showinfo("Failed", "Output path does not exist!")
 
-    revert_df = pl.read_csv(input_mapping)
     columns = map_columns_entry_revert.get()
     if not columns or (columns == "-"):
         messagebox.showinfo("Failed", "Please specify the column to map!")
-    if structure_var.get() == "structured":
-        df = pl.read_csv(input_file_revert)
-        if pseudonyms_entry_revert.get("1.0", "end-1c") != "-":
-            pseudonyms = pseudonyms_entry_revert.get("1.0", "end-1c").split(",")
-            pseudonyms = [i.strip() for i in pseudonyms]
-        else:
-            pseudonyms = None
-        pseudo = pseudPy.Pseudonymization(
-            df=df,
-            map_columns=columns
-        )
-        try:
-            if pseudonyms is not None:
-                output = pseudo.revert_pseudonym(revert_df, pseudonyms)
-            else:
-                output = pseudo.revert_pseudonym(revert_df)
-            output.write_csv(f"{output_revert}/reverted_output.csv")
-            messagebox.showinfo("Success", "Revert was successful!")
-        except KeyError:
-            messagebox.showinfo("Failed", "Please check whether the column names match the mapping.")
-    elif structure_var.get() == "free text":
-        with open(input_file_revert, "r") as file:
-            text = file.read()
-        if pseudonyms_entry_revert.get("1.0", "end-1c") != "-":
-            pseudonyms = pseudonyms_entry_revert.get("1.0", "end-1c").split(",")
-            pseudonyms = [i.strip() for i in pseudonyms]
-        else:
-            pseudonyms = None
-        if len(revert_df.columns) == 1:
-            try:
-                revert_df = revert_df.filter(pl.col(f"Index_{columns}").is_in(pseudonyms))
-            except polars.exceptions.InvalidOperationError:
-                pseudonyms = [int(i) for i in pseudonyms]
-                revert_df = revert_df.filter(pl.col(f"Index_{columns}").is_in(pseudonyms))
-            mapping = pseudPy.Mapping(revert_df, first_tier=columns, output=output_revert)
-            text = mapping.decrypt_nlp_tier(text)
-            with open(f'{output_revert}/text.txt', 'w') as file:
-                print(text, file=file)
-                messagebox.showinfo("Success", "Revert was successful!")
-        else:
+    if pseudonyms_entry_revert.get("1.0", "end-1c") != "-":
+        pseudonyms = pseudonyms_entry_revert.get("1.0", "end-1c").split(",")
+        pseudonyms = [i.strip() for i in pseudonyms]
+    else:
+        pseudonyms = None
+    structure = structure_var.get()
+
+    def job():
+        revert_df = pl.read_csv(input_mapping)
+        if structure == "structured":
+            df = pl.read_csv(input_file_revert)
             pseudo = pseudPy.Pseudonymization(
-                text=text,
+                df=df,
                 map_columns=columns
             )
             try:
                 if pseudonyms is not None:
-                    output = pseudo.revert_nlp_pseudonym(revert_df, pseudonyms)
+                    output = pseudo.revert_pseudonym(revert_df, pseudonyms)
                 else:
-                    output = pseudo.revert_nlp_pseudonym(revert_df)
-                with open(f"{output_revert}/reverted_text.txt", "w") as text_file:
-                    print(output, file=text_file)
-                messagebox.showinfo("Success", "Revert was successful!")
+                    output = pseudo.revert_pseudonym(revert_df)
+                output.write_csv(f"{output_revert}/reverted_output.csv")
+                return "Revert was successful!"
             except KeyError:
-                messagebox.showinfo("Failed", "Please check whether the column names match the mapping.")
+                raise KeyError("Please check whether the column names match the mapping.")
+        elif structure == "free text":
+            with open(input_file_revert, "r") as file:
+                text = file.read()
+            if len(revert_df.columns) == 1:
+                selected = pseudonyms
+                try:
+                    revert_df = revert_df.filter(pl.col(f"Index_{columns}").is_in(selected))
+                except polars.exceptions.InvalidOperationError:
+                    selected = [int(i) for i in selected]
+                    revert_df = revert_df.filter(pl.col(f"Index_{columns}").is_in(selected))
+                mapping = pseudPy.Mapping(revert_df, first_tier=columns, output=output_revert)
+                text = mapping.decrypt_nlp_tier(text)
+                with open(f'{output_revert}/text.txt', 'w') as file:
+                    print(text, file=file)
+                return "Revert was successful!"
+            else:
+                pseudo = pseudPy.Pseudonymization(
+                    text=text,
+                    map_columns=columns
+                )
+                try:
+                    if pseudonyms is not None:
+                        output = pseudo.revert_nlp_pseudonym(revert_df, pseudonyms)
+                    else:
+                        output = pseudo.revert_nlp_pseudonym(revert_df)
+                    with open(f"{output_revert}/reverted_text.txt", "w") as text_file:
+                        print(output, file=text_file)
+                    return "Revert was successful!"
+                except KeyError:
+                    raise KeyError("Please check whether the column names match the mapping.")
+    run_job(job, cancellable=False)
 
 
 def search_for_file():
@@ -209,6 +343,21 @@ def modify_pattern(pattern):
     return final_output
 
 
+def modify_filter(pattern):
+    """Modify the filter for structured data: conditions 'column,operation,value,type' separated by ';' are combined
+    with 'and', the values of 'in', 'not_in' and 'between' are separated by '|'"""
+    value_types = {"int": int, "float": float}
+    conditions = []
+    for condition in pattern.split(";"):
+        condition = [i.strip() for i in condition.split(",")]
+        if len(condition) > 2:
+            value_type = value_types.get(condition[3], str) if len(condition) > 3 else str
+            values = [value_type(value.strip()) for value in condition[2].split("|")]
+            condition[2] = values if condition[1] in ("in", "not_in", "between") else values[0]
+        conditions.append(condition[:3])
+    return conditions[0] if len(conditions) == 1 else {"and": conditions}
+
+
 def search_for_mapping():
     """Browsing the mapping file on the PC"""
     input_file = filedialog.askopenfilename()
@@ -345,6 +494,8 @@ def add_revert_widgets():
     go_back_button = tk.Button(root_frame, text="Go Back", command=add_widgets)
     go_back_button.grid(row=5, column=2, pady=10)
 
+    add_progress_widgets(row=6)
+
 
 # initialize the tkinter root window
 root = tk.Tk()
@@ -392,6 +543,8 @@ def add_widgets():
         method_options = [
             'counter',
             'encrypt',
+            'aes-siv',
+            'fpe',
             'decrypt',
             'random1',
             'random4',
@@ -409,6 +562,8 @@ def add_widgets():
         method_options = [
             'counter',
             'encrypt',
+            'aes-siv',
+            'fpe',
             'decrypt',
             'random1',
             'random4',
@@ -660,6 +815,9 @@ def add_widgets():
     if structure_var.get() == "free text" or structure_var.get() == "structured":
         register_button = tk.Button(root_frame, text="Go!", command=initialize_pseudonym)
         register_button.grid(row=12, column=1, pady=10)
+        if structure_var.get() == "structured":
+            preview_button = tk.Button(root_frame, text="Preview", command=lambda: initialize_pseudonym(preview=True))
+            preview_button.grid(row=12, column=0, pady=10, sticky=tk.W)
     else:
         register_button = tk.Button(root_frame, text="Go!", command=k_anonym)
         register_button.grid(row=12, column=1, pady=10)
@@ -667,6 +825,8 @@ def add_widgets():
         check_k_anonymity = tk.Button(root_frame, text="Check k-anonymity", command=check_k_anon)
         check_k_anonymity.grid(row=12, column=2, pady=10)
 
+    add_progress_widgets(row=13 if structure_var.get() != "k-anonymity" else 16)
+
     if structure_var.get() == "k-anonymity":
         note_label = tk.Label(root_frame, text="Note: for structured data only!", font=medium_font,
                               fg='#c1121f')
@@ -759,8 +919,6 @@ def k_anonym():
     if not os.path.exists(output):
         messagebox.showinfo("Failed", "Output path does not exist!")
 
-    input_df = pd.read_csv(input_file)
-
     mask_str_bool = mask_str_var.get()
     k = int(k_entry.get())
     x = gap_entry.get()
@@ -768,42 +926,47 @@ def k_anonym():
 
     agg_columns = agg_entry.get()
     if agg_columns == "-":
-        agg_columns = None
+        agg_columns_list = None
     else:
         agg_columns_list = agg_columns.split(",")
         agg_columns_list = [i.strip() for i in agg_columns_list]
 
         if x is None:
             messagebox.showinfo("Failed", "Please enter the GAP entry of type Integer!")
-        for col in agg_columns_list:
-            if pd.api.types.is_float_dtype(input_df[col]) or pd.api.types.is_integer_dtype(input_df[col]):
-                agg = pseudPy.Aggregation(
-                    column=col,
-                    method=['number', x],
-                    df=input_df
-                )
-                input_df = agg.group()
-            elif is_valid_date(input_df[col].iloc[0]):
-                agg = pseudPy.Aggregation(
-                    column=col,
-                    method=['dates-to-years', x],
-                    df=input_df
-                )
-                input_df = agg.group_dates_to_years()
-
-    df_header = input_df.columns.to_list()
-
-    depths = {}
-    if k > 0:
-        for col in df_header:
-            depths[col] = k-1
-        k_anonymity = pseudPy.KAnonymity(df=input_df, depths=depths, k=k, mask_others=mask_str_bool)
-        grouped = k_anonymity.k_anonymity()
-        grouped.to_csv(f"{output}/k-anonym-output.csv", index=False)
-        messagebox.showinfo("Success", f"{k}-anonymization was successful!")
-    else:
-        input_df.to_csv(f"{output}/aggregated_output.csv", index=False)
-        messagebox.showinfo("Success", "Aggregation was successful!")
+
+    def job():
+        input_df = pd.read_csv(input_file)
+        if agg_columns_list is not None:
+            for col in agg_columns_list:
+                if pd.api.types.is_float_dtype(input_df[col]) or pd.api.types.is_integer_dtype(input_df[col]):
+                    agg = pseudPy.Aggregation(
+                        column=col,
+                        method=['number', x],
+                        df=input_df
+                    )
+                    input_df = agg.group()
+                elif is_valid_date(input_df[col].iloc[0]):
+                    agg = pseudPy.Aggregation(
+                        column=col,
+                        method=['dates-to-years', x],
+                        df=input_df
+                    )
+                    input_df = agg.group_dates_to_years()
+
+        df_header = input_df.columns.to_list()
+
+        depths = {}
+        if k > 0:
+            for col in df_header:
+                depths[col] = k-1
+            k_anonymity = pseudPy.KAnonymity(df=input_df, depths=depths, k=k, mask_others=mask_str_bool)
+            grouped = k_anonymity.k_anonymity()
+            grouped.to_csv(f"{output}/k-anonym-output.csv", index=False)
+            return f"{k}-anonymization was successful!"
+        else:
+            input_df.to_csv(f"{output}/aggregated_output.csv", index=False)
+            return "Aggregation was successful!"
+    run_job(job, cancellable=False)
 
 
 def check_k_anon():
@@ -811,16 +974,15 @@ def check_k_anon():
     input_file = input_file_entry.get()
     if not os.path.exists(input_file):
         messagebox.showinfo("Failed", "Output path does not exist!")
-
-    input_df = pd.read_csv(input_file)
     k = int(k_entry.get())
-    k_anonymity = pseudPy.KAnonymity(df=input_df,k=k)
-    is_k_anon = k_anonymity.is_k_anonymized()
 
-    if is_k_anon:
-        messagebox.showinfo("Success", f"The data is {k}-anonymous!")
-    else:
-        messagebox.showinfo("Failed", f"The data is not {k}-anonymous!")
+    def job():
+        input_df = pd.read_csv(input_file)
+        k_anonymity = pseudPy.KAnonymity(df=input_df, k=k)
+        if k_anonymity.is_k_anonymized():
+            return f"The data is {k}-anonymous!"
+        raise ValueError(f"The data is not {k}-anonymous!")
+    run_job(job, cancellable=False)
 
 
 check_structure()
@@ -0,0 +1,103 @@
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def connection(url=None, socket_path=None):
+    """Return a new connection to the service."""
+    if socket_path is not None:
+        return UnixHTTPConnection(socket_path)
+    address = urlparse(url)
+    return http.client.HTTPConnection(address.hostname, address.port)
+
+
+def request(conn, method, path, body=None):
+    """Send the request over the kept-alive connection, return the status and the decoded JSON response."""
+    data = None if body is None else json.dumps(body)
+    conn.request(method, path, data, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def request_body(kind, index, records_per_request, columns):
+    """Return the body of a request of the load test."""
+    if kind == 'records':
+        return {'records': [{column: f'{column} {index}-{i}' for column in columns}
+                            for i in range(records_per_request)]}
+    return {'text': f'Anna Smith from Berlin wrote to anna.smith{index}@example.com about the contract with '
+                    f'Acme Corporation, call +4915112345{index % 1000:03d}.'}
+
+
+def run(kind='records', requests=1000, concurrency=16, records_per_request=10, columns=('name',), url=None,
+        socket_path=None):
+    """Send the requests from concurrent clients. Return the throughput, the client latencies and the server stats."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+    path = '/records' if kind == 'records' else '/text'
+
+    def client():
+        conn = connection(url, socket_path)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                break
+            start = time.perf_counter()
+            status, body = request(conn, 'POST', path, request_body(kind, index, records_per_request, columns))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status != 200:
+                    errors.append(body.get('error'))
+        conn.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    conn = connection(url, socket_path)
+    stats = request(conn, 'GET', '/stats')[1]
+    conn.close()
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {'requests': requests, 'errors': len(errors), 'seconds': round(seconds, 3),
+            'requests_per_second': round(requests / seconds, 1), 'client_p50_ms': round(float(p50), 3),
+            'client_p99_ms': round(float(p99), 3), 'server': stats}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of a local pseudonymization service.')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--socket', default=None, help='connect to this Unix socket instead of the url')
+    parser.add_argument('--kind', default='records', choices=['records', 'text'])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--records-per-request', type=int, default=10)
+    parser.add_argument('--columns', nargs='+', default=['name'], help='mapped columns of the service configuration')
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.kind, args.requests, args.concurrency, args.records_per_request, args.columns, args.url,
+                         args.socket), indent=2))
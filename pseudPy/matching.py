@@ -0,0 +1,158 @@
+import hashlib
+import json
+from collections import OrderedDict
+import os
+import threading
+from spacy.matcher import PhraseMatcher
+
+
+class EntityCache:
+    """Cache of the entities found in free text, keyed by a hash of the paragraph, the spaCy model and the entity
+    configuration. Exact duplicates and templated paragraphs are parsed by spaCy only once.
+
+    Parameters
+    ----------
+    max_size : int
+        Number of paragraphs in the in-memory LRU tier.
+    path : str
+        Folder of the on-disk tier, one JSON file per paragraph. Optional, only the memory tier is used by default.
+
+    The counters *hits*, *disk_hits* and *misses* show the efficiency of the cache, see *summary*.
+    """
+    caches = {}
+
+    def __init__(self, max_size=10000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path=None, max_size=10000):
+        """Return the cache of the folder, which is created once per process and reused by the following jobs."""
+        if path not in cls.caches:
+            cls.caches[path] = EntityCache(max_size=max_size, path=path)
+        return cls.caches[path]
+
+    @staticmethod
+    def config_key(nlp, pos_type, all_ne, patterns, terms_digest):
+        """Return the hash of the model and the entity configuration, terms_digest is the digest of the term list,
+        see TermMatcher.resolve."""
+        config = [nlp.meta.get('name'), nlp.meta.get('version'), pos_type, all_ne, patterns, terms_digest]
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(config, paragraph):
+        """Return the cache key of the paragraph."""
+        return hashlib.sha256(f'{config}\n{paragraph}'.encode('utf-8')).hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], f'{key}.json')
+
+    def get(self, key):
+        """Return the entity spans of the key or None."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits = self.hits + 1
+                return self.entries[key]
+        if self.path is not None and os.path.exists(self.file(key)):
+            with open(self.file(key), 'r', encoding='utf-8') as file:
+                spans = json.load(file)
+            with self.lock:
+                self.hits = self.hits + 1
+                self.disk_hits = self.disk_hits + 1
+            self.remember(key, spans)
+            return spans
+        with self.lock:
+            self.misses = self.misses + 1
+        return None
+
+    def put(self, key, spans):
+        """Store the entity spans of the key in memory and on disk."""
+        self.remember(key, spans)
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.file(key)), exist_ok=True)
+            with open(f'{self.file(key)}.tmp', 'w', encoding='utf-8') as file:
+                json.dump(spans, file)
+            os.replace(f'{self.file(key)}.tmp', self.file(key))
+
+    def remember(self, key, spans):
+        with self.lock:
+            self.entries[key] = spans
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def summary(self):
+        """Return the counters of the cache as dictionary."""
+        requests = self.hits + self.misses
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.entries),
+                'hit_rate': self.hits / requests if requests else 0.0}
+
+
+class TermMatcher:
+    """Compile a custom term list into a spaCy PhraseMatcher. The matching cost grows with the length of the text,
+    not with the number of terms. Compiled matchers are kept in memory for the following documents of the process,
+    e.g. the files of a BatchRunner worker, and are identified by a digest of the model and the terms. The terms of a
+    known file or list are neither read nor hashed again, they are looked up by the path or the list first.
+    """
+    matchers = {}
+    sources = {}
+
+    @staticmethod
+    def read_terms(terms):
+        """Return the list of terms of a file with one term per line or of an iterable, empty terms are skipped."""
+        if isinstance(terms, str):
+            with open(terms, 'r', encoding='utf-8') as file:
+                return [line.strip() for line in file if line.strip()]
+        return [str(term).strip() for term in terms if str(term).strip()]
+
+    @staticmethod
+    def digest(nlp, term_list):
+        """Return the hash of the model and the terms."""
+        return hashlib.sha256('\n'.join([nlp.meta.get('name', ''), nlp.meta.get('version', '')] + term_list)
+                              .encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def source_key(nlp, terms):
+        """Return the key of the terms without reading them: the path and modification time of a file or the identity
+        of a list, and the vocabulary of the model."""
+        if isinstance(terms, str):
+            return id(nlp.vocab), os.path.abspath(terms), os.path.getmtime(terms)
+        return id(nlp.vocab), id(terms)
+
+    @classmethod
+    def resolve(cls, nlp, terms):
+        """Return the digest and the PhraseMatcher of the terms for the vocabulary of the spaCy model.
+
+        Parameters
+        ----------
+        nlp : spaCy Language
+            Model, which tokenizes the terms.
+        terms : str or iterable
+            Path to a file with one term per line or the terms.
+        """
+        key = TermMatcher.source_key(nlp, terms)
+        source = cls.sources.get(key)
+        # the list is kept with the entry, so that its id is not reused by another list
+        if source is not None and (isinstance(terms, str) or source[0] is terms):
+            return source[1], source[2]
+        term_list = TermMatcher.read_terms(terms)
+        digest = TermMatcher.digest(nlp, term_list)
+        matcher = cls.matchers.get(digest)
+        if matcher is None or matcher.vocab is not nlp.vocab:
+            # the tokenizer is enough for exact phrases, the statistical pipeline is not run on the terms
+            matcher = PhraseMatcher(nlp.vocab)
+            matcher.add('TERMS', list(nlp.tokenizer.pipe(term_list, batch_size=10000)))
+            cls.matchers[digest] = matcher
+        cls.sources[key] = (terms, digest, matcher)
+        return digest, matcher
+
+    @classmethod
+    def load(cls, nlp, terms):
+        """Return the PhraseMatcher of the terms for the vocabulary of the spaCy model, see resolve."""
+        return cls.resolve(nlp, terms)[1]
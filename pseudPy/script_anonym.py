@@ -1,4 +1,5 @@
 import argparse
+import cProfile
 import re
 
 import yaml
@@ -6,6 +7,7 @@ from yaml import CLoader as Loader
 import Pseudonymization as pseudPy
 import pandas.errors
 import pandas as pd
+import polars as pl
 
 
 def is_valid_date(date):
@@ -13,12 +15,20 @@ def is_valid_date(date):
     return bool(date_regex.match(date))
 
 
-def main(config_file):
-    is_structured = True
-
+def main(config_file, processes=None):
     with open(config_file, 'r') as config_file:
         config = yaml.load(config_file, Loader=Loader)
 
+    if pseudPy.BatchRunner.is_batch(config["input_file"]):
+        print(pseudPy.BatchRunner(run_config, config, processes=processes).run())
+    else:
+        run_config(config)
+
+
+def run_config(config):
+    """Aggregate and k-anonymize the input file of the configuration, return the number of rows."""
+    is_structured = True
+
     agg_columns = config["agg_columns"].split(",")
     agg_columns = [i.strip() for i in agg_columns]
     input_file = config["input_file"]
@@ -51,7 +61,16 @@ def main(config_file):
                     )
                     input_df = agg.group_dates_to_years()
     df_header = input_df.columns.to_list()
-    if k > 0:
+    if k > 0 and config.get("k_anonymity_method", "depths") == "mondrian":
+        k_anonymity = pseudPy.KAnonymity(
+            df=pl.from_pandas(input_df),
+            k=k,
+            quasi_identifiers=config.get("quasi_identifiers"),
+            output=output
+        )
+        k_anonymity.mondrian()
+        print(k_anonymity.metrics)
+    elif k > 0:
         depths = {}
         if k > 0:
             for col in df_header:
@@ -63,11 +82,22 @@ def main(config_file):
             output=output
         )
         k_anonymity.k_anonymity()
+    return len(input_df)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('config_file', type=str)
+    parser.add_argument('--profile', nargs='?', const='anonym.prof', default=None,
+                        help='dump a cProfile trace (pstats format, e.g. for snakeviz or flameprof) to this file')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes, if input_file is a directory or glob pattern')
     args = parser.parse_args()
 
-    main(args.config_file)
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.runcall(main, args.config_file, processes=args.processes)
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to {args.profile}")
+    else:
+        main(args.config_file, processes=args.processes)
@@ -12,6 +12,11 @@ def main(config_file):
     with open(config_file, 'r') as config_file:
         config = yaml.load(config_file, Loader=Loader)
 
+    run_config(config)
+
+
+def run_config(config):
+    """Check the k-anonymity of the input file of the configuration, return the number of rows."""
     input_file = config["input_file"]
     k = config["k"]
 
@@ -29,6 +34,7 @@ def main(config_file):
             depths=depths
         )
         print(is_k_anonym.is_k_anonymized())
+        return len(input_df)
     except pandas.errors.ParserError:
         print("Error: The data is not structured. Aggregation or k-anonymization is only available for structured data.")
 
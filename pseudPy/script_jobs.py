@@ -0,0 +1,120 @@
+import argparse
+import functools
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import polars as pl
+import yaml
+from yaml import CLoader as Loader
+
+import Pseudonymization as pseudPy
+import script_anonym
+import script_check_k_anonymity
+import script_pseudonym
+
+
+def read_jobs(jobs_file):
+    """Return the jobs of a YAML file (a list, or one document per job) or of a JSON lines file as tuples of the job
+    type and its configuration. A job spec names the *job* type and a *config* file, the other keys of the spec
+    override the configuration, e.g. the input_file and the output. A directory or glob pattern as input_file is
+    expanded to one job per file, see BatchRunner."""
+    with open(jobs_file, 'r') as file:
+        if jobs_file.endswith(('.jsonl', '.ndjson')):
+            specs = [json.loads(line) for line in file if line.strip()]
+        else:
+            specs = []
+            for document in yaml.load_all(file, Loader=Loader):
+                if document is not None:
+                    specs.extend(document if isinstance(document, list) else [document])
+    jobs = []
+    for spec in specs:
+        job = spec.get('job', 'pseudonym')
+        if job not in job_handlers:
+            raise ValueError(f"Invalid job type {job}, use one of {', '.join(job_handlers)}")
+        config = {}
+        if spec.get('config') is not None:
+            with open(spec['config'], 'r') as config_file:
+                config = yaml.load(config_file, Loader=Loader)
+        config.update({key: value for key, value in spec.items() if key not in ('job', 'config')})
+        if pseudPy.BatchRunner.is_batch(config['input_file']):
+            runner = pseudPy.BatchRunner(None, config)
+            base, files = runner.input_files(config['input_file'])
+            jobs.extend((job, runner.file_config(base, file)) for file in files)
+        else:
+            jobs.append((job, config))
+    return jobs
+
+
+def run_job(job, config):
+    """Run a single job, return the number of rows. Runs in the worker processes."""
+    return job_handlers[job](config)
+
+
+def run_jobs(jobs, processes=None, manifest=None):
+    """Run the jobs one after the other in this process, or on a pool of worker processes. Polars, the spaCy model,
+    the term matchers and the entity caches are loaded once per process and reused by the following jobs. Errors of
+    a job are recorded and the next job is run.
+
+    Parameters
+    ----------
+    jobs : list
+        Tuples of the job type and the configuration, see read_jobs.
+    processes : int
+        Number of worker processes. Optional, the jobs run in this process by default.
+    manifest : str
+        Path of a csv file, which lists the rows, seconds and status of every job. Optional.
+
+    Returns
+    -------
+    The manifest as Polars Dataframe, in the order of the jobs.
+    """
+    records = []
+
+    def record(index, job, result):
+        records.append({'index': index, 'job': job, **result})
+        print(f"[{len(records)}/{len(jobs)}] {job} {result['input_file']}: {result['status']} "
+              f"({result['seconds']} s)")
+
+    if not processes or processes <= 1:
+        for index, (job, config) in enumerate(jobs):
+            record(index, job, pseudPy.BatchRunner.run_file(functools.partial(run_job, job), config))
+    else:
+        # spawn starts clean workers, forking a process with running Polars threads can deadlock
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(pseudPy.BatchRunner.run_file, functools.partial(run_job, job), config): (index, job)
+                       for index, (job, config) in enumerate(jobs)}
+            for future in as_completed(futures):
+                record(*futures[future], future.result())
+    df_manifest = pl.DataFrame(records, schema={'index': pl.Int64, 'job': pl.Utf8, 'input_file': pl.Utf8,
+                                                'output': pl.Utf8, 'rows': pl.Int64, 'seconds': pl.Float64,
+                                                'status': pl.Utf8, 'error': pl.Utf8}).sort('index')
+    if manifest is not None:
+        df_manifest.write_csv(manifest)
+    return df_manifest
+
+
+def main(jobs_file, processes=None, manifest=None):
+    df_manifest = run_jobs(read_jobs(jobs_file), processes, manifest)
+    print(df_manifest)
+    print(f"{df_manifest.height} jobs, {df_manifest.filter(pl.col('status') != 'ok').height} failed, "
+          f"{df_manifest['seconds'].sum():.3f} s")
+
+
+job_handlers = {
+    'pseudonym': script_pseudonym.run_config,
+    'anonym': script_anonym.run_config,
+    'check_k_anonymity': script_check_k_anonymity.run_config,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many pseudonymization and anonymization jobs in one process or '
+                                                 'on a small pool of worker processes.')
+    parser.add_argument('jobs_file', type=str, help='YAML or JSON lines (.jsonl) file with one job spec per job')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes, the jobs run in this process by default')
+    parser.add_argument('--manifest', default=None, help='write the timing and status of every job to this csv file')
+    args = parser.parse_args()
+
+    main(args.jobs_file, args.processes, args.manifest)
@@ -1,4 +1,5 @@
 import argparse
+import cProfile
 
 import yaml
 from yaml import CLoader as Loader
@@ -7,12 +8,27 @@ import polars as pl
 import polars.exceptions
 
 
-def main(config_file):
-    is_structured = True
-
+def main(config_file, stats=None, preview=None, sample=False, processes=None):
     with open(config_file, 'r') as config_file:
         config = yaml.load(config_file, Loader=Loader)
 
+    if Pseudonymization.BatchRunner.is_batch(config["input_file"]):
+        if preview is not None:
+            print("Error: the preview is not available for a directory or glob pattern.")
+            return
+        manifest = Pseudonymization.BatchRunner(run_config, config, processes=processes,
+                                                initializer=Pseudonymization.Helpers.load_nlp).run()
+        print(manifest)
+    else:
+        # a single csv file is split into shards for the worker processes
+        run_config(config if processes is None else {**config, "processes": processes}, stats, preview, sample)
+
+
+def run_config(config, stats=None, preview=None, sample=False):
+    """Pseudonymize the input file of the configuration, return the number of rows of structured data."""
+    is_structured = True
+    stats = Pseudonymization.PipelineStats() if stats is None else stats
+
     map_columns = config["map_columns"]
     map_method = config["map_method"]
     input_file = config["input_file"]
@@ -23,9 +39,21 @@ def main(config_file):
     encrypt_map = config["encrypt_map"]
     all_ne = config["all_ne"]
     seed = config["seed"]
+    keyring = config.get("keyring")
+    mapping_format = config.get("mapping_format", "csv")
+    compression = config.get("compression")
+    chunk_size = config.get("chunk_size")
+    workers = config.get("workers")
+    terms = config.get("terms")
+    entity_cache = config.get("entity_cache")
+    sink = config.get("sink")
+    counter_mode = config.get("counter_mode", "serial")
+    processes = config.get("processes")
 
     try:
-        pl.read_csv(input_file)
+        if not input_file.endswith('.parquet'):
+            # the first row is enough to detect the structure, the file is not read as a whole
+            pl.read_csv(input_file, n_rows=1)
         print("The data is structured.")
     except polars.exceptions.ComputeError:
         is_structured = False
@@ -41,18 +69,55 @@ def main(config_file):
         mapping=mapping,
         encrypt_map=encrypt_map,
         all_ne=all_ne,
-        seed=seed
+        seed=seed,
+        stats=stats,
+        keyring=keyring,
+        mapping_format=mapping_format,
+        compression=compression,
+        chunk_size=chunk_size,
+        workers=workers,
+        terms=terms,
+        entity_cache=Pseudonymization.EntityCache.load(entity_cache) if entity_cache else None,
+        sink=sink,
+        counter_mode=counter_mode,
+        processes=processes
     )
 
-    if not is_structured:
+    if preview is not None:
+        if not is_structured:
+            print("Error: the preview is only available for structured data.")
+            return
+        df, mappings = pseudo.preview(preview, sample=sample)
+        print(df)
+        for df_map in mappings:
+            print(df_map)
+    elif not is_structured:
         pseudo.nlp_pseudonym()
     else:
         pseudo.pseudonym()
+        return sum(record['rows'] or 0 for record in stats.records if record['stage'] == 'read_csv')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('config_file', type=str)
+    parser.add_argument('--profile', nargs='?', const='pseudonym.prof', default=None,
+                        help='dump a cProfile trace (pstats format, e.g. for snakeviz or flameprof) to this file')
+    parser.add_argument('--preview', type=int, default=None, metavar='N',
+                        help='print the pseudonymized first N rows and their mappings without writing any files')
+    parser.add_argument('--sample', action='store_true',
+                        help='preview a random sample of N rows instead of the first rows')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes for the files of a directory or glob pattern, or for the '
+                             'shards of a single csv file')
     args = parser.parse_args()
 
-    main(args.config_file)
+    if args.profile is not None:
+        pipeline_stats = Pseudonymization.PipelineStats()
+        profiler = cProfile.Profile()
+        profiler.runcall(main, args.config_file, pipeline_stats, args.preview, args.sample, processes=args.processes)
+        profiler.dump_stats(args.profile)
+        print(pipeline_stats.summary())
+        print(f"Profile written to {args.profile}")
+    else:
+        main(args.config_file, preview=args.preview, sample=args.sample, processes=args.processes)
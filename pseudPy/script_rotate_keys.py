@@ -0,0 +1,42 @@
+import argparse
+import glob
+import os
+
+import Pseudonymization as pseudPy
+
+
+def main(mapping_files, keyring, key_dir=None, scheme=False, chunk_size=100000):
+    paths = []
+    for pattern in mapping_files:
+        paths.extend(sorted(glob.glob(pattern)))
+    if not paths:
+        print("Error: no mapping files found.")
+        return
+    for path in paths:
+        if not os.path.basename(path).startswith('mapping_output_'):
+            print(f"Error: {path} is not a mapping file mapping_output_<column>.csv.")
+            return
+
+    try:
+        versions = pseudPy.Keyring.load(keyring).rotate(paths, key_dir=key_dir, scheme=scheme, chunk_size=chunk_size)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    for column, version in versions.items():
+        print(f"Column {column} re-encrypted with key version {version}.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-encrypt encrypted mapping tables with new key versions.')
+    parser.add_argument('mapping_files', nargs='+', help='mapping files or glob patterns, e.g. out/mapping_output_*.csv')
+    parser.add_argument('--keyring', required=True, help='keyring file, which receives the new key versions')
+    parser.add_argument('--key-dir', default=None,
+                        help='folder of the secure_key_<column>.txt files of columns, which are not in the keyring yet')
+    parser.add_argument('--scheme', default=False, choices=['aes-ecb', 'aes-siv'],
+                        help='encryption scheme of the new keys, keeps the current scheme by default. Keys of the fpe '
+                             'method encrypt the output, not the mapping files, and cannot be rotated')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    main(args.mapping_files, args.keyring, args.key_dir, None if args.scheme == 'aes-ecb' else args.scheme,
+         args.chunk_size)
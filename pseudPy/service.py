@@ -0,0 +1,169 @@
+import argparse
+import collections
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import yaml
+from yaml import CLoader as Loader
+
+import Pseudonymization as pseudPy
+
+
+class Latency:
+    """Latencies of the last requests of an endpoint."""
+
+    def __init__(self, size=10000):
+        self.values = collections.deque(maxlen=size)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.values.append(seconds)
+            self.count = self.count + 1
+
+    def summary(self):
+        """Return the number of requests and the p50 and p99 latency in milliseconds."""
+        with self.lock:
+            values = np.array(self.values)
+            count = self.count
+        if count == 0:
+            return {'requests': 0, 'p50_ms': None, 'p99_ms': None}
+        p50, p99 = np.percentile(values, [50, 99]) * 1000
+        return {'requests': count, 'p50_ms': round(float(p50), 3), 'p99_ms': round(float(p99), 3)}
+
+
+class Service(pseudPy.AsyncPseudonymization):
+    """Pseudonymization service, which keeps the spaCy model, the secret keys and the counter in memory and groups
+    concurrent requests into micro-batches, see AsyncPseudonymization. Records the latency of every request.
+
+    Parameters
+    ----------
+    config : dict
+        Configuration of the service with the keys *map_method*, *map_columns* and *patterns* (filter) for records,
+        *pos_type*, *all_ne*, *text_patterns* and *terms* for texts, and *encrypt_map*, *mapping*, *output*,
+        *keyring*, *seed*, *max_batch* and *max_delay_ms*. The mappings are appended to the mapping files in the output
+        folder, if *output* is set.
+    """
+
+    def __init__(self, config):
+        super().__init__(config.get('map_method') or 'counter', config.get('map_columns'),
+                         pos_type=config.get('pos_type'), all_ne=config.get('all_ne', False),
+                         patterns=config.get('patterns'), text_patterns=config.get('text_patterns'),
+                         terms=config.get('terms'), output=config.get('output'), mapping=config.get('mapping', True),
+                         encrypt_map=config.get('encrypt_map', False), seed=config.get('seed'),
+                         keyring=config.get('keyring'), max_batch=config.get('max_batch', 256),
+                         max_delay=config.get('max_delay_ms', 5) / 1000)
+        self.latency = {'records': Latency(), 'text': Latency()}
+
+    def summary(self):
+        """Return the latency and the batching of the endpoints."""
+        summary = super().summary()
+        for name, latency in self.latency.items():
+            summary[name] = {**latency.summary(), **summary[name]}
+        return summary
+
+
+class Handler(BaseHTTPRequestHandler):
+    """JSON endpoints: *POST /records* with *{"records": [...]}*, *POST /text* with *{"text": "..."}* or
+    *{"texts": [...]}*, *GET /stats* and *GET /health*."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        start = time.perf_counter()
+        service = self.server.service
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            return self.reply(400, {'error': 'Invalid JSON'})
+        try:
+            if self.path == '/records':
+                records = body.get('records')
+                if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                    return self.reply(400, {'error': 'records must be a list of objects'})
+                result = {'records': service.records.submit(records).result() if records else []}
+            elif self.path == '/text':
+                if 'texts' in body:
+                    futures = [service.texts.submit(str(text)) for text in body['texts']]
+                    result = {'texts': [future.result() for future in futures]}
+                else:
+                    result = {'text': service.texts.submit(str(body.get('text', ''))).result()}
+            else:
+                return self.reply(404, {'error': 'Not found'})
+        except Exception as error:
+            return self.reply(500, {'error': str(error) or type(error).__name__})
+        service.latency['records' if self.path == '/records' else 'text'].add(time.perf_counter() - start)
+        self.reply(200, result)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            return self.reply(200, self.server.service.summary())
+        if self.path == '/health':
+            return self.reply(200, {'status': 'ok'})
+        self.reply(404, {'error': 'Not found'})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None, verbose=False):
+    """Return the HTTP server of the service on the host and port, or on the Unix socket, if socket_path is set."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main(config_file, host, port, socket_path=None, verbose=False):
+    with open(config_file, 'r') as config_file:
+        config = yaml.load(config_file, Loader=Loader)
+    service = Service(config)
+    server = make_server(service, host, port, socket_path, verbose)
+    print(f"Serving on {socket_path if socket_path is not None else f'http://{host}:{server.server_port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(json.dumps(service.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve pseudonymization of records and texts over local HTTP.')
+    parser.add_argument('config_file', type=str)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None, help='listen on this Unix socket instead of the port')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    main(args.config_file, args.host, args.port, args.socket, args.verbose)
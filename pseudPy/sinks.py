@@ -0,0 +1,277 @@
+import io
+import time
+import sys
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+import queue
+import threading
+import re
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+if __package__:
+    from .stats import PipelineStats
+else:
+    from stats import PipelineStats
+
+
+class OutputSink:
+    """Destination of the output files of a job. Every file is opened once per job as a buffered writer and committed
+    to the destination, when the sink is closed at the end of the job. Writing a file again without append starts it
+    anew, so nothing is written twice.
+
+    Use LocalSink for a folder, MemorySink to keep the files in memory, ArchiveSink for a tar or zip archive and
+    StdoutSink to print them. *OutputSink.load* selects the sink for a folder, an archive path, *'memory'* or
+    *'stdout'*.
+    """
+    archive_extensions = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+    buffer_size = 1 << 20
+
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load(target):
+        """Return the sink of the target: an OutputSink, *'memory'*, *'stdout'*, an archive path or a folder."""
+        if isinstance(target, OutputSink):
+            return target
+        if target == 'memory':
+            return MemorySink()
+        if target in ['stdout', '-']:
+            return StdoutSink()
+        if target.endswith(OutputSink.archive_extensions):
+            return ArchiveSink(target)
+        return LocalSink(target)
+
+    def open(self, name, append=False):
+        """Return the writer of the file. The file is started anew, unless append is True."""
+        with self.lock:
+            if name in self.files and not append:
+                self.files.pop(name).close()
+            if name not in self.files:
+                self.files[name] = self.create(name, append)
+            return self.files[name]
+
+    def create(self, name, append):
+        """Return a new writer of the file, a temporary file, which spills to disk, by default."""
+        return tempfile.SpooledTemporaryFile(max_size=OutputSink.buffer_size)
+
+    def write(self, name, data, append=False):
+        """Write bytes or a string to the file. Return the number of written bytes."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self.open(name, append).write(data)
+
+    def commit(self, name, file):
+        """Pass the complete file, positioned at its start, to the destination."""
+
+    def close(self):
+        """Commit all files to the destination."""
+        with self.lock:
+            files, self.files = self.files, {}
+        for name, file in files.items():
+            file.flush()
+            file.seek(0)
+            self.commit(name, file)
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalSink(OutputSink):
+    """Write the files to a folder. The files are written through buffered file handles, which stay open until the
+    end of the job."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def create(self, name, append):
+        return open(os.path.join(self.path, name), 'ab' if append else 'wb', buffering=OutputSink.buffer_size)
+
+
+class MemorySink(OutputSink):
+    """Keep the files in memory, e.g. for services and tests. The content is available in *contents* after the job."""
+
+    def __init__(self):
+        super().__init__()
+        self.contents = {}
+
+    def create(self, name, append):
+        buffer = io.BytesIO()
+        if append and name in self.contents:
+            buffer.write(self.contents[name])
+        return buffer
+
+    def commit(self, name, file):
+        self.contents[name] = file.getvalue()
+
+    def getvalue(self, name):
+        """Return the content of the file as bytes."""
+        return self.contents[name]
+
+
+class ArchiveSink(OutputSink):
+    """Write the files to a zip archive or a tar archive, compressed like the extension, e.g. *.tar.gz*."""
+
+    def __init__(self, path):
+        super().__init__()
+        if not path.endswith(OutputSink.archive_extensions):
+            raise ValueError(f"Invalid archive, use one of {', '.join(OutputSink.archive_extensions)}")
+        self.path = path
+        self.archive = None
+
+    def close(self):
+        if self.path.endswith('.zip'):
+            self.archive = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            mode = {'.tar': '', '.gz': 'gz', '.tgz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}[os.path.splitext(self.path)[1]]
+            self.archive = tarfile.open(self.path, f'w:{mode}')
+        try:
+            super().close()
+        finally:
+            archive, self.archive = self.archive, None
+            archive.close()
+
+    def commit(self, name, file):
+        if isinstance(self.archive, zipfile.ZipFile):
+            with self.archive.open(name, 'w', force_zip64=True) as member:
+                shutil.copyfileobj(file, member, OutputSink.buffer_size)
+            return
+        info = tarfile.TarInfo(name)
+        info.size = file.seek(0, os.SEEK_END)
+        info.mtime = int(time.time())
+        file.seek(0)
+        self.archive.addfile(info, file)
+
+
+class StdoutSink(OutputSink):
+    """Print the files to the standard output. If the job writes more than one file, every file is preceded by a
+    *==> name <==* line."""
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream
+        self.headers = False
+
+    def close(self):
+        self.headers = len(self.files) > 1
+        super().close()
+        self.output_stream().flush()
+
+    def output_stream(self):
+        return self.stream if self.stream is not None else sys.stdout.buffer
+
+    def commit(self, name, file):
+        stream = self.output_stream()
+        if self.headers:
+            stream.write(f'==> {name} <==\n'.encode('utf-8'))
+        shutil.copyfileobj(file, stream, OutputSink.buffer_size)
+
+
+class KeepOpen(io.RawIOBase):
+    """Writable view of a sink file, which is not closed with the view, e.g. by the pyarrow writers."""
+
+    def __init__(self, file):
+        super().__init__()
+        self.file = file
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+
+class OutputWriter:
+    """Background thread, which compresses and writes the output files, so that the compression overlaps with the
+    pseudonymization. Appended Dataframes are written to the same open stream.
+
+    Parameters
+    ----------
+    compression : str
+        *'gzip'* or *'zstd'* for compressed csv, *'parquet'* for Parquet files with zstd.
+    stats : PipelineStats
+        Collector for the timings of the writer thread. Optional.
+    max_queue : int
+        Number of Dataframes waiting for the writer, before the pseudonymization is blocked.
+    sink : OutputSink
+        Destination of the files. Optional, the file names are paths relative to the working directory by default.
+    """
+    extensions = {'gzip': '.csv.gz', 'zstd': '.csv.zst', 'parquet': '.parquet'}
+
+    def __init__(self, compression, stats=None, max_queue=4, sink=None):
+        if compression not in OutputWriter.extensions:
+            raise ValueError("Invalid compression")
+        self.compression = compression
+        self.stats = stats
+        self.sink = sink if sink is not None else LocalSink(os.curdir)
+        self.streams = {}
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def path(self, name):
+        """Return the name of the compressed file."""
+        return re.sub(r'\.csv$', '', name) + OutputWriter.extensions[self.compression]
+
+    def write(self, df, name, append=False):
+        """Pass the Dataframe to the writer thread, overwrite the file if append is False."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((df, self.path(name), append))
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            if self.error is not None:
+                continue
+            df, name, append = job
+            try:
+                with PipelineStats.track(self.stats, f'write_{self.compression}', rows=df.height):
+                    self.write_stream(df, name, append)
+            except Exception as error:
+                self.error = error
+
+    def write_stream(self, df, name, append):
+        if not append and name in self.streams:
+            self.close_stream(name)
+        if self.compression == 'parquet':
+            table = df.to_arrow()
+            if name not in self.streams:
+                self.streams[name] = pq.ParquetWriter(KeepOpen(self.sink.open(name, append)), table.schema,
+                                                      compression='zstd')
+            writer = self.streams[name]
+            writer.write_table(table.cast(writer.schema))
+        else:
+            include_header = name not in self.streams
+            if include_header:
+                self.streams[name] = pa.CompressedOutputStream(KeepOpen(self.sink.open(name, append)),
+                                                               self.compression)
+            self.streams[name].write(df.write_csv(include_header=include_header).encode('utf-8'))
+
+    def close_stream(self, name):
+        self.streams.pop(name).close()
+
+    def close(self):
+        """Write the remaining Dataframes and close all files."""
+        self.queue.put(None)
+        self.thread.join()
+        for path in list(self.streams):
+            self.close_stream(path)
+        if self.error is not None:
+            raise self.error
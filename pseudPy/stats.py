@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager, nullcontext
+import polars as pl
+
+
+class PipelineStats:
+    """Collector for the per-stage timings of a pseudonymization job.
+
+    Parameters
+    ----------
+    callback : callable
+        Function called with every finished stage record, e.g. for logging or tracing. Optional.
+
+    Every record is a dictionary with the keys *'stage', 'column', 'seconds', 'rows'* and *'bytes'*.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = []
+
+    @staticmethod
+    def track(stats, stage, column=None, rows=None):
+        """Time a stage if a collector is passed, otherwise do nothing. Yield the record to update rows and bytes."""
+        if stats is None:
+            return nullcontext({})
+        return stats.stage(stage, column=column, rows=rows)
+
+    @contextmanager
+    def stage(self, stage, column=None, rows=None):
+        """Measure the wall time of a stage."""
+        record = {'stage': stage, 'column': column, 'seconds': None, 'rows': rows, 'bytes': None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.records.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def summary(self):
+        """Return the total time, rows and bytes of every stage as Polars DataFrame."""
+        records = pl.DataFrame(self.records, schema={'stage': pl.Utf8, 'column': pl.Utf8, 'seconds': pl.Float64,
+                                                     'rows': pl.Int64, 'bytes': pl.Int64})
+        return records.group_by('stage', maintain_order=True).agg(
+            pl.len().alias('calls'), pl.sum('seconds'), pl.sum('rows'), pl.sum('bytes'))
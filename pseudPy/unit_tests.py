@@ -1,10 +1,25 @@
 import os
+import random
+import asyncio
+import shutil
 import sys
+import tarfile
+import hashlib
+import io
+import json
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
 import polars as pl
 from polars.testing import assert_frame_equal
 import Pseudonymization as pseudPy
+import load_test
+import script_jobs
+import service
 import yaml
+from cryptography.exceptions import InvalidTag
 from yaml import CLoader as Loader
 import pandas as pd
 
@@ -13,6 +28,12 @@ path_to_repo = f'{os.getcwd()}'
 test_files_folder = f'{path_to_repo}/test_files'
 
 
+def hash_names_job(config):
+    """Job of the batch mode tests, runs in the worker processes."""
+    pseudPy.Pseudonymization('hash', 'name', input_file=config['input_file'], output=config['output']).pseudonym()
+    return pl.read_csv(config['input_file']).height
+
+
 class TestStructuredPseudonymization(unittest.TestCase):
 
     def test_pseudonym_with_valid_data_and_counter_method(self):
@@ -269,6 +290,542 @@ class TestStructuredPseudonymization(unittest.TestCase):
         else:
             print('Files do not exist')
 
+    def test_pseudonym_with_stats(self):
+        """Collect the per-stage timings, row counts and bytes written of a pseudonymization job."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        output_path = f'{test_files_folder}/output.csv'
+        records = []
+        stats = pseudPy.PipelineStats(callback=records.append)
+
+        pseudo = pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                          stats=stats)
+        pseudo.pseudonym()
+
+        summary = stats.summary()
+        stages = summary['stage'].to_list()
+        for stage in ['read_csv', 'filter_nulls', 'int_to_str', 'map:counter', 'write_csv']:
+            self.assertIn(stage, stages)
+        self.assertEqual(len(records), summary['calls'].sum())
+        written = summary.filter(pl.col('stage') == 'write_csv')['bytes'][0]
+        self.assertEqual(written, os.path.getsize(output_path)
+                         + os.path.getsize(f'{test_files_folder}/mapping_output_name.csv'))
+
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            os.remove(f'{test_files_folder}/mapping_output_name.csv')
+            print('Files successfully removed')
+        else:
+            print('Files do not exist')
+
+    def test_pseudonym_chunked_with_progress(self):
+        """Pseudonymize structured data in chunks, the output must match the output of a single pass."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        output_path = f'{test_files_folder}/output.csv'
+        progress = []
+
+        pseudo = pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                          chunk_size=100, progress=lambda done, total: progress.append(done))
+        pseudo.pseudonym()
+
+        actual_output = pl.read_csv(output_path)
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_output_plain_user_data.csv')
+        pl.testing.assert_frame_equal(expected_output, actual_output)
+
+        actual_output = pl.read_csv(f'{test_files_folder}/mapping_output_name.csv')
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_mapping_0_plain_user_data.csv')
+        pl.testing.assert_frame_equal(expected_output, actual_output)
+
+        self.assertGreater(len(progress), 1)
+        self.assertEqual(progress[-1], pl.read_csv(input_file).height)
+
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            os.remove(f'{test_files_folder}/mapping_output_name.csv')
+            print('Files successfully removed')
+        else:
+            print('Files do not exist')
+
+    def test_pseudonym_chunked_cancel(self):
+        """Stop a chunked job through the cancel event."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        cancel = threading.Event()
+
+        def progress(done, total):
+            cancel.set()
+
+        pseudo = pseudPy.Pseudonymization('hash', 'name', input_file=input_file, output=test_files_folder,
+                                          chunk_size=100, progress=progress, cancel=cancel)
+        with self.assertRaises(pseudPy.JobCancelled):
+            pseudo.pseudonym()
+
+        self.assertLess(pl.read_csv(f'{test_files_folder}/output.csv').height, pl.read_csv(input_file).height)
+
+        if os.path.exists(f'{test_files_folder}/output.csv'):
+            os.remove(f'{test_files_folder}/output.csv')
+            os.remove(f'{test_files_folder}/mapping_output_name.csv')
+            print('Files successfully removed')
+        else:
+            print('Files do not exist')
+
+    def test_preview_with_encrypted_maps(self):
+        """Preview the first rows and a random sample of structured data. No files must be written."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        # key files left by other tests would hide a key file written by the preview
+        for column in ['name', 'country']:
+            if os.path.exists(f'{test_files_folder}/secure_key_{column}.txt'):
+                os.remove(f'{test_files_folder}/secure_key_{column}.txt')
+        files_before = sorted(os.listdir(test_files_folder))
+
+        pseudo = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                          output=test_files_folder, encrypt_map=True)
+        df, mappings = pseudo.preview(10)
+
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_output_plain_user_data.csv').head(10)
+        pl.testing.assert_series_equal(expected_output['gender'], df['gender'])
+        self.assertEqual(df.columns[:2], ['Index_name', 'Index_country'])
+        self.assertEqual(len(mappings), 2)
+        self.assertEqual(mappings[0].height, 10)
+
+        df, mappings = pseudo.preview(10, sample=True)
+        self.assertEqual(df.height, 10)
+        self.assertEqual(sorted(os.listdir(test_files_folder)), files_before)
+
+    def test_pseudonym_with_compound_filter(self):
+        """Filter structured data with a compound expression, which is pushed into the scan of the input file."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        patterns = {'and': [['salary', '>', 100000],
+                            {'or': [['gender', 'in', ['Female', 'Male']], ['country', 'starts_with', 'C']]},
+                            {'not': ['salary', 'between', [150000, 160000]]}]}
+
+        pseudo = pseudPy.Pseudonymization('hash', 'name', input_file=input_file, patterns=patterns)
+        df, mappings = pseudo.pseudonym()
+
+        df_input = pl.read_csv(input_file)
+        expected = df_input.filter((pl.col('salary') > 100000)
+                                   & (pl.col('gender').is_in(['Female', 'Male'])
+                                      | pl.col('country').str.starts_with('C'))
+                                   & ~pl.col('salary').is_between(150000, 160000))
+        self.assertEqual(expected.height, mappings[0].height)
+        pl.testing.assert_series_equal(expected['name'], mappings[0]['name'])
+
+        with self.assertRaises(ValueError):
+            pseudPy.Helpers.filter_expression(['salary', '~', 1])
+
+    def test_pseudonym_filter_keeps_unmatched_rows(self):
+        """Pseudonymize only the rows matching the filter, the other rows stay unchanged in place."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        patterns = ['salary', '>', 100000]
+
+        pseudo = pseudPy.Pseudonymization('counter', 'name', input_file=input_file, patterns=patterns)
+        df, mappings = pseudo.pseudonym()
+
+        df_input = pl.read_csv(input_file).filter(~pl.all_horizontal(pl.all().is_null()))
+        matched = df_input['salary'] > 100000
+        self.assertEqual(df_input.height, df.height)
+        self.assertEqual(matched.sum(), mappings[0].height)
+        self.assertEqual(df.columns.index('Index_name'), df_input.columns.index('name'))
+        pl.testing.assert_series_equal(df_input.filter(~matched)['name'], df.filter(~matched)['Index_name'],
+                                       check_names=False)
+        self.assertEqual([str(i) for i in range(matched.sum())], df.filter(matched)['Index_name'].to_list())
+
+        revert = pseudPy.Pseudonymization(map_columns='name', df=df).revert_pseudonym(mappings[0])
+        pl.testing.assert_series_equal(df_input['name'], revert['name'])
+
+    def test_pseudonym_keeps_native_dtypes(self):
+        """Only the mapped columns are cast to String if needed, counter pseudonyms stay integers."""
+        df = pl.read_csv(f'{test_files_folder}/plain_user_data.csv')
+
+        counter_df, _ = pseudPy.Pseudonymization('counter', 'name', df=df).pseudonym()
+        self.assertEqual(pl.Int64, counter_df.schema['Index_name'])
+        self.assertEqual(df.schema['salary'], counter_df.schema['salary'])
+
+        hash_df, mappings = pseudPy.Pseudonymization('hash', 'salary', df=df).pseudonym()
+        self.assertEqual(pl.Utf8, hash_df.schema['Index_salary'])
+        self.assertEqual(df.schema['country'], hash_df.schema['country'])
+        self.assertEqual(hashlib.sha256(str(df['salary'][0]).encode()).hexdigest(), hash_df['Index_salary'][0])
+
+    def test_pseudonym_fpe_method(self):
+        """Format-preserving encryption keeps length and alphabet and is reverted by the decrypt method."""
+        cipher = pseudPy.FF3Cipher(bytes.fromhex('2DE79D232DF5585D68CE47882AE256D6'),
+                                   bytes.fromhex('CBD09280979564'), '0123456789')
+        numerals = cipher.transform(np.array([[int(d) for d in '3992520240']], dtype=np.uint8))
+        self.assertEqual('8901801106', ''.join(str(d) for d in numerals[0]))
+
+        # the cached cipher is shared by threads, every thread encrypts with its own AES context
+        key = bytes(range(16))
+        cipher = pseudPy.FF3Cipher.cached(key, 'salary', '0123456789')
+        self.assertIs(cipher, pseudPy.FF3Cipher.cached(key, 'salary', '0123456789'))
+        batch = np.random.default_rng(0).integers(0, 10, size=(20000, 8), dtype=np.uint8)
+        expected = cipher.transform(batch)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for result in pool.map(cipher.transform, [batch] * 8):
+                np.testing.assert_array_equal(result, expected)
+
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        pseudo = pseudPy.Pseudonymization('fpe', ['name', 'salary'], input_file=input_file,
+                                          output=test_files_folder)
+        pseudo.pseudonym()
+
+        df_input = pl.read_csv(input_file, dtypes={'salary': pl.Utf8}).filter(
+            ~pl.all_horizontal(pl.all().is_null()))
+        output_path = f'{test_files_folder}/output.csv'
+        df_output = pl.read_csv(output_path, dtypes={'Index_salary': pl.Utf8})
+        self.assertFalse(os.path.exists(f'{test_files_folder}/mapping_output_name.csv'))
+        pl.testing.assert_series_equal(df_input['name'].str.replace_all('[a-z]', 'a').str.replace_all('[A-Z]', 'A'),
+                                       df_output['Index_name'].str.replace_all('[a-z]', 'a')
+                                       .str.replace_all('[A-Z]', 'A'), check_names=False)
+        self.assertTrue(df_output['Index_salary'].str.contains('^[0-9]+$').all())
+        self.assertGreater((df_input['name'] != df_output['Index_name']).sum(), df_input.height // 2)
+
+        # both columns are decrypted in one pass and keep their positions
+        pseudPy.Pseudonymization('decrypt', ['Index_name', 'Index_salary'], input_file=output_path,
+                                 output=test_files_folder).pseudonym()
+        decrypted = pl.read_csv(f'{test_files_folder}/decrypted_output.csv', dtypes={'Index_salary': pl.Utf8})
+        self.assertEqual(decrypted.columns, df_output.columns)
+        for column in ['name', 'salary']:
+            pl.testing.assert_series_equal(df_input[column], decrypted[f'Index_{column}'], check_names=False)
+
+        for file in ['output.csv', 'decrypted_output.csv', 'secure_key_name.txt', 'secure_key_salary.txt']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_pseudonym_aes_siv_method_and_encrypted_maps(self):
+        """Deterministic AES-SIV as map method and as encryption of the mapping, reverted by the decrypt method."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        output_path = f'{test_files_folder}/output.csv'
+        df_input = pl.read_csv(input_file).filter(~pl.all_horizontal(pl.all().is_null()))
+
+        pseudPy.Pseudonymization('aes-siv', 'country', input_file=input_file, output=test_files_folder).pseudonym()
+        with open(f'{test_files_folder}/secure_key_country.txt') as file:
+            self.assertTrue(file.read().startswith('aes-siv:'))
+        df_output = pl.read_csv(output_path)
+        self.assertEqual(df_input['country'].n_unique(), df_output['Index_country'].n_unique())
+        pseudPy.Pseudonymization('decrypt', 'Index_country', input_file=output_path,
+                                 output=test_files_folder).pseudonym()
+        decrypted = pl.read_csv(f'{test_files_folder}/decrypted_output_Index_country.csv')
+        pl.testing.assert_series_equal(df_input['country'], decrypted['Index_country'], check_names=False)
+
+        pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                 encrypt_map='aes-siv').pseudonym()
+        pseudPy.Pseudonymization('decrypt', 'name', input_file=f'{test_files_folder}/mapping_output_name.csv',
+                                 output=test_files_folder).pseudonym()
+        decrypted = pl.read_csv(f'{test_files_folder}/decrypted_output_name.csv')
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_mapping_0_plain_user_data.csv')
+        pl.testing.assert_frame_equal(expected_output, decrypted)
+
+        for file in ['output.csv', 'mapping_output_name.csv', 'decrypted_output_Index_country.csv',
+                     'decrypted_output_name.csv', 'secure_key_country.txt', 'secure_key_name.txt']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_keyring_and_key_rotation(self):
+        """Store the keys in a keyring, re-encrypt the mapping tables chunk by chunk with new key versions."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        keyring_path = f'{test_files_folder}/keyring.json'
+        map_path = f'{test_files_folder}/mapping_output_name.csv'
+
+        pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                 encrypt_map=True, keyring=keyring_path).pseudonym()
+        self.assertFalse(os.path.exists(f'{test_files_folder}/secure_key_name.txt'))
+        encrypted = pl.read_csv(map_path)
+
+        keyring = pseudPy.Keyring.load(keyring_path)
+        self.assertEqual({'name': '2'}, keyring.rotate([map_path], scheme='aes-siv', chunk_size=100))
+        rotated = pl.read_csv(map_path)
+        self.assertEqual(encrypted.height, rotated.height)
+        self.assertFalse((encrypted['name'] == rotated['name']).any())
+        self.assertEqual('aes-siv', keyring.get_key('name')[1])
+
+        pseudPy.Pseudonymization('decrypt', 'name', input_file=map_path, output=test_files_folder,
+                                 keyring=keyring_path).pseudonym()
+        decrypted = pl.read_csv(f'{test_files_folder}/decrypted_output_name.csv')
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_mapping_0_plain_user_data.csv')
+        pl.testing.assert_frame_equal(expected_output, decrypted)
+
+        # keys of the fpe scheme encrypt the output, they are rejected before any key version is added
+        with self.assertRaises(ValueError):
+            keyring.rotate([map_path], scheme='fpe')
+        pseudPy.Pseudonymization('fpe', 'country', input_file=input_file, output=test_files_folder,
+                                 keyring=keyring_path).pseudonym()
+        with self.assertRaises(ValueError):
+            keyring.rotate([map_path, f'{test_files_folder}/mapping_output_country.csv'])
+        self.assertEqual(['1', '2'], sorted(keyring.columns['name']['keys']))
+        self.assertEqual('2', keyring.columns['name']['current'])
+
+        for file in ['output.csv', 'mapping_output_name.csv', 'decrypted_output_name.csv', 'keyring.json']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_key_rotation_failure(self):
+        """A failure while the mapping files are replaced leaves the files decryptable and no temporary files: the new
+        key version is saved before, but becomes current only after all files are replaced."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        keyring_path = f'{test_files_folder}/keyring_rotation.json'
+        map_path = f'{test_files_folder}/mapping_output_name.csv'
+        pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                 encrypt_map=True, keyring=keyring_path).pseudonym()
+        encrypted = pl.read_csv(map_path)
+        replace = os.replace
+
+        def failing_replace(source, target):
+            if target == map_path:
+                raise OSError('disk full')
+            replace(source, target)
+
+        with mock.patch.object(pseudPy.os, 'replace', failing_replace):
+            with self.assertRaises(OSError):
+                pseudPy.Keyring.load(keyring_path).rotate([map_path], chunk_size=100)
+        self.assertFalse(os.path.exists(f'{map_path}.tmp'))
+        pl.testing.assert_frame_equal(encrypted, pl.read_csv(map_path))
+        # the keyring on disk has the new version, the mapping file is still encrypted with the current version
+        with open(keyring_path, 'r') as file:
+            entry = json.load(file)['columns']['name']
+        self.assertEqual(entry['current'], '1')
+        self.assertEqual(sorted(entry['keys']), ['1', '2'])
+        decrypted = pseudPy.Pseudonymization('decrypt', 'name', input_file=map_path,
+                                             keyring=keyring_path).pseudonym()
+        expected_output = pl.read_csv(f'{test_files_folder}/expected_mapping_0_plain_user_data.csv')
+        self.assertEqual(decrypted['name'].to_list(), expected_output['name'].to_list())
+
+        del pseudPy.Keyring.keyrings[os.path.abspath(keyring_path)]
+        for file in ['output.csv', 'mapping_output_name.csv', 'keyring_rotation.json']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_pseudonym_with_mapping_container(self):
+        """Write the mapping as encrypted Arrow container and revert the output from its streamed batches."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        container_path = f'{test_files_folder}/mapping_output_name.arrow'
+
+        pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                 mapping_format='arrow').pseudonym()
+        self.assertFalse(os.path.exists(f'{test_files_folder}/mapping_output_name.csv'))
+
+        df_output = pl.read_csv(f'{test_files_folder}/output.csv')
+        pseudo = pseudPy.Pseudonymization(map_columns='name', df=df_output, output=test_files_folder)
+        batches = pseudo.read_mapping()
+        self.assertNotIsInstance(batches, pl.DataFrame)
+        df_reverted = pseudo.revert_pseudonym(batches)
+        df_input = pl.read_csv(input_file).filter(~pl.all_horizontal(pl.all().is_null()))
+        pl.testing.assert_series_equal(df_input['name'], df_reverted['name'])
+
+        with open(container_path, 'r+b') as file:
+            file.seek(-1, os.SEEK_END)
+            last_byte = file.read(1)
+            file.seek(-1, os.SEEK_END)
+            file.write(bytes([last_byte[0] ^ 1]))
+        with self.assertRaises(InvalidTag):
+            list(pseudo.read_mapping())
+
+        for file in ['output.csv', 'mapping_output_name.arrow', 'reverted_output.csv', 'secure_key_name.txt']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_pseudonym_with_compressed_output(self):
+        """Write gzip, zstd and Parquet output in chunks and read the compressed output back as input."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                 chunk_size=3).pseudonym()
+        df_expected = pl.read_csv(f'{test_files_folder}/output.csv')
+        df_mapping = pl.read_csv(f'{test_files_folder}/mapping_output_name.csv')
+
+        for compression, extension in [('gzip', 'csv.gz'), ('zstd', 'csv.zst'), ('parquet', 'parquet')]:
+            pseudPy.Pseudonymization('counter', 'name', input_file=input_file, output=test_files_folder,
+                                     chunk_size=3, compression=compression).pseudonym()
+            output_file = f'{test_files_folder}/output.{extension}'
+            mapping_file = f'{test_files_folder}/mapping_output_name.{extension}'
+            if compression == 'parquet':
+                df_output, df_output_mapping = pl.read_parquet(output_file), pl.read_parquet(mapping_file)
+            else:
+                df_output, df_output_mapping = pl.read_csv(output_file), pl.read_csv(mapping_file)
+            pl.testing.assert_frame_equal(df_expected, df_output)
+            pl.testing.assert_frame_equal(df_mapping, df_output_mapping)
+
+            df_rehashed = pseudPy.Pseudonymization('hash', 'country', input_file=output_file, mapping=False,
+                                                   chunk_size=4).pseudonym()
+            self.assertEqual(df_rehashed.height, df_expected.height)
+            os.remove(output_file)
+            os.remove(mapping_file)
+
+        with self.assertRaises(ValueError):
+            pseudPy.OutputWriter('bz2')
+        for file in ['output.csv', 'mapping_output_name.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_pseudonym_pipelined(self):
+        """Pseudonymize the chunks with several workers, output and mappings match the serial processing."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        patterns = ['country', 'in', ['China', 'France']]
+        expected = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                            chunk_size=2, patterns=patterns).pseudonym()
+        pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file, output=test_files_folder,
+                                 chunk_size=2, patterns=patterns, workers=3).pseudonym()
+
+        pl.testing.assert_frame_equal(expected[0], pl.read_csv(f'{test_files_folder}/output.csv'),
+                                      check_dtype=False)
+        for df_mapping, column in zip(expected[1], ['name', 'country']):
+            pl.testing.assert_frame_equal(df_mapping, pl.read_csv(f'{test_files_folder}/mapping_output_{column}.csv'),
+                                          check_dtype=False)
+
+        # the numbering of several columns does not depend on the chunks
+        unchunked = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                             patterns=patterns).pseudonym()
+        pl.testing.assert_frame_equal(unchunked[0], expected[0])
+        chunked = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file, chunk_size=7,
+                                           workers=2).pseudonym()
+        unchunked = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file).pseudonym()
+        pl.testing.assert_frame_equal(unchunked[0], chunked[0])
+
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(pseudPy.JobCancelled):
+            pseudPy.Pseudonymization('hash', 'name', input_file=input_file, chunk_size=2, workers=2,
+                                     cancel=cancel).pseudonym()
+        for file in ['output.csv', 'mapping_output_name.csv', 'mapping_output_country.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_pseudonym_sharded(self):
+        """Pseudonymize the byte ranges of the file on a process pool, output and mappings match the serial
+        processing and the encrypted shards share the secret key."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        header, ranges = pseudPy.ShardRunner.byte_ranges(input_file, 3)
+        with open(input_file, 'rb') as file:
+            content = file.read()
+        self.assertEqual(header + b''.join(content[begin:end] for begin, end in ranges), content)
+        self.assertTrue(all(content[begin - 1:begin] == b'\n' for begin, end in ranges))
+        blocks = list(pseudPy.ShardRunner.read_range(input_file, *ranges[0], 1000))
+        self.assertEqual(b''.join(blocks), content[ranges[0][0]:ranges[0][1]])
+        self.assertTrue(all(block.endswith(b'\n') for block in blocks))
+
+        patterns = ['country', 'in', ['China', 'France']]
+        expected = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                            patterns=patterns).pseudonym()
+        pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file, output=test_files_folder,
+                                 patterns=patterns, processes=3).pseudonym()
+        pl.testing.assert_frame_equal(expected[0], pl.read_csv(f'{test_files_folder}/output.csv'), check_dtype=False)
+        for df_mapping, column in zip(expected[1], ['name', 'country']):
+            pl.testing.assert_frame_equal(df_mapping, pl.read_csv(f'{test_files_folder}/mapping_output_{column}.csv'),
+                                          check_dtype=False)
+        self.assertFalse([name for name in os.listdir(test_files_folder) if name.startswith('.shards_')])
+
+        pseudPy.Pseudonymization('aes-siv', 'name', input_file=input_file, output=test_files_folder,
+                                 processes=2).pseudonym()
+        decrypted = pseudPy.Pseudonymization('decrypt', 'Index_name', input_file=f'{test_files_folder}/output.csv',
+                                             output=test_files_folder).pseudonym()
+        self.assertEqual(pl.read_csv(f'{test_files_folder}/decrypted_output_Index_name.csv')['Index_name'].to_list(),
+                         pl.read_csv(input_file)['name'].to_list())
+        for file in ['output.csv', 'mapping_output_name.csv', 'mapping_output_country.csv', 'secure_key_name.txt',
+                     'decrypted_output_Index_name.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_counter_allocator(self):
+        """Counter blocks do not overlap, the fast mode allows gaps but no duplicate pseudonyms."""
+        allocator = pseudPy.CounterAllocator(start=10)
+        starts = []
+        threads = [threading.Thread(target=lambda: starts.extend(allocator.allocate(5) for _ in range(100)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(starts), list(range(10, 10 + 400 * 5, 5)))
+
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        patterns = ['country', 'in', ['China', 'France']]
+        serial = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                          chunk_size=100, patterns=patterns).pseudonym()
+        fast = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file, chunk_size=100,
+                                        patterns=patterns, workers=3, counter_mode='fast').pseudonym()
+        pseudonyms = pl.concat([df_mapping[:, 0] for df_mapping in fast[1]])
+        self.assertEqual(pseudonyms.len(), pl.concat([df_mapping[:, 0] for df_mapping in serial[1]]).len())
+        self.assertEqual(pseudonyms.n_unique(), pseudonyms.len())
+        self.assertGreater(pseudonyms.max(), pseudonyms.len())
+
+        # without patterns every block is filled and the numbering matches the serial processing
+        serial = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file,
+                                          chunk_size=100).pseudonym()
+        fast = pseudPy.Pseudonymization('counter', ['name', 'country'], input_file=input_file, chunk_size=100,
+                                        workers=3, counter_mode='fast').pseudonym()
+        pl.testing.assert_frame_equal(serial[0], fast[0])
+        with self.assertRaises(ValueError):
+            pseudPy.Pseudonymization('counter', 'name', counter_mode='gaps')
+
+    def test_batch_runner(self):
+        """Pseudonymize all files of a glob pattern on a process pool, mirror the folders and write the manifest."""
+        batch_folder = f'{test_files_folder}/batch'
+        for folder in ['a', 'b']:
+            os.makedirs(f'{batch_folder}/input/{folder}', exist_ok=True)
+            shutil.copy(f'{test_files_folder}/plain_user_data.csv', f'{batch_folder}/input/{folder}/users.csv')
+        config = {'input_file': f'{batch_folder}/input/*/*.csv', 'output': f'{batch_folder}/output'}
+        self.assertTrue(pseudPy.BatchRunner.is_batch(config['input_file']))
+
+        manifest = pseudPy.BatchRunner(hash_names_job, config, processes=2).run()
+
+        self.assertEqual(manifest['status'].to_list(), ['ok', 'ok'])
+        self.assertEqual(manifest['rows'].to_list(), [1000, 1000])
+        for folder in ['a', 'b']:
+            pl.testing.assert_frame_equal(
+                pl.read_csv(f'{batch_folder}/output/{folder}/users/output.csv'),
+                pl.read_csv(f'{test_files_folder}/expected_output_hash_plain_user_data.csv'))
+        pl.testing.assert_frame_equal(manifest, pl.read_csv(f'{batch_folder}/output/manifest.csv'),
+                                      check_dtype=False)
+        shutil.rmtree(batch_folder)
+
+    def test_shared_instance_in_threads(self):
+        """One configured instance pseudonymizes the inputs of concurrent calls, neither its configuration nor the
+        global random generator are changed."""
+        df = pl.read_csv(f'{test_files_folder}/plain_user_data.csv')
+        chunks = [df.slice(i, 5) for i in range(0, df.height, 5)]
+        map_columns = ['name', 'country']
+        pseudo = pseudPy.Pseudonymization('random4', map_columns, seed=42)
+        expected = [pseudo.pseudonym(df=chunk) for chunk in chunks]
+        state = random.getstate()
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda chunk: pseudo.pseudonym(df=chunk), chunks))
+        self.assertEqual(random.getstate(), state)
+        for (df_map_all, mappings), (expected_df, expected_mappings) in zip(results, expected):
+            assert_frame_equal(df_map_all, expected_df)
+            for df_mapping, expected_mapping in zip(mappings, expected_mappings):
+                assert_frame_equal(df_mapping, expected_mapping)
+        self.assertIs(pseudo.map_columns, map_columns)
+        self.assertEqual(map_columns, ['name', 'country'])
+        self.assertIsNone(pseudo.df)
+
+        pos_type = ['Emails']
+        pseudo = pseudPy.Pseudonymization('counter', pos_type=pos_type, terms=['Acme Corporation'])
+        texts = [f'Contract {i} with Acme Corporation' for i in range(8)]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda text: pseudo.nlp_pseudonym(text=text)[-1], texts))
+        self.assertEqual(results, [f'Contract {i} with 0' for i in range(8)])
+        self.assertEqual(pos_type, ['Emails'])
+        self.assertIsNone(pseudo.text)
+
+    def test_script_jobs(self):
+        """Jobs of a JSON lines file run in one process, errors are recorded and the following jobs still run."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        jobs_file = f'{test_files_folder}/jobs.jsonl'
+        specs = [{'job': 'pseudonym', 'config': 'config__pseudonym_structured.yaml', 'input_file': input_file,
+                  'output': f'{test_files_folder}/job_{method}', 'map_method': method, 'encrypt_map': False}
+                 for method in ['hash', 'counter']]
+        specs.append({'job': 'pseudonym', 'config': 'config__pseudonym_structured.yaml',
+                      'input_file': f'{test_files_folder}/missing.csv', 'output': test_files_folder})
+        specs.append({'job': 'check_k_anonymity', 'input_file': input_file, 'k': 1})
+        with open(jobs_file, 'w') as file:
+            file.write(''.join(json.dumps(spec) + '\n' for spec in specs))
+
+        # the jobs are only validated, the output folders are created when the jobs run
+        jobs = script_jobs.read_jobs(jobs_file)
+        batch_config = pseudPy.BatchRunner(None, {'output': f'{test_files_folder}/job_batch'}).file_config(
+            test_files_folder, input_file)
+        for output in [f'{test_files_folder}/job_hash', f'{test_files_folder}/job_counter', batch_config['output']]:
+            self.assertFalse(os.path.exists(output))
+        manifest = script_jobs.run_jobs(jobs)
+        self.assertEqual(manifest['job'].to_list(), ['pseudonym', 'pseudonym', 'pseudonym', 'check_k_anonymity'])
+        self.assertEqual(manifest['status'].to_list(), ['ok', 'ok', 'error', 'ok'])
+        self.assertEqual(manifest['rows'].to_list(), [1000, 1000, None, 1000])
+        expected = pseudPy.Pseudonymization('hash', 'name', input_file=input_file).pseudonym()
+        assert_frame_equal(pl.read_csv(f'{test_files_folder}/job_hash/output.csv'), expected[0])
+        self.assertEqual(pl.read_csv(f'{test_files_folder}/job_counter/output.csv')['Index_name'].to_list(),
+                         list(range(1000)))
+        os.remove(jobs_file)
+        for method in ['hash', 'counter']:
+            shutil.rmtree(f'{test_files_folder}/job_{method}')
+
     def test_pseudonym_with_valid_data_and_counter_method_10000_rows_speed(self):
         """Test pseudonymization on the higher-performance parameters:
             10000 rows, encrypt the mapping."""
@@ -368,6 +925,13 @@ class TestUnstructuredPseudonymization(unittest.TestCase):
                                           patterns=patterns, output=test_files_folder)
         pseudo.nlp_pseudonym()
 
+        # the Matcher of the patterns is built once and reused for every text
+        helpers = pseudPy.Helpers(nlp=pseudPy.Helpers.load_nlp(), patterns=patterns)
+        spans = helpers.entity_spans('ABC Corporation hired ABC.')
+        self.assertIs(helpers.resolve_patterns(), helpers.resolve_patterns())
+        self.assertEqual(helpers.entity_spans('ABC Corporation hired ABC.'), spans)
+        self.assertIn(['Others', 'ABC Corporation', 0, 15], spans)
+
         expected_header = ['Index_Organizations', 'Organizations']
 
         actual_result = pl.read_csv(f'{test_files_folder}/mapping_output_Organizations.csv')
@@ -440,6 +1004,180 @@ class TestUnstructuredPseudonymization(unittest.TestCase):
             os.remove(f'{test_files_folder}/secure_key_Locations.txt')
             os.remove(f'{test_files_folder}/secure_key_Organizations.txt')
 
+    def test_nlp_pseudonym_term_list(self):
+        """Custom terms are matched by the cached PhraseMatcher, overlapping terms keep the longest match."""
+        text = 'Orders from Acme Foods GmbH and Nordic Labs, again Acme Foods GmbH and Stone River.'
+        terms = ['Acme Foods', 'Acme Foods GmbH', 'Nordic Labs', 'Unused Term'] + [f'Filler {i}' for i in range(5000)]
+        nlp = pseudPy.Helpers.load_nlp()
+
+        map_dict = pseudPy.Helpers(text=text, nlp=nlp, terms=terms).entity_mapping()
+        self.assertEqual(map_dict, {'Others': ['Acme Foods GmbH', 'Nordic Labs']})
+        self.assertIs(pseudPy.TermMatcher.load(nlp, terms), pseudPy.TermMatcher.load(nlp, list(terms)))
+        # the known list is looked up by its identity, it is neither read nor hashed again
+        with mock.patch.object(pseudPy.TermMatcher, 'read_terms', side_effect=AssertionError):
+            self.assertEqual(pseudPy.Helpers(text=text, nlp=nlp, terms=terms).entity_mapping(), map_dict)
+
+        pseudPy.Pseudonymization('counter', text=text, terms=terms, output=test_files_folder).nlp_pseudonym()
+        with open(f'{test_files_folder}/text.txt', 'r') as file:
+            output_text = file.read()
+        self.assertEqual(output_text.strip(), 'Orders from 0 and 1, again 0 and Stone River.')
+        for file in ['text.txt', 'mapping_output_Others.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_nlp_pseudonym_output_sinks(self):
+        """Every mapping and the text are written once at the end of the job, to memory, an archive or stdout."""
+        with open(f'{test_files_folder}/free_text.txt', 'r') as file:
+            text = file.read()
+        stats = pseudPy.PipelineStats()
+        sink = pseudPy.MemorySink()
+        output = pseudPy.Pseudonymization('counter', text=text, all_ne=True, sink=sink, stats=stats).nlp_pseudonym()
+
+        summary = stats.summary()
+        mapping_files = [name for name in sink.contents if name.startswith('mapping_output_')]
+        self.assertEqual(summary.filter(pl.col('stage') == 'write_csv')['calls'][0], len(mapping_files))
+        self.assertEqual(summary.filter(pl.col('stage') == 'write_text')['calls'][0], 1)
+        self.assertEqual(sink.getvalue('text.txt').decode('utf-8').strip(),
+                         pseudPy.Pseudonymization('counter', text=text, all_ne=True).nlp_pseudonym()[-1].strip())
+        self.assertIsNone(output)
+
+        archive = f'{test_files_folder}/output.tar.gz'
+        pseudPy.Pseudonymization('counter', 'name', input_file=f'{test_files_folder}/plain_user_data.csv',
+                                 sink=archive).pseudonym()
+        with tarfile.open(archive) as tar:
+            self.assertEqual(sorted(tar.getnames()), ['mapping_output_name.csv', 'output.csv'])
+            assert_frame_equal(pl.read_csv(tar.extractfile('output.csv').read()),
+                               pl.read_csv(f'{test_files_folder}/expected_output_plain_user_data.csv'))
+        os.remove(archive)
+
+        stream = io.BytesIO()
+        pseudPy.Pseudonymization('counter', text='Mail anna@example.com', pos_type='Emails',
+                                 sink=pseudPy.StdoutSink(stream)).nlp_pseudonym()
+        self.assertEqual(stream.getvalue().decode('utf-8'),
+                         '==> mapping_output_Emails.csv <==\nIndex_Emails,Emails\n0,anna@example.com\n'
+                         '==> text.txt <==\nMail 0\n')
+
+    def test_entity_cache(self):
+        """Repeated paragraphs are served from the entity cache, the disk tier survives a new cache instance."""
+        with open(f'{test_files_folder}/free_text.txt', 'r') as file:
+            paragraph = file.read().strip()
+        text = f'{paragraph}\n\nMail anna@example.com\n\n{paragraph}\n\nMail anna@example.com'
+        nlp = pseudPy.Helpers.load_nlp()
+        cache_folder = f'{test_files_folder}/entity_cache'
+        shutil.rmtree(cache_folder, ignore_errors=True)
+        expected = pseudPy.Helpers(text=text, nlp=nlp, pos_type=['Names', 'Emails']).entity_mapping()
+
+        cache = pseudPy.EntityCache(max_size=10, path=cache_folder)
+        helpers = pseudPy.Helpers(text=text, nlp=nlp, pos_type=['Names', 'Emails'], entity_cache=cache)
+        self.assertEqual(helpers.entity_mapping(), expected)
+        # every paragraph is parsed once, the second copy of the document is served from memory
+        self.assertGreater(cache.misses, 0)
+        self.assertEqual(cache.hits, cache.misses)
+        misses = cache.misses
+        for pos, entity, start, end in helpers.cached_entity_spans():
+            self.assertEqual(text[start:end], entity)
+
+        cache = pseudPy.EntityCache(max_size=10, path=cache_folder)
+        helpers = pseudPy.Helpers(text=text, nlp=nlp, pos_type=['Names', 'Emails'], entity_cache=cache)
+        self.assertEqual(helpers.entity_mapping(), expected)
+        self.assertEqual(cache.summary()['disk_hits'], misses)
+        self.assertEqual(cache.summary()['misses'], 0)
+        shutil.rmtree(cache_folder)
+
+        # the terms are hashed once for the configuration key and the matcher, not once per paragraph
+        terms = ['Anna', 'example']
+        cache = pseudPy.EntityCache(max_size=10)
+        with mock.patch.object(pseudPy.TermMatcher, 'digest', wraps=pseudPy.TermMatcher.digest) as digest:
+            pseudPy.Helpers(text=text, nlp=nlp, terms=terms, entity_cache=cache).entity_mapping()
+        self.assertEqual(digest.call_count, 1)
+        self.assertGreater(cache.misses, 1)
+
+    def test_nlp_pseudonym_regex_only(self):
+        """Emails and phone numbers are found by the combined regex, without loading the spaCy model."""
+        text = ('Login of john.doe@example.com from +4915112345678.\n'
+                'Contact anna12345678@firma.de or 030123456789, again john.doe@example.com.\n')
+        stats = pseudPy.PipelineStats()
+        pseudPy.Pseudonymization('counter', text=text, pos_type=['Emails', 'Phone-Numbers'], output=test_files_folder,
+                                 stats=stats).nlp_pseudonym()
+
+        self.assertNotIn('load_model', [record['stage'] for record in stats.records])
+        map_dict = pseudPy.Helpers(text=text, pos_type=['Emails', 'Phone-Numbers']).entity_mapping()
+        self.assertEqual(map_dict, {'Emails': ['john.doe@example.com', 'anna12345678@firma.de', 'john.doe@example.com'],
+                                    'Phone-Numbers': ['+4915112345678', '30123456789']})
+        with open(f'{test_files_folder}/text.txt', 'r') as file:
+            output_text = file.read()
+        for value in ['john.doe@example.com', 'anna12345678@firma.de', '4915112345678', '30123456789']:
+            self.assertNotIn(value, output_text)
+        # with spaCy for the names, emails and phone numbers are found like without spaCy
+        text = 'Contact 4155551234@example.com or +4915112345678.'
+        spans = pseudPy.Helpers(nlp=pseudPy.Helpers.load_nlp(), pos_type=['Names', 'Emails', 'Phone-Numbers']) \
+            .entity_spans(text)
+        self.assertEqual([span for span in spans if span[0] != 'Names'],
+                         [['Emails', '4155551234@example.com', 8, 30], ['Phone-Numbers', '+4915112345678', 34, 48]])
+        for file in ['text.txt', 'mapping_output_Emails.csv', 'mapping_output_Phone-Numbers.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_service_micro_batching(self):
+        """Concurrent requests of the service are pseudonymized in shared batches, the mappings are appended."""
+        config = {'map_method': 'counter', 'map_columns': ['name'], 'pos_type': ['Emails', 'Phone-Numbers'],
+                  'output': test_files_folder, 'max_delay_ms': 20}
+        pseudonymizer = service.Service(config)
+        server = service.make_server(pseudonymizer, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            result = load_test.run('records', requests=40, concurrency=8, records_per_request=5, url=url)
+            self.assertEqual(result['errors'], 0)
+            self.assertEqual(result['server']['records']['requests'], 40)
+            self.assertLessEqual(result['server']['records']['batches'], 40)
+
+            conn = load_test.connection(url)
+            status, body = load_test.request(conn, 'POST', '/records',
+                                             {'records': [{'name': 'Anna', 'age': 31}, {'name': 'Ben', 'age': 42}]})
+            self.assertEqual(status, 200)
+            self.assertEqual([record['age'] for record in body['records']], [31, 42])
+            self.assertEqual(body['records'][0]['name'] + 1, body['records'][1]['name'])
+            status, body = load_test.request(conn, 'POST', '/text',
+                                             {'texts': ['Mail anna@example.com', 'Call +4915112345678 now']})
+            self.assertEqual(status, 200)
+            self.assertNotIn('anna@example.com', body['texts'][0])
+            self.assertNotIn('4915112345678', body['texts'][1])
+            self.assertEqual(load_test.request(conn, 'POST', '/records', {'records': 'Anna'})[0], 400)
+            conn.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            pseudonymizer.close()
+
+        # every record of every batch is in the mapping, with unique counters
+        df_mapping = pl.read_csv(f'{test_files_folder}/mapping_output_name.csv')
+        self.assertEqual(df_mapping.height, 40 * 5 + 2)
+        self.assertTrue(df_mapping['Index_name'].is_unique().all())
+        for file in ['mapping_output_name.csv', 'mapping_output_Emails.csv', 'mapping_output_Phone-Numbers.csv']:
+            os.remove(f'{test_files_folder}/{file}')
+
+    def test_async_pseudonymization(self):
+        """Concurrent awaits join the same batches and match the pseudonyms of a file job on the executor."""
+        input_file = f'{test_files_folder}/plain_user_data.csv'
+        records = pl.read_csv(input_file).to_dicts()
+
+        async def run():
+            async with await pseudPy.AsyncPseudonymization.create('hash', 'name', pos_type=['Emails'],
+                                                                  max_delay=0.05) as pseudonymizer:
+                chunks = await asyncio.gather(*[pseudonymizer.pseudonymize_records(records[i:i + 2])
+                                                for i in range(0, len(records), 2)])
+                texts = await pseudonymizer.pseudonymize_texts(['Mail anna@example.com', 'No entities'])
+                df, mappings = await pseudonymizer.pseudonymize_file(input_file)
+                return chunks, texts, df, pseudonymizer.summary()
+
+        chunks, texts, df, summary = asyncio.run(run())
+        pseudonymized = [record for chunk in chunks for record in chunk]
+        self.assertEqual([record['name'] for record in pseudonymized], df['Index_name'].to_list())
+        self.assertEqual([record['country'] for record in pseudonymized], df['country'].to_list())
+        self.assertLess(summary['records']['batches'], len(chunks))
+        self.assertNotIn('anna@example.com', texts[0])
+        self.assertEqual(texts[1], 'No entities')
+
     def test_nlp_pseudonym_work_report_counter_method(self):
         """Pseudonymize free text by using counter method."""
         map_method = 'counter'
@@ -599,6 +1337,9 @@ class TestInvalidStructuredData(unittest.TestCase):
 
         with self.assertRaises(AttributeError):
             pseudo.pseudonym()
+        # the secret key is written before the encryption fails
+        if os.path.exists(f'{test_files_folder}/secure_key_name.txt'):
+            os.remove(f'{test_files_folder}/secure_key_name.txt')
 
 
 class TestStructuredDataAggregation(unittest.TestCase):
@@ -704,6 +1445,61 @@ class TestStructuredDataAggregation(unittest.TestCase):
         # df['date_of_birth'].hist()
         # plt.show()
 
+    def test_k_anonymity_mondrian(self):
+        """Mondrian partitioning generalizes the quasi-identifiers to ranges, every class has at least k rows and
+        fewer rows are suppressed than by rounding to the depths."""
+        df = pl.read_csv(f"{test_files_folder}/MOCK_DATA_small.csv")
+        df = df.with_columns(pl.col('date_of_birth').str.slice(0, 4).cast(pl.Int64).alias('year'))
+        quasi_identifiers = ['salary', 'year', 'gender']
+        k = 5
+        k_anonymity = pseudPy.KAnonymity(df=df, k=k, quasi_identifiers=quasi_identifiers, output=test_files_folder)
+        grouped = k_anonymity.mondrian()
+
+        self.assertEqual(grouped.columns, df.columns)
+        self.assertEqual(grouped['name'].to_list(), df['name'].to_list())
+        self.assertGreaterEqual(grouped.group_by(quasi_identifiers).len()['len'].min(), k)
+        for value, generalized in zip(df['year'], grouped['year']):
+            low, high = (generalized.split('..') * 2)[:2]
+            self.assertTrue(int(low) <= value <= int(high))
+        metrics = k_anonymity.metrics
+        self.assertEqual(metrics['suppressed'], 0)
+        self.assertGreaterEqual(metrics['min_class_size'], k)
+        self.assertTrue(0 < metrics['ncp'] < 1)
+        assert_frame_equal(pl.read_csv(f'{test_files_folder}/k_anonym_output.csv', infer_schema_length=0), grouped)
+
+        depths = pseudPy.KAnonymity(df=df.select('salary', 'year').to_pandas(), k=k,
+                                    depths={'salary': 1, 'year': 1})
+        depths.k_anonymity()
+        self.assertGreater(depths.metrics['suppressed'], metrics['suppressed'])
+        # less than k rows cannot be k-anonymized
+        small = pseudPy.KAnonymity(df=df.head(k - 1), k=k, quasi_identifiers=quasi_identifiers)
+        self.assertEqual(small.mondrian().height, 0)
+        self.assertEqual(small.metrics['suppressed'], k - 1)
+        os.remove(f'{test_files_folder}/k_anonym_output.csv')
+
+        # the bounds of negative ranges stay readable
+        negative = pl.DataFrame({'balance': [-50, -40, -30, -20, -10, -5, -4, -3, -2, -1]})
+        grouped = pseudPy.KAnonymity(df=negative, k=5, quasi_identifiers=['balance']).mondrian()
+        self.assertEqual(grouped['balance'].to_list(), ['-50..-10'] * 5 + ['-5..-1'] * 5)
+
+    def test_k_anonymity_mondrian_dates(self):
+        """Dates are generalized to the interval min/max of their class, booleans to their distinct values."""
+        df = pl.read_csv(f"{test_files_folder}/MOCK_DATA_small.csv")
+        df = df.with_columns(pl.col('date_of_birth').str.to_date('%Y-%m-%d'),
+                             (pl.col('salary') > pl.col('salary').median()).alias('high_salary'))
+        quasi_identifiers = ['date_of_birth', 'high_salary']
+        k = 5
+        k_anonymity = pseudPy.KAnonymity(df=df, k=k, quasi_identifiers=quasi_identifiers)
+        grouped = k_anonymity.mondrian()
+
+        self.assertGreaterEqual(grouped.group_by(quasi_identifiers).len()['len'].min(), k)
+        self.assertEqual(k_anonymity.metrics['suppressed'], df.filter(pl.col('salary').is_null()).height)
+        for value, generalized in zip(grouped['name'], grouped['date_of_birth']):
+            low, high = (generalized.split('/') * 2)[:2]
+            date = df.filter(pl.col('name') == value)['date_of_birth'][0]
+            self.assertTrue(low <= date.isoformat() <= high)
+        self.assertTrue(set(','.join(grouped['high_salary']).split(',')) <= {'true', 'false'})
+
     def test_k_anon_more_depth(self):
         """k-anonymize data with k=3, plot the results"""
         df = pd.read_csv(f"{test_files_folder}/plain_user_data.csv")